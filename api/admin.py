@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import MyUser, Plan, Subscription, Invoice
+from .models import (MyUser, Plan, Subscription, Invoice, InvoiceReminder, WebhookEvent, ReconciliationCheckpoint,
+                     ArchivedInvoice, DailyRevenue)
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django_celery_beat.models import (
     PeriodicTask,
@@ -28,7 +29,39 @@ class MyUserAdmin(BaseUserAdmin):
     )
 
 
+class ArchivedInvoiceAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'amount', 'issue_date', 'paid_at', 'archived_at')
+    search_fields = ('id', 'razorpay_order_id')
+
+    # the archive is read only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class DailyRevenueAdmin(admin.ModelAdmin):
+    list_display = ('day', 'plan', 'invoiced', 'collected', 'outstanding', 'active_subscribers')
+    list_filter = ('plan',)
+
+    # maintained from the invoices and subscriptions, see rebuild_revenue_rollups
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 admin.site.register(MyUser, MyUserAdmin)
 admin.site.register(Plan)
 admin.site.register(Subscription)
 admin.site.register(Invoice)
+admin.site.register(InvoiceReminder)
+admin.site.register(WebhookEvent)
+admin.site.register(ReconciliationCheckpoint)
+admin.site.register(ArchivedInvoice, ArchivedInvoiceAdmin)
+admin.site.register(DailyRevenue, DailyRevenueAdmin)
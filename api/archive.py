@@ -0,0 +1,178 @@
+import csv
+import glob
+import gzip
+import os
+from datetime import datetime, time, timezone as dt_timezone
+
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import ArchivedInvoice, Invoice, InvoiceReminder
+
+ARCHIVE_TABLE = ArchivedInvoice._meta.db_table
+# columns copied from the invoice table, the archive adds archived_at
+ARCHIVE_COLUMNS = ['id', 'user_id', 'subscription_id', 'plan_id', 'amount', 'issue_date', 'due_date', 'status',
+                   'paid_at', 'billing_period_start', 'billing_period_end', 'razorpay_order_id',
+                   'razorpay_order_amount']
+
+
+def month_bound(month):
+    """Start of a month in UTC, the partitions are split on UTC months."""
+    return datetime.combine(month, time.min, tzinfo=dt_timezone.utc)
+
+
+def partition_name(month):
+    return f'{ARCHIVE_TABLE}_{month:%Y_%m}'
+
+
+def archive_cutoff(today=None):
+    """First month whose paid invoices stay in the invoice table."""
+    today = today or timezone.now().date()
+    return today.replace(day=1) - relativedelta(months=settings.INVOICE_ARCHIVE_AFTER_MONTHS)
+
+
+def retention_cutoff(today=None):
+    """First month whose archive partition is kept, older ones are exported to files."""
+    today = today or timezone.now().date()
+    return today.replace(day=1) - relativedelta(months=settings.INVOICE_ARCHIVE_RETENTION_MONTHS)
+
+
+def archived_cycles(subscription_ids, since, until):
+    """(subscription id, billing period start) of the archived cycles starting between `since` and `until`."""
+    return set(ArchivedInvoice.objects.filter(subscription_id__in=subscription_ids,
+                                              billing_period_start__range=(since, until))
+               .values_list('subscription_id', 'billing_period_start'))
+
+
+def archive_partitions():
+    """{first day of the month: partition name} of the partitions attached to the archive."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = %s",
+            [ARCHIVE_TABLE],
+        )
+        names = [name for name, in cursor.fetchall()]
+    return {datetime.strptime(name[len(ARCHIVE_TABLE) + 1:], '%Y_%m').date(): name for name in names}
+
+
+def create_archive_partitions(months_ahead=None, today=None):
+    """
+    Create the archive partition of every month from the oldest paid invoice due for
+    archival up to `months_ahead` months after the cutoff, so the next runs find their
+    partitions ready. Returns the names of the created partitions.
+    """
+    months_ahead = settings.INVOICE_ARCHIVE_PARTITIONS_AHEAD if months_ahead is None else months_ahead
+    cutoff = archive_cutoff(today)
+    oldest = (Invoice.objects.filter(status='paid', issue_date__lt=month_bound(cutoff))
+              .aggregate(oldest=Min('issue_date'))['oldest'])
+    month = oldest.astimezone(dt_timezone.utc).date().replace(day=1) if oldest else cutoff
+    last = cutoff + relativedelta(months=months_ahead)
+
+    existing = archive_partitions()
+    created = []
+    with connection.cursor() as cursor:
+        while month <= last:
+            if month not in existing:
+                cursor.execute(
+                    f'CREATE TABLE IF NOT EXISTS "{partition_name(month)}" PARTITION OF "{ARCHIVE_TABLE}" '
+                    f'FOR VALUES FROM (%s) TO (%s)',
+                    [month_bound(month), month_bound(month + relativedelta(months=1))],
+                )
+                created.append(partition_name(month))
+            month += relativedelta(months=1)
+    return created
+
+
+def archive_invoices(batch_size=None, today=None):
+    """
+    Move the paid invoices issued before the archive cutoff to the archive, oldest first,
+    `batch_size` at a time. Every batch is moved by one statement that deletes the invoices
+    with their reminders and inserts them in the archive. Unpaid and overdue invoices stay.
+    Returns the number of archived invoices.
+    """
+    batch_size = batch_size or settings.INVOICE_BATCH_SIZE
+    cutoff = month_bound(archive_cutoff(today))
+    create_archive_partitions(today=today)
+
+    columns = ', '.join(ARCHIVE_COLUMNS)
+    move = f"""
+        WITH batch AS (
+            SELECT id FROM "{Invoice._meta.db_table}" WHERE status = 'paid' AND issue_date < %s
+            ORDER BY issue_date LIMIT %s FOR UPDATE SKIP LOCKED
+        ), reminders AS (
+            DELETE FROM "{InvoiceReminder._meta.db_table}" WHERE invoice_id IN (SELECT id FROM batch)
+        ), moved AS (
+            DELETE FROM "{Invoice._meta.db_table}" WHERE id IN (SELECT id FROM batch) RETURNING {columns}
+        )
+        INSERT INTO "{ARCHIVE_TABLE}" ({columns}, archived_at) SELECT {columns}, %s FROM moved
+    """
+    archived = 0
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(move, [cutoff, batch_size, timezone.now()])
+            moved = cursor.rowcount
+        archived += moved
+        if moved < batch_size:
+            return archived
+
+
+def detach_archive_partitions(directory=None, today=None):
+    """
+    Export the archive partitions older than INVOICE_ARCHIVE_RETENTION_MONTHS to gzipped
+    CSV files in `directory`, then detach and drop them. The partition only accepts reads
+    while it is exported. Returns the paths of the exported files.
+    """
+    directory = directory or settings.INVOICE_ARCHIVE_DIR
+    oldest_kept = retention_cutoff(today)
+    os.makedirs(directory, exist_ok=True)
+
+    exported = []
+    for month, name in sorted(archive_partitions().items()):
+        if month >= oldest_kept:
+            continue
+        path = os.path.join(directory, f'{name}.{timezone.now():%Y%m%d%H%M%S}.csv.gz')
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE "{name}" IN SHARE MODE')
+            with gzip.open(f'{path}.tmp', 'wb') as f:
+                cursor.copy_expert(f'COPY "{name}" TO STDOUT WITH (FORMAT csv, HEADER)', f)
+            cursor.execute(f'ALTER TABLE "{ARCHIVE_TABLE}" DETACH PARTITION "{name}"')
+            cursor.execute(f'DROP TABLE "{name}"')
+            # the file only gets its final name once the partition is gone
+            transaction.on_commit(lambda tmp=f'{path}.tmp', path=path: os.replace(tmp, path))
+        exported.append(path)
+    return exported
+
+
+def read_archive_file(path):
+    """Yield the invoices of an exported partition as unsaved ArchivedInvoice instances."""
+    fields = ArchivedInvoice._meta.concrete_fields
+    with gzip.open(path, 'rt', newline='') as f:
+        for row in csv.DictReader(f):
+            # COPY writes NULL as an empty value
+            yield ArchivedInvoice(**{
+                field.attname: None if row[field.column] == '' else field.to_python(row[field.column])
+                for field in fields
+            })
+
+
+def find_archived_invoice(invoice_id, directory=None):
+    """
+    Read only lookup of an archived invoice, in the archive partitions first and then in
+    the exported files. Searching the files reads them all, it is meant for occasional
+    lookups. Returns an ArchivedInvoice or None.
+    """
+    invoice = ArchivedInvoice.objects.filter(id=invoice_id).first()
+    if invoice is not None:
+        return invoice
+    directory = directory or settings.INVOICE_ARCHIVE_DIR
+    for path in sorted(glob.glob(os.path.join(directory, f'{ARCHIVE_TABLE}_*.csv.gz'))):
+        for invoice in read_archive_file(path):
+            if str(invoice.id) == str(invoice_id):
+                return invoice
+    return None
@@ -0,0 +1,132 @@
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+class UserCache:
+    """
+    Cache of authenticated users by id with a TTL of AUTH_USER_CACHE_TIMEOUT seconds.
+    Users are kept in a dict in this process and, with AUTH_USER_SHARED_CACHE, also in
+    the shared Django cache so the other processes can skip the query as well.
+
+    With the shared cache every entry carries the version of its user, a key in the shared
+    cache that changes whenever the user is invalidated. A hit with an older version is a
+    miss, so an invalidation reaches every process at once. Without the shared cache the
+    other processes only see the change once their local entry expires.
+    """
+    max_size = 10000
+
+    def __init__(self):
+        self.local = OrderedDict()
+        self.lock = threading.Lock()
+
+    def cache_key(self, user_id):
+        return f'api:auth-user:{user_id}'
+
+    def version_key(self, user_id):
+        return f'api:auth-user-version:{user_id}'
+
+    def version(self, user_id):
+        """Current version of the user, read before loading it so a concurrent invalidation wins."""
+        if not settings.AUTH_USER_SHARED_CACHE:
+            return None
+        return cache.get(self.version_key(user_id))
+
+    def get(self, user_id):
+        if settings.AUTH_USER_CACHE_TIMEOUT <= 0:
+            return None
+        key = str(user_id)
+        shared = {}
+        if settings.AUTH_USER_SHARED_CACHE:
+            # the version and the shared entry in one round trip
+            shared = cache.get_many([self.version_key(key), self.cache_key(key)])
+        version = shared.get(self.version_key(key))
+        with self.lock:
+            entry = self.local.get(key)
+            if entry is not None and entry[0] > time.monotonic() and entry[1] == version:
+                self.local.move_to_end(key)
+                # a copy, so changes made to request.user never leak into other requests
+                return copy.copy(entry[2])
+        entry = shared.get(self.cache_key(key))
+        if entry is not None and entry[0] == version:
+            self.set_local(key, version, entry[1])
+            return copy.copy(entry[1])
+        return None
+
+    def set(self, user_id, user, version=None):
+        if settings.AUTH_USER_CACHE_TIMEOUT <= 0:
+            return
+        key = str(user_id)
+        self.set_local(key, version, copy.copy(user))
+        if settings.AUTH_USER_SHARED_CACHE:
+            cache.set(self.cache_key(key), (version, user), settings.AUTH_USER_CACHE_TIMEOUT)
+
+    def set_local(self, key, version, user):
+        with self.lock:
+            self.local[key] = (time.monotonic() + settings.AUTH_USER_CACHE_TIMEOUT, version, user)
+            self.local.move_to_end(key)
+            while len(self.local) > self.max_size:
+                self.local.popitem(last=False)
+
+    def delete(self, user_id):
+        key = str(user_id)
+        with self.lock:
+            self.local.pop(key, None)
+        if settings.AUTH_USER_SHARED_CACHE:
+            # outdates the entries of every process
+            cache.set(self.version_key(key), uuid.uuid4().hex, None)
+            cache.delete(self.cache_key(key))
+
+    def clear(self):
+        with self.lock:
+            self.local.clear()
+
+
+user_cache = UserCache()
+
+
+def invalidate_cached_user(user):
+    user_id = getattr(user, api_settings.USER_ID_FIELD)
+    user_cache.delete(user_id)
+    # again after the commit, a request during the transaction could have cached the old row
+    transaction.on_commit(lambda: user_cache.delete(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that reads the user from `user_cache` instead of the database.
+    The cache is cleared when a user is saved or deleted (see api/signals.py), see
+    UserCache for when the other processes see the change.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = user_cache.get(user_id)
+        if user is None:
+            version = user_cache.version(user_id)
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user, version)
+            return user
+
+        # the checks of JWTAuthentication.get_user, on the cached user
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
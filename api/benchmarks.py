@@ -0,0 +1,84 @@
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext, redirect_stdout
+
+from django.db import connection, transaction
+
+
+class QueryCounter:
+    """Database execute wrapper that counts the queries, works without DEBUG."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def rolled_back():
+    """Run the block in a transaction that is always rolled back."""
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def measure(func, setup=None, rollback=True):
+    """
+    Call `func` and return its wall time, query count and peak Python memory.
+
+    `func` runs twice, tracemalloc is only enabled on the second run so it does
+    not slow down the timed one. With `rollback` the database changes of each run
+    are rolled back so both runs see the same data. `setup` is called before each
+    run, inside the same transaction but outside the measurement, and its return
+    value is passed to `func`. Output printed by `func` is discarded.
+    """
+    def run():
+        args = setup() if setup else ()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            started = time.perf_counter()
+            func(*args)
+            return time.perf_counter() - started, counter.count
+
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        with rolled_back() if rollback else nullcontext():
+            seconds, queries = run()
+
+        tracemalloc.start()
+        try:
+            with rolled_back() if rollback else nullcontext():
+                run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return {'seconds': round(seconds, 4), 'queries': queries, 'peak_memory_kb': round(peak / 1024, 1)}
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_results(results, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def compare_results(old, new):
+    """Yield (scale, target, metric, old value, new value) for every measurement found in both results."""
+    for scale, targets in new['results'].items():
+        for target, metrics in targets.items():
+            previous = old['results'].get(scale, {}).get(target)
+            if previous is None:
+                continue
+            for metric, value in metrics.items():
+                if metric in previous:
+                    yield scale, target, metric, previous[metric], value
@@ -0,0 +1,193 @@
+from datetime import datetime, time, timedelta
+from datetime import timezone as dt_timezone
+from itertools import islice
+from uuid import UUID
+
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .archive import archived_cycles, retention_cutoff
+from .models import Invoice, Subscription
+from .rollups import record_invoices_created
+
+
+def chunked(iterable, size):
+    """Yield lists of at most `size` items from `iterable`."""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def next_cycle_start(start_date, cycle_start, duration):
+    """
+    Return the start of the billing cycle that follows the one starting on `cycle_start`.
+    Cycles are always counted from the subscription start so a subscription started
+    on Jan 31 is billed on Feb 28, Mar 31, Apr 30 and so on.
+    """
+    months_since_start = (cycle_start.year - start_date.year) * 12 + (cycle_start.month - start_date.month)
+    return start_date + relativedelta(months=+(months_since_start + duration))
+
+
+def cycle_starts(start_date, duration, since, until):
+    """Return every billing cycle start of a subscription between `since` and `until` (inclusive)."""
+    months_until_since = (since.year - start_date.year) * 12 + (since.month - start_date.month)
+    cycle = max(months_until_since // duration - 1, 0)
+    starts = []
+    while (cycle_start := start_date + relativedelta(months=+cycle * duration)) <= until:
+        if cycle_start >= since:
+            starts.append(cycle_start)
+        cycle += 1
+    return starts
+
+
+def shard_range(shard, shards):
+    """
+    Split the UUID primary key space into `shards` equal ranges and return the
+    (lower, upper) bounds of range number `shard`. The last range has no upper bound.
+    """
+    if not 0 <= shard < shards:
+        raise ValueError(f"shard must be between 0 and {shards - 1}")
+    size = 2 ** 128 // shards
+    lower = UUID(int=shard * size)
+    upper = UUID(int=(shard + 1) * size) if shard < shards - 1 else None
+    return lower, upper
+
+
+def filter_shard(queryset, shard, shards):
+    """Restrict `queryset` to the rows whose primary key falls in the given shard."""
+    lower, upper = shard_range(shard, shards)
+    queryset = queryset.filter(pk__gte=lower)
+    if upper is not None:
+        queryset = queryset.filter(pk__lt=upper)
+    return queryset
+
+
+def as_datetime(value):
+    """Convert a billing date to the aware datetime stored in Subscription.end_date."""
+    return timezone.make_aware(datetime.combine(value, time.min), timezone.get_default_timezone())
+
+
+def generate_invoices(subscriptions, today, batch_size=None):
+    """
+    Invoice the next billing cycle of every subscription in `subscriptions` that
+    is due on or before `today`.
+
+    Only the due subscriptions are read (an index range scan on next_billing_date),
+    in primary key order, `batch_size` rows at a time with their plan preloaded.
+    Every batch costs one bulk insert that skips the cycles already invoiced and
+    one bulk update of `end_date` and `next_billing_date`.
+    """
+    batch_size = batch_size or settings.INVOICE_BATCH_SIZE
+    subscriptions = subscriptions.filter(next_billing_date__lte=today).select_related('plan').order_by('pk')
+
+    totals = {'scanned': 0, 'created': 0}
+    last_pk = None
+    while True:
+        page = subscriptions if last_pk is None else subscriptions.filter(pk__gt=last_pk)
+        batch = list(page[:batch_size])
+        if not batch:
+            break
+        totals['scanned'] += len(batch)
+        totals['created'] += _bill_batch(batch, batch_size)
+        last_pk = batch[-1].pk
+    return totals
+
+
+def _bill_batch(subscriptions, batch_size):
+    now = timezone.now()
+    invoices = []
+    for sub in subscriptions:
+        cycle_start = sub.next_billing_date
+        cycle_end = next_cycle_start(sub.start_date.date(), cycle_start, sub.plan.duration)
+        invoices.append(_build_invoice(sub, cycle_start, cycle_end, now))
+        sub.end_date = as_datetime(cycle_end)
+        sub.next_billing_date = cycle_end
+
+    return _save_batch(invoices, subscriptions, batch_size)
+
+
+def generate_missed_invoices(subscriptions, since, until, batch_size=None):
+    """
+    Invoice every billing cycle of `subscriptions` that starts between `since` and
+    `until` (inclusive) and has no invoice yet.
+
+    Unlike generate_invoices this works out the cycles from the subscription start
+    date instead of trusting next_billing_date, so it can be used to recover from
+    missed billing runs. Running it again for the same range creates nothing.
+
+    Cycles whose invoice was moved to the archive are skipped as well. The months older
+    than the archive retention were exported to files and can not be checked, `since`
+    is moved forward to the oldest kept month.
+    """
+    batch_size = batch_size or settings.INVOICE_BATCH_SIZE
+    since = max(since, retention_cutoff())
+    # subscriptions starting after `until` (start_date is stored in UTC) have nothing to bill
+    cutoff = datetime.combine(until + timedelta(days=1), time.min, tzinfo=dt_timezone.utc)
+    subscriptions = subscriptions.filter(start_date__lt=cutoff).select_related('plan').order_by('pk')
+
+    totals = {'scanned': 0, 'created': 0}
+    last_pk = None
+    while True:
+        page = subscriptions if last_pk is None else subscriptions.filter(pk__gt=last_pk)
+        batch = list(page[:batch_size])
+        if not batch:
+            break
+        totals['scanned'] += len(batch)
+        totals['created'] += _backfill_batch(batch, since, until, batch_size)
+        last_pk = batch[-1].pk
+    return totals
+
+
+def _backfill_batch(subscriptions, since, until, batch_size):
+    now = timezone.now()
+    # the unique constraint only sees the invoice table, paid cycles may be archived
+    archived = archived_cycles([sub.pk for sub in subscriptions], since, until)
+    invoices = []
+    changed = []
+    for sub in subscriptions:
+        start_date = sub.start_date.date()
+        cycle_end = None
+        for cycle_start in cycle_starts(start_date, sub.plan.duration, since, until):
+            cycle_end = next_cycle_start(start_date, cycle_start, sub.plan.duration)
+            if (sub.pk, cycle_start) not in archived:
+                invoices.append(_build_invoice(sub, cycle_start, cycle_end, now))
+        # only move the subscription forward, never back
+        if cycle_end is not None and (sub.next_billing_date is None or cycle_end > sub.next_billing_date):
+            sub.end_date = as_datetime(cycle_end)
+            sub.next_billing_date = cycle_end
+            changed.append(sub)
+
+    return _save_batch(invoices, changed, batch_size)
+
+
+def _build_invoice(sub, cycle_start, cycle_end, now):
+    return Invoice(
+        user_id=sub.user_id,
+        subscription=sub,
+        plan=sub.plan,
+        amount=sub.plan.price,
+        issue_date=now,
+        due_date=now + timedelta(days=5),
+        status='unpaid',
+        billing_period_start=cycle_start,
+        billing_period_end=cycle_end,
+    )
+
+
+def _save_batch(invoices, subscriptions, batch_size):
+    """
+    Insert `invoices`, add them to the revenue rollups and save the billing dates of
+    `subscriptions`, return the number of invoices created. Cycles that already have an invoice are skipped
+    by the unique_invoice_billing_cycle constraint, so concurrent runs are safe.
+    """
+    with transaction.atomic():
+        Invoice.objects.bulk_create(invoices, batch_size=batch_size, ignore_conflicts=True)
+        Subscription.objects.bulk_update(subscriptions, ['end_date', 'next_billing_date'], batch_size=batch_size)
+        if not invoices:
+            return 0
+        # the cycles skipped by the constraint were not inserted
+        created = set(Invoice.objects.filter(id__in=[invoice.id for invoice in invoices]).values_list('id', flat=True))
+        record_invoices_created([invoice for invoice in invoices if invoice.id in created])
+        return len(created)
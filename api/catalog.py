@@ -0,0 +1,45 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Max
+from django.utils.http import quote_etag
+
+from .models import Plan
+from .serializers import plan_fast_serializer
+
+PLAN_CATALOG_CACHE_KEY = 'api:plan-catalog'
+
+
+def get_plan_catalog():
+    """
+    Return the active plans as {"content": JSON bytes, "etag": ..., "last_modified": timestamp},
+    from the cache when possible so an unchanged catalog costs no database access.
+    """
+    catalog = cache.get(PLAN_CATALOG_CACHE_KEY)
+    if catalog is None:
+        catalog = build_plan_catalog()
+        cache.set(PLAN_CATALOG_CACHE_KEY, catalog, settings.PLAN_CATALOG_CACHE_TIMEOUT)
+    return catalog
+
+
+def build_plan_catalog():
+    plans = Plan.objects.filter(is_active=True)
+    content = json.dumps(plan_fast_serializer.serialize(plan_fast_serializer.get_queryset(plans)),
+                         cls=DjangoJSONEncoder).encode()
+    last_modified = Plan.objects.aggregate(last_modified=Max('updated_at'))['last_modified']
+    return {
+        'content': content,
+        # the content changes with every update, and also when a plan is deleted or deactivated
+        'etag': quote_etag(hashlib.md5(content).hexdigest()),
+        'last_modified': int(last_modified.timestamp()) if last_modified else None,
+    }
+
+
+def invalidate_plan_catalog():
+    cache.delete(PLAN_CATALOG_CACHE_KEY)
+    # again after the commit, a request during the transaction could have cached the old plans
+    transaction.on_commit(lambda: cache.delete(PLAN_CATALOG_CACHE_KEY))
@@ -0,0 +1,133 @@
+import csv
+from datetime import date, timedelta
+from itertools import chain
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .billing import as_datetime, chunked
+from .models import ArchivedInvoice, Invoice
+from .replica import read_database
+
+# column name and lookup of every exported invoice field
+EXPORT_FIELDS = [
+    ('id', 'id'),
+    ('user_id', 'user_id'),
+    ('user_email', 'user__email'),
+    ('subscription_id', 'subscription_id'),
+    ('plan_id', 'plan_id'),
+    ('plan_name', 'plan__name'),
+    ('amount', 'amount'),
+    ('status', 'status'),
+    ('issue_date', 'issue_date'),
+    ('due_date', 'due_date'),
+    ('paid_at', 'paid_at'),
+    ('billing_period_start', 'billing_period_start'),
+    ('billing_period_end', 'billing_period_end'),
+    ('razorpay_order_id', 'razorpay_order_id'),
+]
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def parse_export_filters(since=None, until=None, status=None, plan=None):
+    """
+    Validate the export filters given as strings and return them as keyword arguments
+    of `export_invoices`. Raises ValueError with a message for the user.
+    """
+    filters = {}
+    try:
+        if since:
+            filters['since'] = date.fromisoformat(since)
+        if until:
+            filters['until'] = date.fromisoformat(until)
+    except ValueError:
+        raise ValueError("Dates must be formatted as YYYY-MM-DD")
+    if since and until and filters['since'] > filters['until']:
+        raise ValueError("since must not be after until")
+    if status:
+        statuses = dict(Invoice._meta.get_field('status').choices)
+        if status not in statuses:
+            raise ValueError(f"status must be one of {', '.join(statuses)}")
+        filters['status'] = status
+    if plan:
+        try:
+            filters['plan'] = int(plan)
+        except ValueError:
+            raise ValueError("plan must be a plan id")
+    return filters
+
+
+def export_invoices(since=None, until=None, status=None, plan=None):
+    """
+    Return the rows of the invoices issued between `since` and `until` (inclusive),
+    the invoice table first and then the archive, as tuples in the order of
+    EXPORT_FIELDS. Both are read through a server-side cursor in chunks of
+    EXPORT_CHUNK_SIZE so only one chunk is in memory at a time. Archive partitions
+    already exported to files (see api/archive.py) are not included.
+    """
+    database = read_database()
+    # outside a transaction the cursors would be declared WITH HOLD, and Postgres
+    # would copy the whole result when the implicit transaction commits
+    with transaction.atomic(using=database):
+        yield from chain.from_iterable(
+            _export_rows(model, database, since, until, status, plan) for model in [Invoice, ArchivedInvoice]
+        )
+
+
+def _export_rows(model, database, since, until, status, plan):
+    # a report, read from the replica when there is one
+    invoices = model.objects.using(database)
+    if since:
+        invoices = invoices.filter(issue_date__gte=as_datetime(since))
+    if until:
+        invoices = invoices.filter(issue_date__lt=as_datetime(until + timedelta(days=1)))
+    if status:
+        invoices = invoices.filter(status=status)
+    if plan:
+        invoices = invoices.filter(plan_id=plan)
+    # no ORDER BY, sorting the whole table would delay the first row and need a sort on disk
+    invoices = invoices.order_by().values_list(*[lookup for _, lookup in EXPORT_FIELDS])
+    return invoices.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+def iter_ndjson(rows):
+    """Encode rows as JSON lines, yielding one string per chunk of rows."""
+    columns = [column for column, _ in EXPORT_FIELDS]
+    encoder = DjangoJSONEncoder()
+    for chunk in chunked(rows, settings.EXPORT_CHUNK_SIZE):
+        yield ''.join(encoder.encode(dict(zip(columns, row))) + '\n' for row in chunk)
+
+
+class Echo:
+    """File-like object that returns what is written, so csv.writer can encode into a generator."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    """Encode rows as CSV with a header line, yielding one string per chunk of rows."""
+    writer = csv.writer(Echo())
+    encoder = DjangoJSONEncoder()
+
+    def format_value(value):
+        # dates, decimals and UUIDs are written like in the NDJSON export
+        if value is None:
+            return ''
+        if isinstance(value, (str, int)):
+            return value
+        return encoder.default(value)
+
+    yield writer.writerow([column for column, _ in EXPORT_FIELDS])
+    for chunk in chunked(rows, settings.EXPORT_CHUNK_SIZE):
+        yield ''.join(writer.writerow([format_value(value) for value in row]) for row in chunk)
+
+
+def iter_export(export_format, rows):
+    if export_format == 'csv':
+        return iter_csv(rows)
+    return iter_ndjson(rows)
@@ -0,0 +1,81 @@
+import threading
+
+import razorpay
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class TimeoutSession(requests.Session):
+    """requests.Session with a default (connect, read) timeout, razorpay passes none."""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, *args, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(*args, **kwargs)
+
+
+class RazorpayClient(razorpay.Client):
+    """razorpay.Client that looks up its version for the User-Agent once instead of on every request."""
+
+    def _get_version(self):
+        if not hasattr(self, '_version'):
+            self._version = super()._get_version()
+        return self._version
+
+
+def build_session():
+    """
+    Session with a keep-alive connection pool and bounded retries.
+    Connection errors are retried for every request since nothing reached the gateway,
+    read errors and 502/503/504 responses only for idempotent methods, so an order is
+    never created twice.
+    """
+    retry = Retry(
+        total=settings.RAZORPAY_MAX_RETRIES,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        backoff_factor=0.2,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_maxsize=settings.RAZORPAY_POOL_SIZE, max_retries=retry)
+    session = TimeoutSession(timeout=(settings.RAZORPAY_CONNECT_TIMEOUT, settings.RAZORPAY_READ_TIMEOUT))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def gateway_timeout():
+    """Longest a gateway call can take: every connect attempt, one read and the backoffs."""
+    return (settings.RAZORPAY_CONNECT_TIMEOUT * (settings.RAZORPAY_MAX_RETRIES + 1)
+            + settings.RAZORPAY_READ_TIMEOUT + settings.RAZORPAY_MAX_RETRIES)
+
+
+def get_razorpay_client():
+    """Return the Razorpay client of this process, created on first use and reused by every request."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = RazorpayClient(
+                    session=build_session(),
+                    auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET),
+                    base_url=settings.RAZORPAY_BASE_URL,
+                )
+    return _client
+
+
+def reset_razorpay_client():
+    """Drop the client so the next call builds one from the current settings."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.session.close()
+        _client = None
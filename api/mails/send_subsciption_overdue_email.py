@@ -1,11 +1,13 @@
-from django.core.mail import EmailMessage
+import smtplib
+import time
+
+from django.core.mail import EmailMessage, get_connection
 from celery import shared_task
 
 
-@shared_task
-def send_subscription_overdue_email(user_email, subscription_id):
+def build_subscription_overdue_email(user_email, subscription_id):
     """
-    Send an overdue subscription email to the user.
+    Build the overdue subscription email for a user.
 
     :param user_email: Email address of the user
     :param subscription_id: ID of the subscription
@@ -13,5 +15,57 @@ def send_subscription_overdue_email(user_email, subscription_id):
     subject = "Subscription Overdue Notice"
     body = f"Dear User,\n\nYour subscription with ID {subscription_id} is overdue. Please take action to avoid service interruption.\n\nThank you!"
 
-    email = EmailMessage(subject, body, to=[user_email])
+    return EmailMessage(subject, body, to=[user_email])
+
+
+def build_overdue_digest_email(user_email, subscription_ids, invoice_ids):
+    """
+    Build one email listing every overdue invoice of a user.
+
+    :param user_email: Email address of the user
+    :param subscription_ids: IDs of the subscriptions with overdue invoices
+    :param invoice_ids: IDs of the overdue invoices
+    """
+    if len(invoice_ids) == 1:
+        return build_subscription_overdue_email(user_email, subscription_ids[0])
+
+    subject = "Subscription Overdue Notice"
+    invoices = "\n".join(f"- Invoice {invoice_id}" for invoice_id in invoice_ids)
+    body = (f"Dear User,\n\nYour subscription with ID {', '.join(subscription_ids)} has {len(invoice_ids)} overdue invoices:\n\n"
+            f"{invoices}\n\nPlease take action to avoid service interruption.\n\nThank you!")
+
+    return EmailMessage(subject, body, to=[user_email])
+
+
+@shared_task
+def send_subscription_overdue_email(user_email, subscription_id):
+    """
+    Send an overdue subscription email to the user.
+
+    :param user_email: Email address of the user
+    :param subscription_id: ID of the subscription
+    """
+    email = build_subscription_overdue_email(user_email, subscription_id)
     email.send()
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def send_subscription_overdue_emails(self, recipients):
+    """
+    Send overdue digest emails to a chunk of users over a single mail connection.
+    If the connection fails the chunk is retried, without the emails that were already sent.
+
+    :param recipients: List of {"user_email": ..., "subscription_ids": [...], "invoice_ids": [...]} dicts
+    """
+    started = time.monotonic()
+    sent = 0
+    try:
+        with get_connection() as connection:
+            for recipient in recipients:
+                sent += connection.send_messages([build_overdue_digest_email(**recipient)])
+    except (smtplib.SMTPException, OSError) as exc:
+        raise self.retry(exc=exc, args=[recipients[sent:]])
+
+    elapsed = time.monotonic() - started
+    print(f"Sent {sent} overdue emails in {elapsed:.2f}s ({sent / max(elapsed, 1e-6):.1f} emails/s)")
+    return {'sent': sent, 'seconds': round(elapsed, 3)}
@@ -1,4 +1,5 @@
 from django.core.management.base import BaseCommand
+from api.catalog import invalidate_plan_catalog
 from api.models import Plan
 
 
@@ -33,3 +34,6 @@ class Command(BaseCommand):
                 self.stdout.write(self.style.SUCCESS(f"Created plan: {plan.name}"))
             else:
                 self.stdout.write(f"Plan already exists: {plan.name}")
+
+        # the Plan signals already refresh the cached catalog, this also covers plans changed with update()
+        invalidate_plan_catalog()
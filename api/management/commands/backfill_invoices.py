@@ -0,0 +1,34 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.tasks import backfill_invoices
+
+
+class Command(BaseCommand):
+    help = 'Create the invoices of billing cycles missed between two dates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', required=True, help='First day to backfill (YYYY-MM-DD)')
+        parser.add_argument('--until', help='Last day to backfill (YYYY-MM-DD), defaults to today')
+        parser.add_argument('--batch-size', type=int, help='Subscriptions per batch, defaults to INVOICE_BATCH_SIZE')
+        parser.add_argument('--async', action='store_true', dest='run_async',
+                            help='Queue the backfill on a celery worker instead of running it here')
+
+    def handle(self, *args, **options):
+        since, until = options['since'], options['until']
+        try:
+            if date.fromisoformat(since) > date.fromisoformat(until or date.max.isoformat()):
+                raise CommandError("--since must not be after --until")
+        except ValueError as e:
+            raise CommandError(f"Invalid date: {e}")
+
+        if options['run_async']:
+            result = backfill_invoices.delay(since, until, options['batch_size'])
+            self.stdout.write(f"Backfill queued: {result.id}")
+            return
+
+        result = backfill_invoices(since, until, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result['created']} invoices ({result['scanned']} subscriptions scanned)"
+        ))
@@ -0,0 +1,217 @@
+import json
+import os
+import time
+import uuid
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.benchmarks import compare_results, load_results, measure, save_results
+from api.exports import export_invoices, iter_export
+from api.management.commands.seed_billing_data import USERNAME_PREFIX
+from api.models import Invoice, Plan, ReconciliationCheckpoint, Subscription, WebhookEvent
+from api.rollups import fold_revenue_deltas, rebuild_revenue_rollups, revenue_metrics
+from api.signatures import sign
+from api.tasks import (generate_daily_invoice, mark_overdue_invoices, process_webhook_events, reconcile_payments,
+                       send_invoice_reminders)
+from api.views import InvoiceListView
+from billing_service.celery import app as celery_app
+
+
+class FakeRazorpayClient:
+    """Stands in for the Razorpay client so the benchmark never calls the gateway."""
+
+    def __init__(self):
+        self.order = self
+        self.utility = self
+
+    def create(self, data):
+        return {'id': f"order_benchmark_{data['receipt'][:8]}"}
+
+    def verify_payment_signature(self, parameters):
+        return True
+
+    def payments(self, order_id):
+        return {'items': [{'id': f'pay_{order_id}', 'status': 'captured', 'created_at': int(time.time())}]}
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the billing tasks and API endpoints on synthetic data. '
+        'Generates the data with seed_billing_data in the configured database, run it against a local Postgres.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='1000',
+                            help='Comma separated numbers of subscriptions, e.g. 1000,100000,1000000')
+        parser.add_argument('--label', default=None, help='Name of the run, e.g. the release tag')
+        parser.add_argument('--output', default=None,
+                            help='Where to store the results, defaults to benchmarks/results/<label>.json')
+        parser.add_argument('--compare', default=None, help='Results of an earlier run to compare with')
+        parser.add_argument('--only', default=None, help='Comma separated benchmark names to run')
+
+    def handle(self, *args, **options):
+        try:
+            scales = [int(scale) for scale in options['scales'].split(',')]
+        except ValueError:
+            raise CommandError("--scales must be a comma separated list of numbers")
+        label = options['label'] or timezone.now().strftime('%Y%m%d-%H%M%S')
+        output = options['output'] or os.path.join(settings.BASE_DIR, 'benchmarks', 'results', f'{label}.json')
+        only = set(options['only'].split(',')) if options['only'] else None
+
+        results = {
+            'label': label,
+            'created_at': timezone.now().isoformat(),
+            'database': f'{connection.vendor} {connection.pg_version}' if connection.vendor == 'postgresql'
+            else connection.vendor,
+            'results': {},
+        }
+        for scale in scales:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"Seeding {scale} subscriptions"))
+            call_command('seed_billing_data', users=scale, flush=True, stdout=open(os.devnull, 'w'))
+            results['results'][str(scale)] = self.run_scale(only)
+
+        save_results(results, output)
+        self.stdout.write(self.style.SUCCESS(f"Results saved to {output}"))
+
+        if options['compare']:
+            self.print_comparison(load_results(options['compare']), results)
+
+    def run_scale(self, only):
+        context = self.build_context()
+        scale_results = {}
+        # tasks run in process, emails go to the in-memory backend
+        eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        try:
+            with override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+                                   RAZORPAY_WEBHOOK_SECRET='benchmark-webhook-secret'), \
+                    patch.dict(os.environ, {'MOCK_PAYMENT_SUCCESS': 'True'}), \
+                    patch('api.views.payment_views.get_razorpay_client', return_value=FakeRazorpayClient()), \
+                    patch('api.reconciliation.get_razorpay_client', return_value=FakeRazorpayClient()):
+                for name, func, setup in self.benchmarks(context):
+                    if only and name not in only:
+                        continue
+                    result = measure(func, setup)
+                    scale_results[name] = result
+                    self.stdout.write(
+                        f"  {name:<32} {result['seconds']:>10.4f}s {result['queries']:>8} queries "
+                        f"{result['peak_memory_kb']:>12.1f} KB"
+                    )
+        finally:
+            celery_app.conf.task_always_eager = eager
+        return scale_results
+
+    def build_context(self):
+        # the oldest active subscription has the longest invoice history
+        sub = (Subscription.objects.filter(status='active', user__username__startswith=USERNAME_PREFIX)
+               .select_related('user', 'plan').order_by('start_date').first())
+        if sub is None:
+            raise CommandError("No active synthetic subscription found")
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(sub.user).access_token}')
+        return {'sub': sub, 'user': sub.user, 'client': client, 'plan': Plan.objects.filter(is_active=True).first()}
+
+    def benchmarks(self, context):
+        """(name, func, setup) of every benchmark, setup runs in the rolled back transaction before func."""
+        client, sub, user = context['client'], context['sub'], context['user']
+
+        def unpaid_invoice(**kwargs):
+            now = timezone.now()
+            invoice = Invoice.objects.create(user=user, subscription=sub, plan=sub.plan, amount=sub.plan.price,
+                                             issue_date=now, due_date=now, status='unpaid', **kwargs)
+            return (str(invoice.id),)
+
+        def cancel_subscription():
+            Subscription.objects.filter(user=user, status='active').update(status='cancelled')
+            return ()
+
+        def oldest_invoice_cursor():
+            # the cursor of the last page of the user's invoices
+            invoice = Invoice.objects.filter(user=user).order_by('issue_date', 'id')[1]
+            return (InvoiceListView.paginator.encode_cursor(invoice),)
+
+        def export(export_format):
+            for _ in iter_export(export_format, export_invoices()):
+                pass
+
+        def paid_webhook_events():
+            # payment events for up to 1000 unpaid invoices with an order
+            orders = (Invoice.objects.filter(status='unpaid', razorpay_order_id__isnull=False)
+                      .values_list('razorpay_order_id', flat=True)[:1000])
+            WebhookEvent.objects.bulk_create([
+                WebhookEvent(event_id=f'evt_benchmark_{order_id}', event='payment.captured', payload={
+                    'event': 'payment.captured',
+                    'payload': {'payment': {'entity': {'id': f'pay_{order_id}', 'order_id': order_id}}},
+                }) for order_id in orders
+            ])
+            return ()
+
+        def reset_checkpoint():
+            # every run is a full pass
+            ReconciliationCheckpoint.objects.all().delete()
+            return ()
+
+        def webhook():
+            body = json.dumps({
+                'event': 'payment.captured',
+                'payload': {'payment': {'entity': {'id': 'pay_benchmark', 'order_id': 'order_benchmark'}}},
+            })
+            response = Client().generic('POST', reverse('razorpay-webhook'), body, content_type='application/json',
+                                        HTTP_X_RAZORPAY_SIGNATURE=sign(body, settings.RAZORPAY_WEBHOOK_SECRET),
+                                        HTTP_X_RAZORPAY_EVENT_ID=f'evt_{uuid.uuid4().hex}')
+            assert response.status_code < 300, f"razorpay-webhook returned {response.status_code}"
+
+        def post(name, data):
+            response = client.post(reverse(name), data)
+            assert response.status_code < 300, f"{name} returned {response.status_code}"
+
+        def get(name, params=None):
+            response = client.get(reverse(name), params)
+            assert response.status_code < 300, f"{name} returned {response.status_code}"
+
+        return [
+            ('generate_daily_invoice', generate_daily_invoice, None),
+            ('mark_overdue_invoices', mark_overdue_invoices, None),
+            ('send_invoice_reminders', send_invoice_reminders, None),
+            ('process_webhook_events', process_webhook_events, paid_webhook_events),
+            ('reconcile_payments', reconcile_payments, reset_checkpoint),
+            ('export invoices ndjson', lambda: export('ndjson'), None),
+            ('export invoices csv', lambda: export('csv'), None),
+            ('fold_revenue_rollups', fold_revenue_deltas, None),
+            ('rebuild_revenue_rollups', rebuild_revenue_rollups, None),
+            ('revenue metrics 30 days', lambda: revenue_metrics(timezone.localdate() - timedelta(days=29),
+                                                                timezone.localdate()), None),
+            ('POST signup', lambda: post('signup', {
+                'email': 'benchmark@example.com', 'username': 'benchmark', 'password': 'benchmark-password'}), None),
+            ('GET plans', lambda: Client().get(reverse('plan-list')), None),
+            ('POST subscribe', lambda: post('subscribe', {'plan_id': context['plan'].id}), cancel_subscription),
+            ('POST unsubscribe', lambda: post('unsubscribe', {'subscription_id': str(sub.id)}), None),
+            ('GET subscriptions', lambda: get('subscription-list'), None),
+            ('POST invoice/pay', lambda invoice_id: post('pay-invoice', {'invoice_id': invoice_id}), unpaid_invoice),
+            ('GET invoices', lambda: get('invoice-list'), None),
+            ('GET invoices last page', lambda cursor: get('invoice-list', {'cursor': cursor}), oldest_invoice_cursor),
+            ('GET invoice/latest', lambda: get('latest-invoice'), None),
+            ('POST invoice/create-order', lambda invoice_id: post('create-razorpay-order', {'invoice_id': invoice_id}),
+             unpaid_invoice),
+            ('POST invoice/create-order again', lambda invoice_id: post('create-razorpay-order', {
+                'invoice_id': invoice_id}), lambda: unpaid_invoice(razorpay_order_id='order_benchmark',
+                                                                   razorpay_order_amount=int(sub.plan.price * 100))),
+            ('POST invoice/verify-payment', lambda invoice_id: post('verify-razorpay-payment', {
+                'invoice_id': invoice_id, 'razorpay_order_id': 'order_benchmark', 'razorpay_payment_id': 'pay_benchmark'}),
+             lambda: unpaid_invoice(razorpay_order_id='order_benchmark')),
+            ('POST webhooks/razorpay', webhook, None),
+        ]
+
+    def print_comparison(self, old, new):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Compared with {old['label']}"))
+        for scale, target, metric, before, after in compare_results(old, new):
+            change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+            self.stdout.write(f"  {scale:>8} {target:<32} {metric:<15} {before:>12} -> {after:<12} {change}")
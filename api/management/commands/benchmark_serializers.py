@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Invoice, Subscription
+from api.serializers import (InvoiceSerializer, SubscriptionSerializer, invoice_fast_serializer,
+                             subscription_fast_serializer)
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the serialization throughput, in rows per second, of the DRF serializers and of their fast '
+        'read path on the invoices and subscriptions in the database (see seed_billing_data). '
+        'Only the serialization is timed, the rows are loaded before.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Number of rows to serialize')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per serializer, the best one is reported')
+
+    def handle(self, *args, **options):
+        if options['rows'] < 1 or options['repeat'] < 1:
+            raise CommandError("--rows and --repeat must be positive")
+
+        targets = [
+            ('invoices', Invoice.objects.select_related('subscription__plan'), InvoiceSerializer,
+             invoice_fast_serializer),
+            ('subscriptions', Subscription.objects.select_related('plan'), SubscriptionSerializer,
+             subscription_fast_serializer),
+        ]
+        for name, queryset, serializer_class, fast_serializer in targets:
+            instances = list(queryset[:options['rows']])
+            rows = list(fast_serializer.get_queryset(queryset)[:options['rows']])
+            if not rows:
+                raise CommandError(f"No {name} to serialize, run seed_billing_data first")
+
+            drf = self.best_rate(lambda: serializer_class(instances, many=True).data, len(instances),
+                                 options['repeat'])
+            fast = self.best_rate(lambda: fast_serializer.serialize(rows), len(rows), options['repeat'])
+            self.stdout.write(
+                f"{name:<14} {len(rows):>8} rows  drf {drf:>12,.0f} rows/s  fast {fast:>12,.0f} rows/s  "
+                f"x{fast / drf:.1f}"
+            )
+
+    def best_rate(self, func, rows, repeat):
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - started)
+        return rows / max(best, 1e-9)
@@ -0,0 +1,46 @@
+import time
+
+import razorpay
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.signatures import payment_signature, verify_payment_signature, verify_payment_signatures
+
+
+class Command(BaseCommand):
+    help = 'Compare the payment signatures verified per second by the Razorpay SDK and by api.signatures'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=10000, help='Number of signatures to verify')
+
+    def handle(self, *args, **options):
+        if options['count'] < 1:
+            raise CommandError("--count must be positive")
+        if not settings.RAZORPAY_KEY_SECRET:
+            raise CommandError("RAZORPAY_KEY_SECRET is not set")
+
+        payments = [(f'order_{i}', f'pay_{i}', payment_signature(f'order_{i}', f'pay_{i}'))
+                    for i in range(options['count'])]
+
+        def sdk():
+            # what the payment view used to do for every request
+            for order_id, payment_id, signature in payments:
+                client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
+                client.utility.verify_payment_signature({
+                    'razorpay_order_id': order_id, 'razorpay_payment_id': payment_id, 'razorpay_signature': signature,
+                })
+
+        def local():
+            for order_id, payment_id, signature in payments:
+                verify_payment_signature(order_id, payment_id, signature)
+
+        def batch():
+            verify_payment_signatures(payments)
+
+        baseline = None
+        for name, func in [('sdk client', sdk), ('local', local), ('local batch', batch)]:
+            started = time.perf_counter()
+            func()
+            rate = len(payments) / max(time.perf_counter() - started, 1e-9)
+            baseline = baseline or rate
+            self.stdout.write(f"{name:<12} {rate:>14,.0f} signatures/s  x{rate / baseline:.1f}")
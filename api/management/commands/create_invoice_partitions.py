@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.archive import create_archive_partitions
+
+
+class Command(BaseCommand):
+    help = 'Create the monthly partitions of the invoice archive ahead of the archival'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=None,
+                            help='Months after the archive cutoff to create, defaults to INVOICE_ARCHIVE_PARTITIONS_AHEAD')
+
+    def handle(self, *args, **options):
+        if options['months_ahead'] is not None and options['months_ahead'] < 0:
+            raise CommandError("--months-ahead can not be negative")
+
+        created = create_archive_partitions(months_ahead=options['months_ahead'])
+        for name in created:
+            self.stdout.write(f"Created {name}")
+        self.stdout.write(self.style.SUCCESS(f"{len(created)} partitions created"))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.exports import EXPORT_FORMATS, export_invoices, iter_export, parse_export_filters
+
+
+class Command(BaseCommand):
+    help = 'Stream every invoice to a file (or stdout) as NDJSON or CSV, for reconciliation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='ndjson', dest='export_format')
+        parser.add_argument('--output', help='File to write, defaults to stdout')
+        parser.add_argument('--since', help='First issue day to export (YYYY-MM-DD)')
+        parser.add_argument('--until', help='Last issue day to export (YYYY-MM-DD)')
+        parser.add_argument('--status', help='Only export invoices with this status')
+        parser.add_argument('--plan', help='Only export invoices of this plan id')
+
+    def handle(self, *args, **options):
+        try:
+            filters = parse_export_filters(options['since'], options['until'], options['status'], options['plan'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        chunks = iter_export(options['export_format'], export_invoices(**filters))
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        with open(options['output'], 'w', newline='') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        self.stdout.write(self.style.SUCCESS(f"Invoices exported to {options['output']}"))
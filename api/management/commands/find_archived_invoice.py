@@ -0,0 +1,26 @@
+import json
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.forms.models import model_to_dict
+
+from api.archive import find_archived_invoice
+
+
+class Command(BaseCommand):
+    help = 'Look up an archived invoice in the archive partitions and the exported files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('invoice_id', help='Id of the invoice')
+
+    def handle(self, *args, **options):
+        try:
+            invoice_id = uuid.UUID(options['invoice_id'])
+        except ValueError:
+            raise CommandError("invoice_id must be a UUID")
+
+        invoice = find_archived_invoice(invoice_id)
+        if invoice is None:
+            raise CommandError(f"Archived invoice {options['invoice_id']} not found")
+        self.stdout.write(json.dumps(model_to_dict(invoice), cls=DjangoJSONEncoder, indent=2))
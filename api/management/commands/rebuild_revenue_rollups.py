@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.rollups import rebuild_revenue_rollups
+
+
+class Command(BaseCommand):
+    help = 'Aggregate the invoice history again into the daily revenue rollups'
+
+    def handle(self, *args, **options):
+        rows = rebuild_revenue_rollups()
+        self.stdout.write(self.style.SUCCESS(f"{rows} daily revenue rows rebuilt"))
@@ -0,0 +1,119 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from api.billing import as_datetime, next_cycle_start
+from api.models import Invoice, MyUser, Plan, Subscription
+
+USERNAME_PREFIX = 'synthetic'
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic users, subscriptions and invoices for load testing and benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Number of users to create')
+        parser.add_argument('--months', type=int, default=24,
+                            help='Subscriptions start at a random date within this many months')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Users written per batch')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, the same seed gives the same data')
+        parser.add_argument('--flush', action='store_true', help='Delete the synthetic data generated before')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['batch_size'] < 1:
+            raise CommandError("--users and --batch-size must be positive")
+
+        if options['flush']:
+            self.stdout.write(f"Deleted {self.flush(options['batch_size'])} synthetic rows")
+
+        call_command('add_plans', stdout=self.stdout)
+        plans = list(Plan.objects.filter(is_active=True))
+        rng = random.Random(options['seed'])
+        now = timezone.now()
+        # hashing a password takes ~100ms, every synthetic user gets the same one
+        password = make_password('synthetic-password')
+        offset = MyUser.objects.filter(username__startswith=USERNAME_PREFIX).count()
+
+        totals = {'users': 0, 'subscriptions': 0, 'invoices': 0}
+        for first in range(offset, offset + options['users'], options['batch_size']):
+            last = min(first + options['batch_size'], offset + options['users'])
+            batch = self.create_batch(range(first, last), plans, password, rng, now, options['months'])
+            for key, count in batch.items():
+                totals[key] += count
+            self.stdout.write(f"{totals['users']}/{options['users']} users created")
+        # the rows are bulk inserted past the incremental rollup updates
+        call_command('rebuild_revenue_rollups', stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {totals['users']} users, {totals['subscriptions']} subscriptions and {totals['invoices']} invoices"
+        ))
+
+    def flush(self, batch_size):
+        # in batches so the cascade never loads millions of invoices at once
+        deleted = 0
+        users = MyUser.objects.filter(username__startswith=USERNAME_PREFIX).values_list('id', flat=True)
+        while ids := list(users[:batch_size]):
+            deleted += MyUser.objects.filter(id__in=ids).delete()[0]
+        return deleted
+
+    @transaction.atomic
+    def create_batch(self, numbers, plans, password, rng, now, months):
+        users = MyUser.objects.bulk_create([
+            MyUser(username=f'{USERNAME_PREFIX}{number}', email=f'{USERNAME_PREFIX}{number}@example.com',
+                   password=password)
+            for number in numbers
+        ])
+
+        subscriptions = []
+        invoices = []
+        for user in users:
+            plan = rng.choice(plans)
+            start_date = now - timedelta(days=rng.randint(0, months * 30), seconds=rng.randint(0, 86400))
+            # most subscribers stay, some cancel and some expire
+            status = rng.choices(['active', 'cancelled', 'expired'], weights=[85, 10, 5])[0]
+            sub = Subscription(user=user, plan=plan, start_date=start_date, end_date=start_date, status=status)
+
+            start = start_date.date()
+            cycle_start = start
+            # cycles starting today are left for generate_daily_invoice
+            while cycle_start < now.date() or cycle_start == start:
+                cycle_end = next_cycle_start(start, cycle_start, plan.duration)
+                invoices.append(self.build_invoice(sub, cycle_start, cycle_end, rng, now))
+                cycle_start = cycle_end
+            sub.end_date = as_datetime(cycle_start)
+            sub.next_billing_date = cycle_start
+            subscriptions.append(sub)
+
+        Subscription.objects.bulk_create(subscriptions)
+        Invoice.objects.bulk_create(invoices, batch_size=5000)
+        return {'users': len(users), 'subscriptions': len(subscriptions), 'invoices': len(invoices)}
+
+    def build_invoice(self, sub, cycle_start, cycle_end, rng, now):
+        issue_date = as_datetime(cycle_start) + timedelta(hours=rng.randint(0, 23))
+        due_date = issue_date + timedelta(days=5)
+        invoice = Invoice(
+            user=sub.user,
+            subscription=sub,
+            plan=sub.plan,
+            amount=sub.plan.price,
+            issue_date=issue_date,
+            due_date=due_date,
+            billing_period_start=cycle_start,
+            billing_period_end=cycle_end,
+            status='paid',
+        )
+        if due_date > now:
+            # the current cycle, some are already paid
+            invoice.status = rng.choices(['unpaid', 'paid'], weights=[70, 30])[0]
+        elif rng.random() < 0.03:
+            invoice.status = rng.choice(['unpaid', 'overdue'])
+        if invoice.status == 'paid':
+            invoice.paid_at = min(issue_date + timedelta(days=rng.randint(0, 4)), now)
+        elif rng.random() < 0.5:
+            invoice.razorpay_order_id = f'order_synthetic{rng.getrandbits(48):x}'
+        return invoice
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.1 on 2026-10-18 04:40
+
+from dateutil.relativedelta import relativedelta
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def backfill_next_billing_date(apps, schema_editor):
+    """
+    Set next_billing_date to the start of the cycle after the last invoiced one,
+    or to the end of the first cycle for subscriptions without invoices.
+    """
+    Subscription = apps.get_model('api', 'Subscription')
+    subscriptions = (
+        Subscription.objects.filter(next_billing_date__isnull=True)
+        .select_related('plan')
+        .annotate(last_billed=Max('invoices__billing_period_start'))
+        .order_by('pk')
+    )
+    batch = []
+    for sub in subscriptions.iterator(chunk_size=1000):
+        start_date = sub.start_date.date()
+        months = 0
+        if sub.last_billed is not None:
+            months = (sub.last_billed.year - start_date.year) * 12 + (sub.last_billed.month - start_date.month)
+        sub.next_billing_date = start_date + relativedelta(months=months + sub.plan.duration)
+        batch.append(sub)
+        if len(batch) == 1000:
+            Subscription.objects.bulk_update(batch, ['next_billing_date'])
+            batch = []
+    if batch:
+        Subscription.objects.bulk_update(batch, ['next_billing_date'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_invoice_razorpay_order_id_alter_myuser_email'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='next_billing_date',
+            field=models.DateField(blank=True, db_index=True, help_text='Start date of the next billing cycle that has not been invoiced yet', null=True),
+        ),
+        migrations.RunPython(backfill_next_billing_date, migrations.RunPython.noop),
+    ]
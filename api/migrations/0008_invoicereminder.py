@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-18 04:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_subscription_next_billing_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceReminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('step', models.PositiveSmallIntegerField(help_text='Escalation step of the reminder, 0 for the first one')),
+                ('sent_at', models.DateTimeField()),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminders', to='api.invoice')),
+            ],
+            options={
+                'ordering': ['-sent_at'],
+                'constraints': [models.UniqueConstraint(fields=('invoice', 'step'), name='unique_invoice_reminder_step')],
+            },
+        ),
+    ]
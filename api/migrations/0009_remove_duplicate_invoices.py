@@ -0,0 +1,54 @@
+# Generated by Django 5.2.1 on 2026-10-18 04:48
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def remove_duplicate_invoices(apps, schema_editor):
+    """
+    Keep one invoice per (subscription, billing_period_start) before the unique
+    constraint is added. Only unpaid duplicates without a razorpay order are deleted,
+    the paid invoice or the one with an order is kept, otherwise the oldest one.
+    Groups with more than one paid invoice or razorpay order have to be merged by hand,
+    the migration fails and lists them.
+    """
+    Invoice = apps.get_model('api', 'Invoice')
+    duplicates = (
+        Invoice.objects.filter(billing_period_start__isnull=False)
+        .values('subscription_id', 'billing_period_start')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+        .order_by()
+    )
+    conflicts = []
+    for duplicate in duplicates.iterator():
+        invoices = list(
+            Invoice.objects.filter(subscription_id=duplicate['subscription_id'],
+                                   billing_period_start=duplicate['billing_period_start'])
+            .order_by('issue_date', 'id')
+            .values_list('id', 'status', 'razorpay_order_id')
+        )
+        settled = [invoice_id for invoice_id, status, order_id in invoices if status == 'paid' or order_id]
+        if len(settled) > 1:
+            conflicts.append(f"subscription {duplicate['subscription_id']} "
+                             f"({duplicate['billing_period_start']}): {', '.join(map(str, settled))}")
+            continue
+        keep = settled[0] if settled else invoices[0][0]
+        Invoice.objects.filter(id__in=[invoice_id for invoice_id, _, _ in invoices if invoice_id != keep]).delete()
+
+    if conflicts:
+        raise RuntimeError(
+            "Duplicate invoices with more than one payment or razorpay order, merge them before migrating:\n"
+            + "\n".join(conflicts)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_invoicereminder'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_invoices, migrations.RunPython.noop),
+    ]
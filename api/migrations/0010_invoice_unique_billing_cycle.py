@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 04:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_remove_duplicate_invoices'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='invoice',
+            constraint=models.UniqueConstraint(fields=('subscription', 'billing_period_start'), name='unique_invoice_billing_cycle'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 04:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_invoice_unique_billing_cycle'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['user', '-issue_date', '-id'], name='invoice_user_issue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['user', '-start_date', '-id'], name='subscription_user_start_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 05:29
+
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Cast
+
+
+def backfill_order_amounts(apps, schema_editor):
+    """The existing orders were created for the invoice amount, so they can be reused."""
+    Invoice = apps.get_model('api', 'Invoice')
+    Invoice.objects.filter(razorpay_order_id__isnull=False).update(
+        razorpay_order_amount=Cast(F('amount') * 100, models.PositiveIntegerField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_reconciliationcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='razorpay_order_amount',
+            field=models.PositiveIntegerField(blank=True, help_text='Amount of the Razorpay order in paise', null=True),
+        ),
+        migrations.RunPython(backfill_order_amounts, migrations.RunPython.noop),
+    ]
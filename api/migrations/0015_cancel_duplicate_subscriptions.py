@@ -0,0 +1,39 @@
+# Generated by Django 5.2.1 on 2026-10-18 05:31
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def cancel_duplicate_subscriptions(apps, schema_editor):
+    """
+    Keep one active subscription per user before the unique constraint is added,
+    the most recent one. The other active subscriptions are cancelled, their
+    invoices are kept.
+    """
+    Subscription = apps.get_model('api', 'Subscription')
+    duplicates = (
+        Subscription.objects.filter(status='active')
+        .values('user_id')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+        .order_by()
+    )
+    for duplicate in duplicates.iterator():
+        keep, *cancel = (
+            Subscription.objects.filter(user_id=duplicate['user_id'], status='active')
+            .order_by('-start_date', '-id')
+            .values_list('id', flat=True)
+        )
+        Subscription.objects.filter(id__in=cancel).update(status='cancelled')
+        print(f"Subscription {keep} kept, cancelled {len(cancel)} duplicates")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_invoice_razorpay_order_amount'),
+    ]
+
+    operations = [
+        migrations.RunPython(cancel_duplicate_subscriptions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.1 on 2026-10-18 05:39
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # the indexes are built without locking the tables against writes, which cannot run in a transaction
+    atomic = False
+
+    dependencies = [
+        ('api', '0016_unique_active_subscription'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='invoice',
+            index=models.Index(condition=models.Q(('status__in', ['unpaid', 'overdue'])), fields=['status', 'due_date'], name='invoice_open_due_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='invoice',
+            index=models.Index(condition=models.Q(('razorpay_order_id__isnull', False)), fields=['razorpay_order_id'], name='invoice_order_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='invoice',
+            index=models.Index(condition=models.Q(('razorpay_order_id__isnull', False), ('status__in', ['unpaid', 'overdue'])), fields=['id'], name='invoice_pending_order_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='subscription',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['next_billing_date'], name='subscription_billing_due_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.1 on 2026-10-18 05:43
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # the index is built without locking the table against writes, which cannot run in a transaction
+    atomic = False
+
+    dependencies = [
+        ('api', '0017_hot_path_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='invoice',
+            index=models.Index(condition=models.Q(('status', 'paid')), fields=['issue_date'], name='invoice_paid_issue_idx'),
+        ),
+    ]
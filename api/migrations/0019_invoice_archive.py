@@ -0,0 +1,57 @@
+# Generated by Django 5.2.1 on 2026-10-18 05:43
+
+from django.db import migrations, models
+
+# one partition per issue_date month is added by api.archive.create_archive_partitions
+CREATE_ARCHIVE = """
+CREATE TABLE api_invoice_archive (
+    id uuid NOT NULL,
+    user_id bigint NOT NULL,
+    subscription_id uuid NOT NULL,
+    plan_id bigint NOT NULL,
+    amount numeric(10, 2) NOT NULL,
+    issue_date timestamp with time zone NOT NULL,
+    due_date timestamp with time zone NOT NULL,
+    status varchar(20) NOT NULL,
+    paid_at timestamp with time zone NULL,
+    billing_period_start date NULL,
+    billing_period_end date NULL,
+    razorpay_order_id varchar(100) NULL,
+    razorpay_order_amount integer NULL CHECK (razorpay_order_amount >= 0),
+    archived_at timestamp with time zone NOT NULL,
+    PRIMARY KEY (id, issue_date)
+) PARTITION BY RANGE (issue_date);
+CREATE INDEX invoice_archive_user_issue_idx ON api_invoice_archive (user_id, issue_date DESC);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_invoice_paid_issue_idx'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_ARCHIVE, 'DROP TABLE api_invoice_archive'),
+        migrations.CreateModel(
+            name='ArchivedInvoice',
+            fields=[
+                ('id', models.UUIDField(primary_key=True, serialize=False)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('issue_date', models.DateTimeField()),
+                ('due_date', models.DateTimeField()),
+                ('status', models.CharField(max_length=20)),
+                ('paid_at', models.DateTimeField(blank=True, null=True)),
+                ('billing_period_start', models.DateField(blank=True, null=True)),
+                ('billing_period_end', models.DateField(blank=True, null=True)),
+                ('razorpay_order_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('razorpay_order_amount', models.PositiveIntegerField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'api_invoice_archive',
+                'ordering': ['-issue_date'],
+                'managed': False,
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-18 05:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_invoice_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRevenue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('invoiced', models.DecimalField(decimal_places=2, default=0, help_text='Amount of the invoices issued that day', max_digits=14)),
+                ('collected', models.DecimalField(decimal_places=2, default=0, help_text='Amount of the invoices paid that day', max_digits=14)),
+                ('outstanding', models.DecimalField(decimal_places=2, default=0, help_text='Amount of the invoices issued that day that are not paid yet', max_digits=14)),
+                ('active_subscribers', models.IntegerField(blank=True, help_text='Active subscriptions at the end of the day, empty when unchanged', null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_revenue', to='api.plan')),
+            ],
+            options={
+                'ordering': ['-day'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'plan'), name='unique_daily_revenue')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_dailyrevenue'),
+    ]
+
+    operations = [
+        # backfill_invoices looks up the archived cycles of every batch of subscriptions,
+        # created on every partition, the archive only takes writes from the nightly job
+        migrations.RunSQL(
+            'CREATE INDEX invoice_archive_cycle_idx ON api_invoice_archive (subscription_id, billing_period_start)',
+            'DROP INDEX invoice_archive_cycle_idx',
+        ),
+    ]
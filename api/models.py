@@ -1,7 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser, UserManager
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 import uuid
+from dateutil.relativedelta import relativedelta
 from rest_framework_simplejwt.tokens import RefreshToken
 
 
@@ -52,16 +54,38 @@ class Subscription(models.Model):
         ],
         default='active'
     )
+    next_billing_date = models.DateField(
+        blank=True, null=True, db_index=True,
+        help_text="Start date of the next billing cycle that has not been invoiced yet"
+    )
 
     def clean(self):
         if self.end_date <= self.start_date:
             raise ValidationError("End date must be after start date.")
 
+    def save(self, *args, **kwargs):
+        if self.next_billing_date is None:
+            # the first billing cycle is invoiced when the subscription is created
+            self.next_billing_date = (self.start_date + relativedelta(months=self.plan.duration)).date()
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.user.username} - {self.plan.name}"
 
     class Meta:
         ordering = ['-start_date']
+        indexes = [
+            # keyset pagination of a user's subscriptions
+            models.Index(fields=['user', '-start_date', '-id'], name='subscription_user_start_idx'),
+            # the billing run, only active subscriptions are invoiced
+            models.Index(fields=['next_billing_date'], condition=models.Q(status='active'),
+                         name='subscription_billing_due_idx'),
+        ]
+        constraints = [
+            # a user has at most one active subscription
+            models.UniqueConstraint(fields=['user'], condition=models.Q(status='active'),
+                                    name='unique_active_subscription'),
+        ]
 
 
 class Invoice(models.Model):
@@ -87,9 +111,157 @@ class Invoice(models.Model):
     billing_period_start = models.DateField(blank=True, null=True)
     billing_period_end = models.DateField(blank=True, null=True)
     razorpay_order_id = models.CharField(max_length=100, null=True, blank=True)
+    razorpay_order_amount = models.PositiveIntegerField(null=True, blank=True,
+                                                        help_text="Amount of the Razorpay order in paise")
 
     def __str__(self):
         return f"Invoice {self.id} - {self.user.username}"
 
     class Meta:
         ordering = ['-issue_date']
+        indexes = [
+            # keyset pagination of a user's invoices
+            models.Index(fields=['user', '-issue_date', '-id'], name='invoice_user_issue_idx'),
+            # mark_overdue_invoices and the reminders, paid invoices are left out of the index
+            models.Index(fields=['status', 'due_date'], condition=models.Q(status__in=['unpaid', 'overdue']),
+                         name='invoice_open_due_idx'),
+            # payment verification and webhooks look invoices up by their order
+            models.Index(fields=['razorpay_order_id'], condition=models.Q(razorpay_order_id__isnull=False),
+                         name='invoice_order_idx'),
+            # reconciliation pages through the open invoices with an order
+            models.Index(fields=['id'], condition=models.Q(status__in=['unpaid', 'overdue'],
+                                                           razorpay_order_id__isnull=False),
+                         name='invoice_pending_order_idx'),
+            # the archival job moves the oldest paid invoices first
+            models.Index(fields=['issue_date'], condition=models.Q(status='paid'), name='invoice_paid_issue_idx'),
+        ]
+        constraints = [
+            # one invoice per billing cycle, also across concurrent billing runs
+            models.UniqueConstraint(fields=['subscription', 'billing_period_start'], name='unique_invoice_billing_cycle'),
+        ]
+
+
+class InvoiceReminder(models.Model):
+    invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='reminders')
+    step = models.PositiveSmallIntegerField(help_text="Escalation step of the reminder, 0 for the first one")
+    sent_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Reminder {self.step} for invoice {self.invoice_id}"
+
+    class Meta:
+        ordering = ['-sent_at']
+        constraints = [
+            models.UniqueConstraint(fields=['invoice', 'step'], name='unique_invoice_reminder_step'),
+        ]
+
+
+class WebhookEvent(models.Model):
+    """Inbox of the received Razorpay webhooks, rows are only added and marked processed."""
+    event_id = models.CharField(max_length=100, unique=True, help_text="X-Razorpay-Event-Id, deduplicates retries")
+    event = models.CharField(max_length=100)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.event} {self.event_id}"
+
+    class Meta:
+        ordering = ['-received_at']
+        indexes = [
+            # the worker only reads the events that are not processed yet
+            models.Index(fields=['received_at'], condition=models.Q(processed_at__isnull=True),
+                         name='webhook_event_pending_idx'),
+        ]
+
+
+class ReconciliationCheckpoint(models.Model):
+    """Where a paged job stopped, so the next run resumes after the last processed row."""
+    name = models.CharField(max_length=100, unique=True)
+    last_id = models.UUIDField(blank=True, null=True, help_text="Last processed id, empty to start from the beginning")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} at {self.last_id}"
+
+
+class DailyRevenue(models.Model):
+    """Revenue rollup of a plan for one day, folded from the RevenueDelta rows by api/rollups.py."""
+    day = models.DateField()
+    plan = models.ForeignKey(Plan, on_delete=models.CASCADE, related_name='daily_revenue')
+    invoiced = models.DecimalField(max_digits=14, decimal_places=2, default=0,
+                                   help_text="Amount of the invoices issued that day")
+    collected = models.DecimalField(max_digits=14, decimal_places=2, default=0,
+                                    help_text="Amount of the invoices paid that day")
+    outstanding = models.DecimalField(max_digits=14, decimal_places=2, default=0,
+                                      help_text="Amount of the invoices issued that day that are not paid yet")
+    active_subscribers = models.IntegerField(blank=True, null=True,
+                                             help_text="Active subscriptions at the end of the day, empty when unchanged")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.plan_id} on {self.day}"
+
+    class Meta:
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'plan'], name='unique_daily_revenue'),
+        ]
+
+
+class RevenueDelta(models.Model):
+    """
+    Change to the DailyRevenue row of a plan, appended by the transaction that changed an
+    invoice or a subscription. Appending never waits on other writers, the rows are folded
+    into DailyRevenue and deleted by the fold_revenue_rollups task.
+    """
+    day = models.DateField()
+    plan = models.ForeignKey(Plan, on_delete=models.CASCADE, related_name='+')
+    invoiced = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    collected = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    outstanding = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    active_subscribers = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.plan_id} on {self.day}"
+
+
+class ReadOnlyError(Exception):
+    """Raised when saving or deleting a row of a read only model."""
+
+
+class ArchivedInvoice(models.Model):
+    """
+    Paid invoices moved out of the invoice table by the archival job, read only.
+    The table is partitioned by issue_date month in Postgres, see api/archive.py.
+    """
+    id = models.UUIDField(primary_key=True)
+    user = models.ForeignKey(MyUser, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    subscription = models.ForeignKey(Subscription, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    plan = models.ForeignKey(Plan, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    issue_date = models.DateTimeField()
+    due_date = models.DateTimeField()
+    status = models.CharField(max_length=20)
+    paid_at = models.DateTimeField(blank=True, null=True)
+    billing_period_start = models.DateField(blank=True, null=True)
+    billing_period_end = models.DateField(blank=True, null=True)
+    razorpay_order_id = models.CharField(max_length=100, null=True, blank=True)
+    razorpay_order_amount = models.PositiveIntegerField(null=True, blank=True)
+    archived_at = models.DateTimeField()
+
+    def save(self, *args, **kwargs):
+        raise ReadOnlyError("Archived invoices are read only")
+
+    def delete(self, *args, **kwargs):
+        raise ReadOnlyError("Archived invoices are read only")
+
+    def __str__(self):
+        return f"Archived invoice {self.id}"
+
+    class Meta:
+        # created by migration 0019 as a partitioned table, partitions are managed by api/archive.py
+        managed = False
+        db_table = 'api_invoice_archive'
+        ordering = ['-issue_date']
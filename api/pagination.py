@@ -0,0 +1,90 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPaginator:
+    """
+    Keyset (cursor) pagination, newest first, on a datetime field and the primary key.
+
+    A page is fetched with `WHERE (field, id) < (cursor)` instead of an OFFSET, so
+    every page costs the same however deep the client pages, and rows inserted
+    while paging never shift the following pages. The cursor is the opaque
+    base64 encoded (field, id) of the last row of the previous page.
+    """
+
+    def __init__(self, field):
+        self.field = field
+
+    def paginate(self, queryset, request):
+        """
+        Return the rows of the requested page and the cursor of the next page,
+        None on the last page.
+        Raises InvalidCursor for a malformed cursor or page size.
+        """
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(f'-{self.field}', '-id')
+
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            value, pk = self.decode_cursor(cursor)
+            try:
+                pk = queryset.model._meta.pk.to_python(pk)
+            except ValidationError:
+                raise InvalidCursor("Invalid cursor")
+            queryset = queryset.filter(Q(**{f'{self.field}__lt': value}) | Q(**{self.field: value, 'id__lt': pk}))
+
+        # one extra row tells whether there is a next page
+        rows = list(queryset[:page_size + 1])
+        if len(rows) <= page_size:
+            return rows, None
+        rows = rows[:page_size]
+        return rows, self.encode_cursor(rows[-1])
+
+    def get_page_size(self, request):
+        page_size = request.query_params.get('page_size')
+        if page_size is None:
+            return settings.API_PAGE_SIZE
+        try:
+            page_size = int(page_size)
+        except ValueError:
+            raise InvalidCursor("page_size must be a number")
+        if page_size < 1:
+            raise InvalidCursor("page_size must be positive")
+        return min(page_size, settings.API_MAX_PAGE_SIZE)
+
+    def encode_cursor(self, row):
+        # model instances or values() rows
+        if isinstance(row, dict):
+            value, pk = row[self.field], row['id']
+        else:
+            value, pk = getattr(row, self.field), row.pk
+        position = [value.isoformat(), str(pk)]
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            value = parse_datetime(value)
+        except (binascii.Error, UnicodeError, ValueError, TypeError):
+            raise InvalidCursor("Invalid cursor")
+        if value is None:
+            raise InvalidCursor("Invalid cursor")
+        return value, pk
+
+    def get_headers(self, request, next_cursor):
+        if next_cursor is None:
+            return {}
+        query = request.GET.copy()
+        query['cursor'] = next_cursor
+        next_url = request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+        return {'Link': f'<{next_url}>; rel="next"', 'X-Next-Cursor': next_cursor}
@@ -0,0 +1,82 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from razorpay.errors import BadRequestError, GatewayError, ServerError
+
+from .gateway import get_razorpay_client
+from .models import Invoice, ReconciliationCheckpoint
+from .rollups import record_invoices_paid
+
+CHECKPOINT_NAME = 'razorpay-payments'
+# returned by check_order when the gateway could not be asked, the order is checked again next pass
+GATEWAY_ERROR = object()
+
+
+def check_order(client, order_id):
+    """Return when the payment of an order was captured, None when the order is not paid."""
+    try:
+        payments = client.order.payments(order_id).get('items', [])
+    except (BadRequestError, GatewayError, ServerError, requests.exceptions.RequestException, ValueError):
+        return GATEWAY_ERROR
+    captured = [payment['created_at'] for payment in payments if payment.get('status') == 'captured']
+    return datetime.fromtimestamp(min(captured), tz=dt_timezone.utc) if captured else None
+
+
+def reconcile_orders(page_size=None, concurrency=None, time_limit=None, client=None):
+    """
+    Find unpaid invoices whose Razorpay order was paid anyway, e.g. when the client never
+    called verify-payment, and mark them as paid.
+
+    Invoices with an order are read in pages by id, the orders of a page are checked on the
+    gateway `concurrency` at a time, and the paid ones are applied with one bulk update per
+    page together with the checkpoint. A run stops after `time_limit` seconds and the next
+    one resumes from the checkpoint, a complete pass resets it.
+    """
+    page_size = page_size or settings.RECONCILE_PAGE_SIZE
+    concurrency = concurrency or settings.RECONCILE_CONCURRENCY
+    time_limit = time_limit or settings.RECONCILE_TIME_LIMIT
+    client = client or get_razorpay_client()
+
+    checkpoint, _ = ReconciliationCheckpoint.objects.get_or_create(name=CHECKPOINT_NAME)
+    pending = (Invoice.objects.filter(status__in=['unpaid', 'overdue'], razorpay_order_id__isnull=False)
+               .exclude(razorpay_order_id='').order_by('id'))
+    started = time.monotonic()
+    result = {'checked': 0, 'paid': 0, 'errors': 0, 'complete': False}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while time.monotonic() - started < time_limit:
+            page = pending.filter(id__gt=checkpoint.last_id) if checkpoint.last_id else pending
+            page = list(page.values_list('id', 'razorpay_order_id')[:page_size])
+            if not page:
+                checkpoint.last_id = None
+                checkpoint.save()
+                result['complete'] = True
+                break
+
+            paid_at = {}
+            captured = executor.map(lambda order_id: check_order(client, order_id), [order for _, order in page])
+            for (invoice_id, _), captured_at in zip(page, captured):
+                if captured_at is GATEWAY_ERROR:
+                    result['errors'] += 1
+                elif captured_at is not None:
+                    paid_at[invoice_id] = captured_at
+
+            with transaction.atomic():
+                # skip the invoices paid in the meantime by verify-payment or a webhook
+                invoices = list(Invoice.objects.filter(id__in=paid_at).exclude(status='paid')
+                                .select_for_update().only('id', 'plan_id', 'amount', 'issue_date'))
+                for invoice in invoices:
+                    invoice.status = 'paid'
+                    invoice.paid_at = paid_at[invoice.id]
+                Invoice.objects.bulk_update(invoices, ['status', 'paid_at'])
+                record_invoices_paid(invoices)
+                checkpoint.last_id = page[-1][0]
+                checkpoint.save()
+
+            result['checked'] += len(page)
+            result['paid'] += len(invoices)
+    return result
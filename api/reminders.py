@@ -0,0 +1,70 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max, Q
+
+from .billing import chunked
+from .models import Invoice, InvoiceReminder
+
+
+def reminder_step(due_date, now, schedule):
+    """
+    Return the latest escalation step of `schedule` that is due for an invoice,
+    or None if the invoice is not due for any reminder yet.
+    If a run was missed only the latest step is sent, not every step in between.
+    """
+    step = None
+    for index, days in enumerate(schedule):
+        if now >= due_date + timedelta(days=days):
+            step = index
+    return step
+
+
+def collect_due_reminders(now, schedule=None):
+    """
+    Find the overdue invoices of active subscriptions that are due for their next
+    reminder, record them in the reminder ledger and return one digest per user:
+    {"user_email": ..., "subscription_ids": [...], "invoice_ids": [...]}.
+    Only the reminders this run recorded are returned, a step already recorded by a
+    concurrent run is left to that run.
+    """
+    schedule = schedule or settings.REMINDER_SCHEDULE_DAYS
+    final_step = len(schedule) - 1
+    overdue = (
+        Invoice.objects.filter(status='overdue', subscription__status='active',
+                               due_date__lte=now - timedelta(days=schedule[0]))
+        .annotate(last_step=Max('reminders__step'))
+        # invoices that already got the last reminder are done
+        .filter(Q(last_step__isnull=True) | Q(last_step__lt=final_step))
+        .values_list('id', 'due_date', 'last_step', 'user__email', 'subscription_id')
+    )
+
+    due = []
+    for invoice_id, due_date, last_step, user_email, subscription_id in overdue.iterator():
+        step = reminder_step(due_date, now, schedule)
+        if step is None or (last_step is not None and step <= last_step):
+            continue
+        due.append((invoice_id, step, user_email, subscription_id))
+
+    recorded = set()
+    with connection.cursor() as cursor:
+        for rows in chunked(due, settings.INVOICE_BATCH_SIZE):
+            # a concurrent run may have recorded the same step already, it sends that reminder
+            cursor.execute(
+                f'INSERT INTO {InvoiceReminder._meta.db_table} (invoice_id, step, sent_at) '
+                f'VALUES {", ".join(["(%s, %s, %s)"] * len(rows))} '
+                f'ON CONFLICT (invoice_id, step) DO NOTHING RETURNING invoice_id',
+                [value for invoice_id, step, _, _ in rows for value in (invoice_id, step, now)],
+            )
+            recorded.update(invoice_id for invoice_id, in cursor.fetchall())
+
+    digests = {}
+    for invoice_id, step, user_email, subscription_id in due:
+        if invoice_id not in recorded:
+            continue
+        digest = digests.setdefault(user_email, {'user_email': user_email, 'subscription_ids': [], 'invoice_ids': []})
+        if str(subscription_id) not in digest['subscription_ids']:
+            digest['subscription_ids'].append(str(subscription_id))
+        digest['invoice_ids'].append(str(invoice_id))
+    return list(digests.values())
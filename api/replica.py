@@ -0,0 +1,70 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# set while a read only view or report runs, {'pinned': True} once it wrote to the primary
+_replica_reads = ContextVar('replica_reads', default=None)
+
+
+def read_database():
+    """Alias reports read from, the replica when one is configured."""
+    return settings.READ_REPLICA_ALIAS or DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def read_from_replica():
+    """Send the reads of the block to the replica, until the block writes something."""
+    token = _replica_reads.set({'pinned': False})
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Routes the reads made inside read_from_replica() to READ_REPLICA_ALIAS. Everything
+    else, the writes and the reads after a write or inside a transaction, uses the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _replica_reads.get()
+        if (settings.READ_REPLICA_ALIAS and state and not state['pinned']
+                and not connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return settings.READ_REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _replica_reads.get()
+        if state:
+            # the replica may not have the write yet, read it back from the primary
+            state['pinned'] = True
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # both databases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the replica follows the primary
+        return False if db == settings.READ_REPLICA_ALIAS else None
+
+
+class ReplicaReadMixin:
+    """
+    Serve the handler of a read only APIView from the replica. Authentication runs before
+    on the primary, so a user who just signed up is found.
+    """
+    _replica_token = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._replica_token = _replica_reads.set({'pinned': False})
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if self._replica_token is not None:
+            _replica_reads.reset(self._replica_token)
+            self._replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
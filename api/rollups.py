@@ -0,0 +1,256 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Min, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import ArchivedInvoice, DailyRevenue, Invoice, Plan, RevenueDelta, Subscription
+
+ROLLUP_TABLE = DailyRevenue._meta.db_table
+DELTA_TABLE = RevenueDelta._meta.db_table
+CENT = Decimal('0.01')
+# longest range of days the metrics endpoint returns
+METRICS_MAX_DAYS = 366
+
+
+def _flows():
+    """{(day, plan id): [invoiced, collected, outstanding]}"""
+    return defaultdict(lambda: [Decimal(0), Decimal(0), Decimal(0)])
+
+
+def _write_flows(flows, replace=False):
+    """
+    Add the flows to their rollup rows, or overwrite them with `replace`, with one upsert
+    per INVOICE_BATCH_SIZE rows. The rows are written in (day, plan) order so concurrent upserts never deadlock.
+    """
+    now = timezone.now()
+    update = ', '.join(
+        f'{column} = EXCLUDED.{column}' if replace else f'{column} = {ROLLUP_TABLE}.{column} + EXCLUDED.{column}'
+        for column in ['invoiced', 'collected', 'outstanding']
+    )
+    items = sorted(flows.items())
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), settings.INVOICE_BATCH_SIZE):
+            rows = items[start:start + settings.INVOICE_BATCH_SIZE]
+            params = []
+            for (day, plan_id), (invoiced, collected, outstanding) in rows:
+                params += [day, plan_id, invoiced, collected, outstanding, now]
+            cursor.execute(
+                f'INSERT INTO {ROLLUP_TABLE} (day, plan_id, invoiced, collected, outstanding, updated_at) '
+                f'VALUES {", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(rows))} '
+                f'ON CONFLICT (day, plan_id) DO UPDATE SET {update}, updated_at = EXCLUDED.updated_at',
+                params,
+            )
+
+
+def _append_deltas(flows=(), subscribers=()):
+    """Append the flows and the subscriber changes ({(day, plan id): change}) as RevenueDelta rows, one insert."""
+    RevenueDelta.objects.bulk_create(
+        [RevenueDelta(day=day, plan_id=plan_id, invoiced=invoiced, collected=collected, outstanding=outstanding)
+         for (day, plan_id), (invoiced, collected, outstanding) in dict(flows).items()]
+        + [RevenueDelta(day=day, plan_id=plan_id, active_subscribers=change)
+           for (day, plan_id), change in dict(subscribers).items()],
+        batch_size=settings.INVOICE_BATCH_SIZE,
+    )
+
+
+def record_invoices_created(invoices):
+    """Add new invoices to the rollups of their issue day, and of their payment day if already paid."""
+    flows = _flows()
+    for invoice in invoices:
+        flows[timezone.localdate(invoice.issue_date), invoice.plan_id][0] += invoice.amount
+        if invoice.status == 'paid':
+            flows[timezone.localdate(invoice.paid_at), invoice.plan_id][1] += invoice.amount
+        else:
+            flows[timezone.localdate(invoice.issue_date), invoice.plan_id][2] += invoice.amount
+    _append_deltas(flows=flows)
+
+
+def record_invoices_paid(invoices):
+    """Move invoices that were just paid from outstanding on their issue day to collected on their payment day."""
+    flows = _flows()
+    for invoice in invoices:
+        flows[timezone.localdate(invoice.paid_at), invoice.plan_id][1] += invoice.amount
+        flows[timezone.localdate(invoice.issue_date), invoice.plan_id][2] -= invoice.amount
+    _append_deltas(flows=flows)
+
+
+def record_subscription_changes(plan_ids, delta):
+    """Add `delta` to today's active subscribers of every plan in `plan_ids` (once per occurrence)."""
+    today = timezone.localdate()
+    _append_deltas(subscribers={(today, plan_id): delta * count for plan_id, count in Counter(plan_ids).items()})
+
+
+def _apply_subscriber_changes(changes):
+    """
+    Add the subscriber changes ({(day, plan id): change}) to the counts of their day, a
+    day without a count starts from the last known count, and to the later counts.
+    """
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        for (day, plan_id), change in sorted(changes.items()):
+            if not change:
+                continue
+            cursor.execute(
+                f'INSERT INTO {ROLLUP_TABLE} (day, plan_id, invoiced, collected, outstanding, active_subscribers, '
+                f'updated_at) VALUES (%s, %s, 0, 0, 0, COALESCE((SELECT active_subscribers FROM {ROLLUP_TABLE} '
+                f'WHERE plan_id = %s AND day < %s AND active_subscribers IS NOT NULL ORDER BY day DESC LIMIT 1), 0) '
+                f'+ %s, %s) '
+                f'ON CONFLICT (day, plan_id) DO UPDATE SET active_subscribers = CASE '
+                f'WHEN {ROLLUP_TABLE}.active_subscribers IS NULL THEN EXCLUDED.active_subscribers '
+                f'ELSE {ROLLUP_TABLE}.active_subscribers + %s END, updated_at = EXCLUDED.updated_at',
+                [day, plan_id, plan_id, day, change, now, change],
+            )
+            cursor.execute(
+                f'UPDATE {ROLLUP_TABLE} SET active_subscribers = active_subscribers + %s, updated_at = %s '
+                f'WHERE plan_id = %s AND day > %s AND active_subscribers IS NOT NULL',
+                [change, now, plan_id, day],
+            )
+
+
+def fold_revenue_deltas(batch_size=None):
+    """
+    Fold the appended RevenueDelta rows into DailyRevenue and delete them, `batch_size`
+    at a time, one transaction per batch. Only the folds write the rollup rows, so the
+    transactions of the views and tasks never wait on them. Returns the number of deltas folded.
+    """
+    batch_size = batch_size or settings.INVOICE_BATCH_SIZE
+    folded = 0
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            # one fold at a time, the rollups stay readable
+            cursor.execute(f'LOCK TABLE {ROLLUP_TABLE} IN SHARE ROW EXCLUSIVE MODE')
+            cursor.execute(
+                f'DELETE FROM {DELTA_TABLE} WHERE id IN (SELECT id FROM {DELTA_TABLE} ORDER BY id LIMIT %s) '
+                f'RETURNING day, plan_id, invoiced, collected, outstanding, active_subscribers',
+                [batch_size],
+            )
+            rows = cursor.fetchall()
+            flows = _flows()
+            subscribers = Counter()
+            for day, plan_id, invoiced, collected, outstanding, active_subscribers in rows:
+                flow = flows[day, plan_id]
+                flow[0] += invoiced
+                flow[1] += collected
+                flow[2] += outstanding
+                subscribers[day, plan_id] += active_subscribers
+            _write_flows({key: flow for key, flow in flows.items() if any(flow)})
+            _apply_subscriber_changes(subscribers)
+        folded += len(rows)
+        if len(rows) < batch_size:
+            return folded
+
+
+def rebuild_revenue_rollups():
+    """
+    Aggregate the whole invoice history again, archived invoices included, and overwrite
+    the rollups with it. The days before the oldest invoice left are kept, their invoices
+    were exported with their archive partition. Today's active subscribers are counted
+    again, earlier counts can not be recovered and are kept. Returns the number of rows written.
+
+    The rebuild reads one REPEATABLE READ snapshot and drops the deltas visible in it, the
+    aggregate includes them. Deltas appended meanwhile are not in the snapshot, they stay
+    and are folded on top of the rebuild, so no change is counted twice or missed and the
+    writers never wait for the rebuild. Called inside a transaction, it uses its isolation level.
+    """
+    outermost = not connection.in_atomic_block
+    with transaction.atomic():
+        return _rebuild_revenue_rollups(outermost)
+
+
+def _rebuild_revenue_rollups(outermost):
+    with connection.cursor() as cursor:
+        if outermost:
+            cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        # the folds wait, taken before the snapshot so it includes the last fold
+        cursor.execute(f'LOCK TABLE {ROLLUP_TABLE} IN SHARE ROW EXCLUSIVE MODE')
+        cursor.execute(f'SELECT max(id) FROM {DELTA_TABLE}')
+        last_delta, = cursor.fetchone()
+        if last_delta is not None:
+            # a delta with a lower id committed after the snapshot is not visible here and stays too
+            cursor.execute(f'DELETE FROM {DELTA_TABLE} WHERE id <= %s', [last_delta])
+    flows = _flows()
+    oldest = None
+    for invoices in [Invoice.objects.all(), ArchivedInvoice.objects.all()]:
+        first = invoices.aggregate(first=Min('issue_date'))['first']
+        if first is not None:
+            oldest = min(oldest or first, first)
+        issued = (invoices.annotate(day=TruncDate('issue_date')).values('day', 'plan_id').order_by()
+                  .annotate(invoiced=Sum('amount'), outstanding=Sum('amount', filter=~Q(status='paid'))))
+        for row in issued.iterator():
+            flows[row['day'], row['plan_id']][0] += row['invoiced']
+            flows[row['day'], row['plan_id']][2] += row['outstanding'] or 0
+        paid = (invoices.filter(status='paid', paid_at__isnull=False).annotate(day=TruncDate('paid_at'))
+                .values('day', 'plan_id').order_by().annotate(collected=Sum('amount')))
+        for row in paid.iterator():
+            flows[row['day'], row['plan_id']][1] += row['collected']
+
+    if oldest is not None:
+        DailyRevenue.objects.filter(day__gte=timezone.localdate(oldest)).update(invoiced=0, collected=0, outstanding=0)
+    _write_flows(flows, replace=True)
+
+    today = timezone.localdate()
+    active = dict(Subscription.objects.filter(status='active').values('plan_id').order_by()
+                  .annotate(count=Count('id')).values_list('plan_id', 'count'))
+    for plan_id in Plan.objects.values_list('id', flat=True):
+        DailyRevenue.objects.update_or_create(day=today, plan_id=plan_id,
+                                              defaults={'active_subscribers': active.get(plan_id, 0)})
+    return len(flows)
+
+
+def revenue_metrics(since, until, plan=None):
+    """
+    Daily revenue of every plan between `since` and `until` (inclusive) read from the
+    rollups only, with the active subscribers carried over the days they did not change,
+    and the MRR/ARR of the active subscribers at `until`.
+    """
+    rows = DailyRevenue.objects.filter(day__range=(since, until))
+    before = DailyRevenue.objects.filter(day__lt=since, active_subscribers__isnull=False)
+    plans = Plan.objects.all()
+    if plan:
+        rows, before, plans = rows.filter(plan_id=plan), before.filter(plan_id=plan), plans.filter(id=plan)
+
+    daily = {(row['plan_id'], row['day']): row for row in rows.values(
+        'plan_id', 'day', 'invoiced', 'collected', 'outstanding', 'active_subscribers')}
+    # the last count before the range of every plan
+    active = dict(before.order_by('plan_id', '-day').distinct('plan_id').values_list('plan_id', 'active_subscribers'))
+
+    totals = {'invoiced': Decimal(0), 'collected': Decimal(0), 'outstanding': Decimal(0), 'active_subscribers': 0}
+    result = []
+    for plan_id, name, price, duration in plans.order_by('id').values_list('id', 'name', 'price', 'duration'):
+        days = []
+        day = since
+        while day <= until:
+            row = daily.get((plan_id, day), {})
+            if row.get('active_subscribers') is not None:
+                active[plan_id] = row['active_subscribers']
+            days.append({
+                'day': day,
+                'invoiced': row.get('invoiced', Decimal(0)),
+                'collected': row.get('collected', Decimal(0)),
+                'outstanding': row.get('outstanding', Decimal(0)),
+                'active_subscribers': active.get(plan_id, 0),
+            })
+            day += timedelta(days=1)
+        # plans without any activity in the range are left out
+        if not any(entry['invoiced'] or entry['collected'] or entry['active_subscribers'] for entry in days):
+            continue
+        subscribers = active.get(plan_id, 0)
+        for key in ['invoiced', 'collected', 'outstanding']:
+            totals[key] += sum(day[key] for day in days)
+        totals['active_subscribers'] += subscribers
+        result.append({
+            'plan_id': plan_id,
+            'plan_name': name,
+            'active_subscribers': subscribers,
+            # plans are billed every `duration` months
+            'mrr': (price * subscribers / duration).quantize(CENT),
+            'days': days,
+        })
+
+    mrr = sum((plan['mrr'] for plan in result), Decimal(0))
+    return {'since': since, 'until': until, 'mrr': mrr, 'arr': mrr * 12, 'totals': totals, 'plans': result}
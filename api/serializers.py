@@ -1,4 +1,10 @@
-from rest_framework import serializers
+from functools import partial
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
 from .models import MyUser, Subscription, Plan, Invoice
 
 
@@ -49,3 +55,100 @@ class InvoiceSerializer(serializers.ModelSerializer):
     class Meta:
         model = Invoice
         fields = ['id', 'user', 'subscription', 'amount', 'issue_date', 'due_date', 'status', 'razorpay_order_id']
+
+
+def iso_datetime(value, tz):
+    """DRF's ISO 8601 representation of an aware datetime in `tz`."""
+    value = value.astimezone(tz).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+class FastReadSerializer:
+    """
+    Read-only fast path of a ModelSerializer for list endpoints.
+
+    Builds the same JSON shape as `serializer_class(instances, many=True).data`
+    straight from `values()` rows: the field mapping is worked out once from the
+    serializer's fields, then every row is converted with plain dict lookups and
+    the DRF field's own `to_representation` where the type needs converting
+    (decimals), without a serializer object per row. Datetimes are converted to
+    the current time zone, which is looked up once per call instead of per value.
+    Nested serializers must follow non-null foreign keys.
+    """
+    # fields whose database value already is their representation
+    PASSTHROUGH_FIELDS = (serializers.CharField, serializers.IntegerField, serializers.BooleanField,
+                          serializers.ChoiceField, serializers.PrimaryKeyRelatedField)
+    # placeholder for the datetime conversion, bound to the current time zone in serialize()
+    ISO_DATETIME = object()
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+
+    @cached_property
+    def mapping(self):
+        return self.build_mapping(self.serializer_class(), prefix='')
+
+    def build_mapping(self, serializer, prefix):
+        """List of (key, lookup, convert, nested mapping) in the serializer's field order."""
+        mapping = []
+        for key, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            lookup = f'{prefix}{field.source}'
+            if isinstance(field, serializers.BaseSerializer):
+                mapping.append((key, None, None, self.build_mapping(field, prefix=f'{lookup}__')))
+            elif isinstance(field, self.PASSTHROUGH_FIELDS):
+                mapping.append((key, lookup, None, None))
+            elif isinstance(field, serializers.UUIDField) and field.uuid_format == 'hex_verbose':
+                mapping.append((key, lookup, str, None))
+            elif (isinstance(field, serializers.DateTimeField) and settings.USE_TZ and not hasattr(field, 'timezone')
+                  and getattr(field, 'format', api_settings.DATETIME_FORMAT).lower() == ISO_8601):
+                mapping.append((key, lookup, self.ISO_DATETIME, None))
+            else:
+                mapping.append((key, lookup, field.to_representation, None))
+        return mapping
+
+    @cached_property
+    def lookups(self):
+        lookups = []
+        stack = [self.mapping]
+        while stack:
+            for _, lookup, _, nested in stack.pop():
+                if nested is None:
+                    lookups.append(lookup)
+                else:
+                    stack.append(nested)
+        return lookups
+
+    def get_queryset(self, queryset):
+        """The `values()` rows the serializer reads, including the nested relations."""
+        return queryset.values(*self.lookups)
+
+    def bind(self, mapping, tz):
+        convert_datetime = partial(iso_datetime, tz=tz)
+        return [
+            (key, lookup, convert_datetime if convert is self.ISO_DATETIME else convert,
+             nested and self.bind(nested, tz))
+            for key, lookup, convert, nested in mapping
+        ]
+
+    def to_representation(self, row, mapping):
+        data = {}
+        for key, lookup, convert, nested in mapping:
+            if nested is not None:
+                data[key] = self.to_representation(row, nested)
+                continue
+            value = row[lookup]
+            data[key] = value if convert is None or value is None else convert(value)
+        return data
+
+    def serialize(self, rows):
+        mapping = self.bind(self.mapping, timezone.get_current_timezone())
+        return [self.to_representation(row, mapping) for row in rows]
+
+
+plan_fast_serializer = FastReadSerializer(PlanSerializer)
+subscription_fast_serializer = FastReadSerializer(SubscriptionSerializer)
+invoice_fast_serializer = FastReadSerializer(InvoiceSerializer)
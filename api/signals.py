@@ -0,0 +1,26 @@
+from django.core.signals import setting_changed
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import invalidate_cached_user
+from .catalog import invalidate_plan_catalog
+from .gateway import reset_razorpay_client
+from .models import MyUser, Plan
+
+
+@receiver([post_save, post_delete], sender=Plan)
+def plan_changed(sender, **kwargs):
+    invalidate_plan_catalog()
+
+
+@receiver([post_save, post_delete], sender=MyUser)
+def user_changed(sender, instance, **kwargs):
+    # covers deactivation and password changes, both are saved on the user
+    invalidate_cached_user(instance)
+
+
+@receiver(setting_changed)
+def gateway_setting_changed(sender, setting, **kwargs):
+    # e.g. tests pointing the client at a stub gateway with override_settings
+    if setting.startswith('RAZORPAY_'):
+        reset_razorpay_client()
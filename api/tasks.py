@@ -1,94 +1,167 @@
-from celery import shared_task
+from celery import chord, shared_task
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
-from datetime import timedelta
+from datetime import date, timedelta
 from .models import Subscription, Invoice
-from dateutil.relativedelta import relativedelta
-from api.mails.send_subsciption_overdue_email import send_subscription_overdue_email
+from .archive import archive_invoices, create_archive_partitions, detach_archive_partitions
+from .billing import chunked, filter_shard, generate_invoices, generate_missed_invoices
+from .reconciliation import reconcile_orders
+from .reminders import collect_due_reminders
+from .rollups import fold_revenue_deltas, record_subscription_changes
+from .webhooks import apply_webhook_events
+from api.mails.send_subsciption_overdue_email import send_subscription_overdue_emails
 
 
 @shared_task
-def generate_daily_invoice():
+def generate_daily_invoice(batch_size=None):
     today = timezone.now().date()
     active_subs = Subscription.objects.filter(status="active")
 
-    for sub in active_subs:
-        plan_duration_months = sub.plan.duration  # duration in months
-        start_date = sub.start_date.date()
-        # end_date = sub.end_date.date()
-
-        # if subscription is not active today, skip it
-        # if today < start_date or today > end_date:
-        if today < start_date:
-            continue
-
-        ''' 
-        Figure out which billing cycle today is in.
-        example-
-        start_date = Jan 21, 2025
-        today = May 31, 2025
-        months_since_start = (2025-2025) * 12 + (5-1) = 4
-        '''
-        months_since_start = (today.year - start_date.year) * 12 + (today.month - start_date.month)
-
-        '''
-        4 % 1 = 0 means we are at the start of a billing cycle.
-        4 % 3 = 1 means we are in the middle of a billing cycle.
-        '''
-        if months_since_start % plan_duration_months != 0:
-            continue  # we are not at the start of a billing cycle, used the basic modulus operation to check
-
-        '''
-        if we are in the start of a billing cycle, calculate its end of billing cycle
-        here we calculate the next billing cycle start and end dates.
-        '''
-        cycle_start = start_date + relativedelta(months=+months_since_start)
-        cycle_end = cycle_start + relativedelta(months=+plan_duration_months)
-
-        # Check if invoice already exists for this cycle # mostly this case will not happen approx 99.9% miss
-        if Invoice.objects.filter(subscription=sub, billing_period_start=cycle_start).exists():
-            continue
-
-        # Creating the invoice for the new billing cycle
-        Invoice.objects.create(
-            user=sub.user,
-            subscription=sub,
-            plan=sub.plan,
-            amount=sub.plan.price,
-            issue_date=timezone.now(),
-            due_date=timezone.now() + timedelta(days=5),
-            status='unpaid',
-            billing_period_start=cycle_start,  # new billing cycle start date
-            billing_period_end=cycle_end,  # new billing cycle end
-        )
-        sub.end_date = cycle_end  # update subscription end date
-        sub.save()  # save the updated subscription
-        print(f"Invoice created for user: {sub.user.username} ({cycle_start} - {cycle_end})")
+    # invoices are built in memory and written in batches, see api.billing.generate_invoices
+    result = generate_invoices(active_subs, today, batch_size=batch_size)
+    print(f"Invoices created: {result['created']} ({result['scanned']} subscriptions scanned)")
+    return result
+
+
+@shared_task
+def generate_daily_invoice_sharded(shards=None, batch_size=None):
+    '''
+    Fan-out version of generate_daily_invoice.
+    The subscriptions are split into `shards` primary key ranges, every range is billed
+    by its own task and summarize_invoice_shards reports the totals once all of them finished.
+    Needs a celery result backend (CELERY_RESULT_BACKEND).
+    '''
+    shards = shards or settings.INVOICE_SHARDS
+    # every shard bills the same day even if the run crosses midnight
+    today = timezone.now().date().isoformat()
+    header = [generate_invoice_shard.s(shard, shards, today, batch_size) for shard in range(shards)]
+    result = chord(header)(summarize_invoice_shards.s())
+    print(f"Dispatched {shards} invoice shards for {today}")
+    return result.id
+
+
+@shared_task
+def generate_invoice_shard(shard, shards, today=None, batch_size=None):
+    today = date.fromisoformat(today) if today else timezone.now().date()
+    active_subs = filter_shard(Subscription.objects.filter(status="active"), shard, shards)
+
+    result = generate_invoices(active_subs, today, batch_size=batch_size)
+    print(f"Shard {shard + 1}/{shards}: {result['created']} invoices created ({result['scanned']} subscriptions scanned)")
+    return {'shard': shard, **result}
+
+
+@shared_task
+def summarize_invoice_shards(results):
+    totals = {
+        'shards': len(results),
+        'scanned': sum(result['scanned'] for result in results),
+        'created': sum(result['created'] for result in results),
+    }
+    print(f"Invoices created: {totals['created']} ({totals['scanned']} subscriptions scanned in {totals['shards']} shards)")
+    return totals
+
+
+@shared_task
+def backfill_invoices(since, until=None, batch_size=None):
+    '''
+    Catch up on billing runs that were missed, e.g. while beat or the workers were down.
+    Creates the missing invoices of every billing cycle that started between `since` and
+    `until` (ISO dates, `until` defaults to today). Safe to run again for the same range.
+    '''
+    today = timezone.now().date()
+    since = date.fromisoformat(since)
+    until = min(date.fromisoformat(until), today) if until else today
+    active_subs = Subscription.objects.filter(status="active")
+
+    result = generate_missed_invoices(active_subs, since, until, batch_size=batch_size)
+    print(f"Backfill {since} - {until}: {result['created']} invoices created ({result['scanned']} subscriptions scanned)")
+    return result
 
 
 @shared_task
 def mark_overdue_invoices():
     now = timezone.now()
-    invoices = Invoice.objects.filter(status='unpaid', due_date__lt=now)
-    for inv in invoices:
-        inv.status = 'overdue'
-        inv.save()
-        print(f'Invoice {inv.id} marked as overdue.')
-        # cancel subscription if overdue for more than 7 days
-        if now - inv.due_date > timedelta(days=7):
-            sub = inv.subscription
-            sub.status = 'cancelled'
-            sub.save()
-            # send mail or notification to user about subscription expired
-            print(f'Subscription {sub.id} for user {sub.user.username} cancelled due to overdue invoice.')
+    batch_size = settings.INVOICE_BATCH_SIZE
+
+    # lock the rows we change so concurrent runs and payments don't step on each other
+    with transaction.atomic():
+        overdue_ids = list(
+            Invoice.objects.filter(status='unpaid', due_date__lt=now)
+            .select_for_update(skip_locked=True)
+            .values_list('id', flat=True)
+        )
+        for ids in chunked(overdue_ids, batch_size):
+            Invoice.objects.filter(id__in=ids).update(status='overdue')
+    for invoice_id in overdue_ids:
+        print(f'Invoice {invoice_id} marked as overdue.')
+
+    # cancel subscription if overdue for more than 7 days
+    past_grace = Invoice.objects.filter(status='overdue', due_date__lt=now - timedelta(days=7))
+    with transaction.atomic():
+        cancelled = list(
+            Subscription.objects.filter(status='active', id__in=past_grace.values('subscription_id'))
+            .select_for_update(skip_locked=True, of=('self',))
+            .values_list('id', 'user__username', 'plan_id')
+        )
+        for subs in chunked(cancelled, batch_size):
+            Subscription.objects.filter(id__in=[sub_id for sub_id, _, _ in subs]).update(status='cancelled')
+        record_subscription_changes([plan_id for _, _, plan_id in cancelled], -1)
+    for sub_id, username, _ in cancelled:
+        # send mail or notification to user about subscription expired
+        print(f'Subscription {sub_id} for user {username} cancelled due to overdue invoice.')
+
+    return {'overdue': len(overdue_ids), 'cancelled': len(cancelled)}
 
 
 @shared_task
 def send_invoice_reminders():
-    overdue = Invoice.objects.filter(status='overdue', subscription__status='active')
+    # only the reminders due under REMINDER_SCHEDULE_DAYS, one digest per user
+    digests = collect_due_reminders(timezone.now())
+    for digest in digests:
+        print(f"Reminder: {len(digest['invoice_ids'])} overdue invoices for {digest['user_email']}.")
 
-    for inv in overdue:
-        send_subscription_overdue_email.delay(
-            user_email=inv.user.email,
-            subscription_id=inv.subscription.id
-        )
-        print(f"Reminder: Invoice {inv.id} for {inv.user.username} is overdue.")
+    # every chunk is sent by one task over one mail connection
+    chunks = list(chunked(digests, settings.MAIL_BATCH_SIZE))
+    for chunk in chunks:
+        send_subscription_overdue_emails.delay(chunk)
+    return {
+        'reminders': sum(len(digest['invoice_ids']) for digest in digests),
+        'emails': len(digests),
+        'chunks': len(chunks),
+    }
+
+
+@shared_task
+def process_webhook_events(batch_size=None):
+    # the webhook view only stores the events, they are applied here in batches
+    result = apply_webhook_events(batch_size=batch_size)
+    print(f"Webhook events processed: {result['processed']} ({result['paid']} invoices paid)")
+    return result
+
+
+@shared_task
+def reconcile_payments(page_size=None, concurrency=None):
+    # unpaid invoices whose order was paid on the gateway, resumes where the last run stopped
+    result = reconcile_orders(page_size=page_size, concurrency=concurrency)
+    print(f"Orders checked: {result['checked']}, invoices paid: {result['paid']}, gateway errors: {result['errors']}"
+          f"{'' if result['complete'] else ' (continues next run)'}")
+    return result
+
+
+@shared_task
+def archive_old_invoices(batch_size=None):
+    # paid invoices leave the invoice table after INVOICE_ARCHIVE_AFTER_MONTHS, see api.archive
+    created = create_archive_partitions()
+    archived = archive_invoices(batch_size=batch_size)
+    exported = detach_archive_partitions()
+    print(f"Invoices archived: {archived}, partitions created: {len(created)}, partitions exported: {len(exported)}")
+    return {'archived': archived, 'partitions': len(created), 'exported': exported}
+
+
+@shared_task
+def fold_revenue_rollups(batch_size=None):
+    # the revenue changes appended by the views and tasks, see api.rollups
+    folded = fold_revenue_deltas(batch_size=batch_size)
+    print(f"Revenue changes folded: {folded}")
+    return {'folded': folded}
@@ -1,5 +1,9 @@
+from django.core.cache import cache
+from django.test import override_settings
 from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
 from unittest.mock import patch
+from api.authentication import user_cache
 from api.models import MyUser
 from django.urls import reverse
 
@@ -53,3 +57,70 @@ class UserLoginTestCase(APITestCase):
         invalid_credentials['password'] = 'wrongpassword'
         response = self.client.post('/api/token/', invalid_credentials)
         self.assertEqual(response.status_code, 401)
+
+
+class CachedJWTAuthenticationTestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        self.user = MyUser.objects.create_user(username='cacheduser', email='cached@example.com',
+                                               password='testpassword123')
+        self.auth_headers = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+        self.url = reverse('subscription-list')
+
+    def test_user_is_loaded_once(self):
+        with self.assertNumQueries(2):
+            self.client.get(self.url, **self.auth_headers)
+        # only the subscriptions query
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, **self.auth_headers)
+        self.assertEqual(response.status_code, 200)
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.get(self.url, **self.auth_headers)
+
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(self.url, **self.auth_headers)
+        self.assertEqual(response.status_code, 401)
+
+    def test_password_change_and_delete_invalidate_the_cache(self):
+        self.client.get(self.url, **self.auth_headers)
+
+        self.user.set_password('newpassword123')
+        self.user.save()
+        with self.assertNumQueries(2):
+            self.client.get(self.url, **self.auth_headers)
+
+        self.user.delete()
+        response = self.client.get(self.url, **self.auth_headers)
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(AUTH_USER_SHARED_CACHE=True)
+    def test_shared_cache_serves_other_processes(self):
+        self.client.get(self.url, **self.auth_headers)
+        # another process starts with an empty local cache
+        user_cache.clear()
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, **self.auth_headers)
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(AUTH_USER_SHARED_CACHE=True)
+    def test_shared_cache_invalidates_other_processes(self):
+        self.client.get(self.url, **self.auth_headers)
+        other_process = dict(user_cache.local)
+
+        # deactivated by another process, this one still has the old entry
+        self.user.is_active = False
+        self.user.save()
+        user_cache.local.update(other_process)
+        response = self.client.get(self.url, **self.auth_headers)
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(AUTH_USER_CACHE_TIMEOUT=0)
+    def test_cache_can_be_disabled(self):
+        self.client.get(self.url, **self.auth_headers)
+        with self.assertNumQueries(2):
+            self.client.get(self.url, **self.auth_headers)
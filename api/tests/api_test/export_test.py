@@ -0,0 +1,112 @@
+import csv
+import io
+import json
+
+from django.db import connection
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.archive import archive_invoices
+from api.exports import export_invoices
+from api.models import Invoice, MyUser, Plan, Subscription
+
+
+class InvoiceExportViewTestCase(APITestCase):
+
+    def setUp(self):
+        self.staff = MyUser.objects.create_user(username='finance', email='finance@example.com',
+                                                password='password123', is_staff=True)
+        self.user = MyUser.objects.create_user(username='customer', email='customer@example.com',
+                                               password='password123')
+        self.staff_headers = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.staff).access_token}'}
+        self.user_headers = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+
+        self.basic = Plan.objects.create(name='Basic', description='Basic', price=100, duration=1)
+        self.pro = Plan.objects.create(name='Pro', description='Pro', price=300, duration=3)
+        self.now = timezone.now()
+        self.invoices = [
+            self.create_invoice(self.basic, days_ago=40, status='paid'),
+            self.create_invoice(self.basic, days_ago=10, status='overdue'),
+            self.create_invoice(self.pro, days_ago=0, status='unpaid'),
+        ]
+        self.url = reverse('invoice-export')
+
+    def create_invoice(self, plan, days_ago, status):
+        issue_date = self.now - timezone.timedelta(days=days_ago)
+        subscription = Subscription.objects.create(user=self.user, plan=plan, start_date=issue_date,
+                                                   end_date=issue_date + timezone.timedelta(days=30),
+                                                   status='active' if days_ago == 0 else 'expired')
+        return Invoice.objects.create(user=self.user, subscription=subscription, plan=plan, amount=plan.price,
+                                      issue_date=issue_date, due_date=issue_date + timezone.timedelta(days=5),
+                                      billing_period_start=issue_date.date(), status=status)
+
+    def export(self, **params):
+        response = self.client.get(self.url, params, **self.staff_headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_streams_every_invoice_as_ndjson(self):
+        rows = [json.loads(line) for line in self.export().splitlines()]
+
+        self.assertEqual({row['id'] for row in rows}, {str(invoice.id) for invoice in self.invoices})
+        pro = next(row for row in rows if row['plan_name'] == 'Pro')
+        self.assertEqual(pro['amount'], '300.00')
+        self.assertEqual(pro['user_email'], 'customer@example.com')
+        self.assertIsNone(pro['paid_at'])
+
+    def test_streams_csv_with_header(self):
+        rows = list(csv.DictReader(io.StringIO(self.export(output='csv'))))
+
+        self.assertEqual(len(rows), 3)
+        self.assertEqual({row['status'] for row in rows}, {'paid', 'overdue', 'unpaid'})
+        self.assertEqual({row['razorpay_order_id'] for row in rows}, {''})
+
+    def test_filters(self):
+        def exported_ids(**params):
+            return {json.loads(line)['id'] for line in self.export(**params).splitlines()}
+
+        self.assertEqual(exported_ids(status='overdue'), {str(self.invoices[1].id)})
+        self.assertEqual(exported_ids(plan=self.basic.id), {str(self.invoices[0].id), str(self.invoices[1].id)})
+        since = timezone.localdate(self.now - timezone.timedelta(days=10)).isoformat()
+        until = timezone.localdate(self.now - timezone.timedelta(days=1)).isoformat()
+        self.assertEqual(exported_ids(since=since, until=until), {str(self.invoices[1].id)})
+
+    @override_settings(INVOICE_ARCHIVE_AFTER_MONTHS=0)
+    def test_includes_archived_invoices(self):
+        # the paid invoice of last month moves to the archive
+        self.assertEqual(archive_invoices(), 1)
+
+        rows = [json.loads(line) for line in self.export(plan=self.basic.id).splitlines()]
+
+        self.assertEqual({row['id'] for row in rows}, {str(self.invoices[0].id), str(self.invoices[1].id)})
+        archived = next(row for row in rows if row['id'] == str(self.invoices[0].id))
+        self.assertEqual((archived['plan_name'], archived['user_email']), ('Basic', 'customer@example.com'))
+
+    def test_reads_inside_a_transaction(self):
+        rows = export_invoices()
+        atomic_blocks = len(connection.atomic_blocks)
+
+        next(rows)
+        # a plain server-side cursor, not one declared WITH HOLD
+        self.assertEqual(len(connection.atomic_blocks), atomic_blocks + 1)
+        self.assertEqual(len(list(rows)), len(self.invoices) - 1)
+        self.assertEqual(len(connection.atomic_blocks), atomic_blocks)
+
+    def test_rejects_invalid_filters(self):
+        for params in [{'output': 'xml'}, {'since': '01-01-2025'}, {'status': 'lost'}, {'plan': 'basic'},
+                       {'since': '2025-02-01', 'until': '2025-01-01'}]:
+            response = self.client.get(self.url, params, **self.staff_headers)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('error', response.json())
+
+    def test_only_staff_can_export(self):
+        response = self.client.get(self.url, **self.user_headers)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
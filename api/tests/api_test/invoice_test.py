@@ -2,7 +2,10 @@ from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
+from api.authentication import user_cache
 from api.models import MyUser, Plan, Subscription, Invoice
 from uuid import UUID
 
@@ -161,3 +164,110 @@ class InvoiceViewsTestCase(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
         self.assertEqual(response.json()['error'], 'No invoices found')
+
+
+class InvoicePaginationTestCase(APITestCase):
+    def setUp(self):
+        self.user = MyUser.objects.create_user(username='pageuser', email='page@example.com', password='password123')
+        refresh = RefreshToken.for_user(self.user)
+        self.auth_headers = {'HTTP_AUTHORIZATION': f'Bearer {str(refresh.access_token)}'}
+
+        self.plan = Plan.objects.create(name='Basic Plan', description='Basic', price=50, duration=1, is_active=True)
+        self.subscription = Subscription.objects.create(
+            user=self.user,
+            plan=self.plan,
+            start_date=timezone.now() - timezone.timedelta(days=300),
+            end_date=timezone.now() + timezone.timedelta(days=30),
+            status='active'
+        )
+        self.now = timezone.now()
+        # two invoices share an issue date so the id breaks the tie
+        self.invoices = [self.create_invoice(days_ago) for days_ago in [0, 30, 30, 60, 90, 120, 150]]
+
+    def create_invoice(self, days_ago):
+        issue_date = self.now - timezone.timedelta(days=days_ago)
+        return Invoice.objects.create(
+            user=self.user,
+            subscription=self.subscription,
+            plan=self.plan,
+            amount=50,
+            issue_date=issue_date,
+            due_date=issue_date + timezone.timedelta(days=5),
+            status='paid'
+        )
+
+    def fetch_all(self, page_size, on_page=None):
+        url = reverse('invoice-list')
+        params = {'page_size': page_size}
+        ids = []
+        while True:
+            response = self.client.get(url, params, **self.auth_headers)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.json()), page_size)
+            ids += [invoice['id'] for invoice in response.json()]
+            if on_page:
+                on_page()
+            if 'X-Next-Cursor' not in response:
+                return ids
+            self.assertIn('rel="next"', response['Link'])
+            params['cursor'] = response['X-Next-Cursor']
+
+    def test_pages_cover_every_invoice_newest_first(self):
+        ids = self.fetch_all(page_size=3)
+
+        expected = sorted(self.invoices, key=lambda invoice: (invoice.issue_date, invoice.id), reverse=True)
+        self.assertEqual(ids, [str(invoice.id) for invoice in expected])
+
+    def test_new_invoices_do_not_shift_pages(self):
+        ids = self.fetch_all(page_size=2, on_page=lambda: self.create_invoice(-1))
+
+        self.assertEqual(len(ids), len(self.invoices))
+        self.assertEqual(set(ids), {str(invoice.id) for invoice in self.invoices})
+
+    def test_page_size_defaults_and_is_capped(self):
+        with self.settings(API_PAGE_SIZE=4, API_MAX_PAGE_SIZE=5):
+            response = self.client.get(reverse('invoice-list'), **self.auth_headers)
+            self.assertEqual(len(response.json()), 4)
+
+            response = self.client.get(reverse('invoice-list'), {'page_size': 100}, **self.auth_headers)
+            self.assertEqual(len(response.json()), 5)
+
+    def test_invalid_cursor_and_page_size(self):
+        url = reverse('invoice-list')
+        for params in [{'cursor': 'not-a-cursor'}, {'cursor': 'WyJ4IiwgInkiXQ=='}, {'page_size': 'ten'},
+                       {'page_size': 0}]:
+            response = self.client.get(url, params, **self.auth_headers)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('error', response.json())
+
+    def count_list_queries(self):
+        # load the user from the database on every call, see CachedJWTAuthentication
+        user_cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('invoice-list'), {'page_size': 100}, **self.auth_headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(response.json()), len(queries)
+
+    def test_list_query_count_does_not_grow_with_invoices(self):
+        listed, queries = self.count_list_queries()
+
+        # more invoices, on another subscription and plan
+        other_plan = Plan.objects.create(name='Pro Plan', description='Pro', price=90, duration=3, is_active=True)
+        self.subscription = Subscription.objects.create(
+            user=self.user,
+            plan=other_plan,
+            start_date=self.now - timezone.timedelta(days=400),
+            end_date=self.now - timezone.timedelta(days=300),
+            status='expired'
+        )
+        for days_ago in range(200, 400, 10):
+            self.create_invoice(days_ago)
+
+        self.assertEqual(self.count_list_queries(), (listed + 20, queries))
+        # the user and one query for the page with its subscriptions and plans
+        self.assertEqual(queries, 2)
+
+    def test_latest_invoice_query_count(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('latest-invoice'), **self.auth_headers)
+        self.assertEqual(response.json()['subscription']['plan']['name'], 'Basic Plan')
@@ -0,0 +1,211 @@
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.models import DailyRevenue, Invoice, MyUser, Plan, RevenueDelta, Subscription
+import api.rollups
+from api.rollups import record_subscription_changes, rebuild_revenue_rollups
+from api.tasks import fold_revenue_rollups, generate_daily_invoice, mark_overdue_invoices
+
+
+class RevenueMetricsTestCase(APITestCase):
+
+    def setUp(self):
+        self.staff = MyUser.objects.create_user(username='finance', email='finance@example.com',
+                                                password='password123', is_staff=True)
+        self.staff_headers = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.staff).access_token}'}
+        self.basic = Plan.objects.create(name='Basic', description='Basic', price=100, duration=1)
+        self.pro = Plan.objects.create(name='Pro', description='Pro', price=300, duration=3)
+        self.today = timezone.localdate()
+        self.url = reverse('revenue-metrics')
+
+    def subscribe(self, username, plan):
+        user = MyUser.objects.create_user(username=username, email=f'{username}@example.com', password='password123')
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(user).access_token}'}
+        response = self.client.post(reverse('subscribe'), {'plan_id': plan.id}, **headers)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.json()['id'], headers
+
+    def rollups(self):
+        return list(DailyRevenue.objects.order_by('day', 'plan_id').values_list(
+            'day', 'plan_id', 'invoiced', 'collected', 'outstanding', 'active_subscribers'))
+
+    def test_incremental_updates_match_a_rebuild(self):
+        first, first_headers = self.subscribe('first', self.basic)
+        self.subscribe('second', self.basic)
+        third, third_headers = self.subscribe('third', self.pro)
+
+        invoice = Invoice.objects.get(subscription_id=first)
+        self.client.post(reverse('pay-invoice'), {'invoice_id': invoice.id}, **first_headers)
+        # paying twice does not count the invoice twice
+        self.client.post(reverse('pay-invoice'), {'invoice_id': invoice.id}, **first_headers)
+        self.client.post(reverse('unsubscribe'), {'subscription_id': third}, **third_headers)
+        # a renewal billed by the daily run
+        Invoice.objects.filter(subscription_id=first).update(billing_period_start=self.today - timezone.timedelta(days=31))
+        Subscription.objects.filter(id=first).update(next_billing_date=self.today)
+        generate_daily_invoice()
+        pending = RevenueDelta.objects.count()
+        self.assertEqual(fold_revenue_rollups(batch_size=2)['folded'], pending)
+        self.assertFalse(RevenueDelta.objects.exists())
+
+        incremental = self.rollups()
+        self.assertEqual(incremental, [
+            (self.today, self.basic.id, Decimal('300.00'), Decimal('100.00'), Decimal('200.00'), 2),
+            (self.today, self.pro.id, Decimal('300.00'), Decimal('0.00'), Decimal('300.00'), 0),
+        ])
+        rebuild_revenue_rollups()
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_overdue_cancellations_leave_the_active_subscribers(self):
+        subscription, _ = self.subscribe('late', self.basic)
+        fold_revenue_rollups()
+        Invoice.objects.filter(subscription_id=subscription).update(
+            due_date=timezone.now() - timezone.timedelta(days=10))
+
+        mark_overdue_invoices()
+        mark_overdue_invoices()
+        fold_revenue_rollups()
+
+        rollup = DailyRevenue.objects.get(day=self.today, plan=self.basic)
+        self.assertEqual(rollup.active_subscribers, 0)
+        # overdue invoices are still outstanding
+        self.assertEqual(rollup.outstanding, Decimal('100.00'))
+
+    def test_writers_only_append_deltas(self):
+        with CaptureQueriesContext(connection) as queries:
+            subscription, headers = self.subscribe('writer', self.basic)
+            invoice = Invoice.objects.get(subscription_id=subscription)
+            self.client.post(reverse('pay-invoice'), {'invoice_id': invoice.id}, **headers)
+            self.client.post(reverse('unsubscribe'), {'subscription_id': subscription}, **headers)
+
+        # the rollup rows are only written by the fold, writers never wait on each other there
+        self.assertFalse([query['sql'] for query in queries.captured_queries if 'api_dailyrevenue' in query['sql']])
+        self.assertFalse(DailyRevenue.objects.exists())
+        self.assertEqual(RevenueDelta.objects.count(), 4)
+
+    def test_late_subscriber_changes_move_the_later_counts(self):
+        yesterday = self.today - timezone.timedelta(days=1)
+        DailyRevenue.objects.create(day=yesterday - timezone.timedelta(days=1), plan=self.basic, active_subscribers=3)
+        DailyRevenue.objects.create(day=self.today, plan=self.basic, active_subscribers=5)
+        # appended before midnight, folded after
+        RevenueDelta.objects.create(day=yesterday, plan=self.basic, active_subscribers=1)
+
+        fold_revenue_rollups()
+
+        counts = dict(DailyRevenue.objects.filter(plan=self.basic).values_list('day', 'active_subscribers'))
+        self.assertEqual(counts[yesterday], 4)
+        self.assertEqual(counts[self.today], 6)
+
+    def test_rebuild_drops_the_pending_deltas(self):
+        self.subscribe('pending', self.basic)
+        rebuild_revenue_rollups()
+
+        self.assertFalse(RevenueDelta.objects.exists())
+        rollup = DailyRevenue.objects.get(day=self.today, plan=self.basic)
+        self.assertEqual((rollup.invoiced, rollup.active_subscribers), (Decimal('100.00'), 1))
+        # a later change is folded on top of the rebuild
+        record_subscription_changes([self.basic.id], -1)
+        fold_revenue_rollups()
+        rollup.refresh_from_db()
+        self.assertEqual(rollup.active_subscribers, 0)
+
+    def test_metrics_carry_the_subscribers_over_quiet_days(self):
+        DailyRevenue.objects.create(day=self.today - timezone.timedelta(days=40), plan=self.basic, invoiced=100,
+                                    outstanding=100, active_subscribers=4)
+        DailyRevenue.objects.create(day=self.today - timezone.timedelta(days=2), plan=self.pro, invoiced=300,
+                                    collected=300, active_subscribers=1)
+
+        response = self.client.get(self.url, **self.staff_headers)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        metrics = response.json()
+        basic, pro = metrics['plans']
+        self.assertEqual(len(basic['days']), 30)
+        self.assertEqual({day['active_subscribers'] for day in basic['days']}, {4})
+        self.assertEqual([day['active_subscribers'] for day in pro['days']][-4:], [0, 1, 1, 1])
+        # 4 x 100 a month and 1 x 300 every 3 months
+        self.assertEqual(basic['mrr'], '400.00')
+        self.assertEqual(pro['mrr'], '100.00')
+        self.assertEqual(metrics['mrr'], '500.00')
+        self.assertEqual(metrics['arr'], '6000.00')
+        self.assertEqual(metrics['totals'], {'invoiced': '300.00', 'collected': '300.00', 'outstanding': '0.00',
+                                             'active_subscribers': 5})
+
+    def test_metrics_filter_by_plan_and_range(self):
+        DailyRevenue.objects.create(day=self.today, plan=self.basic, invoiced=100, active_subscribers=1)
+        DailyRevenue.objects.create(day=self.today, plan=self.pro, invoiced=300, active_subscribers=1)
+
+        response = self.client.get(self.url, {'since': self.today.isoformat(), 'until': self.today.isoformat(),
+                                              'plan': self.pro.id}, **self.staff_headers)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([plan['plan_name'] for plan in response.json()['plans']], ['Pro'])
+        self.assertEqual(len(response.json()['plans'][0]['days']), 1)
+
+    def test_metrics_read_a_constant_number_of_queries(self):
+        for days_ago in range(60):
+            for plan in [self.basic, self.pro]:
+                DailyRevenue.objects.create(day=self.today - timezone.timedelta(days=days_ago), plan=plan,
+                                            invoiced=100, active_subscribers=days_ago)
+        self.client.get(self.url, **self.staff_headers)
+        # the rows in the range, the last counts before it and the plans, the user is cached
+        with self.assertNumQueries(3):
+            self.client.get(self.url, {'since': (self.today - timezone.timedelta(days=59)).isoformat()},
+                            **self.staff_headers)
+
+    def test_rejects_invalid_ranges(self):
+        for params in [{'since': 'yesterday'}, {'since': self.today.isoformat(), 'until': '2000-01-01'},
+                       {'since': '2000-01-01'}, {'plan': 'pro'}]:
+            response = self.client.get(self.url, params, **self.staff_headers)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+    def test_staff_only(self):
+        user = MyUser.objects.create_user(username='customer', email='customer@example.com', password='password123')
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(user).access_token}'}
+        self.assertEqual(self.client.get(self.url, **headers).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class RebuildRevenueRollupsTest(TransactionTestCase):
+
+    def setUp(self):
+        self.plan = Plan.objects.create(name='Basic', description='Basic', price=100, duration=1)
+        self.user = MyUser.objects.create_user(username='rebuild', email='rebuild@example.com', password='password123')
+        self.today = timezone.localdate()
+
+    def test_deltas_appended_during_the_rebuild_are_kept(self):
+        Subscription.objects.create(user=self.user, plan=self.plan, start_date=timezone.now(),
+                                    end_date=timezone.now() + timezone.timedelta(days=30))
+        record_subscription_changes([self.plan.id], 1)
+        write_flows = api.rollups._write_flows
+
+        def append_meanwhile(*args, **kwargs):
+            # a sign-up committed by another connection while the rebuild runs
+            def subscribe():
+                try:
+                    record_subscription_changes([self.plan.id], 1)
+                finally:
+                    connection.close()
+
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                # the writer does not wait for the rebuild
+                executor.submit(subscribe).result(timeout=5)
+            return write_flows(*args, **kwargs)
+
+        with patch('api.rollups._write_flows', side_effect=append_meanwhile):
+            rebuild_revenue_rollups()
+
+        # the rebuild counted the first sign-up, the later one is left for the fold
+        self.assertEqual(DailyRevenue.objects.get(day=self.today, plan=self.plan).active_subscribers, 1)
+        self.assertEqual(list(RevenueDelta.objects.values_list('active_subscribers', flat=True)), [1])
+        fold_revenue_rollups()
+        self.assertEqual(DailyRevenue.objects.get(day=self.today, plan=self.plan).active_subscribers, 2)
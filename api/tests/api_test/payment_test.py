@@ -1,10 +1,15 @@
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import patch, MagicMock
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TransactionTestCase, override_settings
 from django.urls import reverse
-from rest_framework.test import APITestCase
+from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
 from api.models import MyUser, Plan, Subscription, Invoice
 from django.utils import timezone
+import time
 import uuid
 import os
 
@@ -51,7 +56,7 @@ class CreateRazorPayInvoiceOrderViewTest(APITestCase):
             status='unpaid'
         )
 
-    @patch('razorpay.client.Client')
+    @patch('api.views.payment_views.get_razorpay_client')
     def test_create_razorpay_order_success(self, mock_razorpay_client):
         # Setup mock for razorpay client order create
         mock_client_instance = MagicMock()
@@ -92,6 +97,132 @@ class CreateRazorPayInvoiceOrderViewTest(APITestCase):
         self.assertEqual(response.json()['error'], "Invoice not found or already paid")
 
 
+    @patch('api.views.payment_views.get_razorpay_client')
+    def test_create_razorpay_order_reuses_existing_order(self, mock_razorpay_client):
+        mock_razorpay_client.return_value.order.create.return_value = {'id': 'order_12345'}
+        url = reverse('create-razorpay-order')
+        data = {'invoice_id': str(self.invoice.id)}
+
+        first = self.client.post(url, data, **self.auth_headers)
+        second = self.client.post(url, data, **self.auth_headers)
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.json()['order_id'], 'order_12345')
+        mock_razorpay_client.return_value.order.create.assert_called_once()
+
+    @patch('api.views.payment_views.get_razorpay_client')
+    def test_create_razorpay_order_after_amount_change(self, mock_razorpay_client):
+        mock_razorpay_client.return_value.order.create.return_value = {'id': 'order_67890'}
+        Invoice.objects.filter(id=self.invoice.id).update(razorpay_order_id='order_12345', razorpay_order_amount=5000)
+
+        response = self.client.post(reverse('create-razorpay-order'), {'invoice_id': str(self.invoice.id)},
+                                    **self.auth_headers)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()['order_id'], 'order_67890')
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.razorpay_order_amount, 10000)
+
+
+    @patch('api.views.payment_views.get_razorpay_client')
+    def test_create_razorpay_order_keeps_the_order_saved_first(self, mock_razorpay_client):
+        def create(data):
+            # another checkout stores its order while this one waits for the gateway
+            Invoice.objects.filter(id=self.invoice.id).update(razorpay_order_id='order_other',
+                                                              razorpay_order_amount=data['amount'])
+            return {'id': 'order_12345'}
+
+        mock_razorpay_client.return_value.order.create.side_effect = create
+
+        response = self.client.post(reverse('create-razorpay-order'), {'invoice_id': str(self.invoice.id)},
+                                    **self.auth_headers)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['order_id'], 'order_other')
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.razorpay_order_id, 'order_other')
+
+    @override_settings(CHECKOUT_LOCK_WAIT=0.2)
+    @patch('api.views.payment_views.get_razorpay_client')
+    def test_create_razorpay_order_does_not_wait_for_the_gateway_timeout(self, mock_razorpay_client):
+        # another checkout holds the lock while the gateway is slow
+        lock_key = f'api:order-lock:{self.invoice.id}'
+        cache.add(lock_key, True)
+        self.addCleanup(cache.delete, lock_key)
+
+        started = time.monotonic()
+        response = self.client.post(reverse('create-razorpay-order'), {'invoice_id': str(self.invoice.id)},
+                                    **self.auth_headers)
+
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response['Retry-After'], '1')
+        mock_razorpay_client.return_value.order.create.assert_not_called()
+
+
+class ConcurrentRazorPayOrderTest(TransactionTestCase):
+
+    def setUp(self):
+        self.user = MyUser.objects.create_user(username='checkoutuser', email='checkout@example.com',
+                                               password='password123')
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+        plan = Plan.objects.create(name='Test Plan', description='Test Description', price=100, duration=1)
+        subscription = Subscription.objects.create(user=self.user, plan=plan, start_date=timezone.now(),
+                                                   end_date=timezone.now() + timezone.timedelta(days=30))
+        self.invoice = Invoice.objects.create(user=self.user, subscription=subscription, plan=plan, amount=100,
+                                              issue_date=timezone.now(), due_date=timezone.now(), status='unpaid')
+
+    @patch('api.views.payment_views.get_razorpay_client')
+    def test_concurrent_checkouts_create_one_order(self, mock_razorpay_client):
+        created = []
+
+        def create(data):
+            # a slow gateway, the other requests arrive while the order is created
+            time.sleep(0.2)
+            created.append(data)
+            return {'id': f'order_{len(created)}'}
+
+        mock_razorpay_client.return_value.order.create.side_effect = create
+
+        def checkout():
+            try:
+                client = APIClient()
+                client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+                return client.post(reverse('create-razorpay-order'), {'invoice_id': str(self.invoice.id)}).json()
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            responses = list(executor.map(lambda _: checkout(), range(3)))
+
+        self.assertEqual(len(created), 1)
+        self.assertEqual(responses, [{'order_id': 'order_1'}] * 3)
+
+    @patch('api.views.payment_views.get_razorpay_client')
+    def test_invoice_is_not_locked_during_the_gateway_call(self, mock_razorpay_client):
+        def create(data):
+            # e.g. a webhook paying the invoice meanwhile, from another connection
+            def lock():
+                try:
+                    with transaction.atomic():
+                        return Invoice.objects.select_for_update(nowait=True).filter(id=self.invoice.id).exists()
+                finally:
+                    connection.close()
+
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                self.assertTrue(executor.submit(lock).result())
+            return {'id': 'order_1'}
+
+        mock_razorpay_client.return_value.order.create.side_effect = create
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+        response = client.post(reverse('create-razorpay-order'), {'invoice_id': str(self.invoice.id)})
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+
 class VerifyRazorPayPaymentViewTest(APITestCase):
     def setUp(self):
         self.user = MyUser.objects.create_user(
@@ -143,11 +274,7 @@ class VerifyRazorPayPaymentViewTest(APITestCase):
         }
 
     @patch.dict(os.environ, {"MOCK_PAYMENT_SUCCESS": "True"})
-    @patch('razorpay.client.Client')
-    def test_verify_payment_success(self, mock_razorpay_client):
-        mock_client_instance = MagicMock()
-        mock_razorpay_client.return_value = mock_client_instance
-
+    def test_verify_payment_success(self):
         url = reverse('verify-razorpay-payment')
         response = self.client.post(url, self.payment_data, **self.auth_headers)
 
@@ -159,11 +286,7 @@ class VerifyRazorPayPaymentViewTest(APITestCase):
         self.assertIsNotNone(self.invoice.paid_at)
 
     @patch.dict(os.environ, {"MOCK_PAYMENT_SUCCESS": "False"})
-    @patch('razorpay.client.Client')
-    def test_verify_payment_failure_due_to_invalid_signature(self, mock_razorpay_client):
-        mock_client_instance = MagicMock()
-        mock_razorpay_client.return_value = mock_client_instance
-
+    def test_verify_payment_failure_due_to_invalid_signature(self):
         url = reverse('verify-razorpay-payment')
         response = self.client.post(url, self.payment_data, **self.auth_headers)
 
@@ -1,7 +1,16 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.test import TransactionTestCase
 from django.urls import reverse
-from rest_framework.test import APITestCase
+from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
-from api.models import Plan, MyUser, Subscription, Invoice
+from api.models import Plan, MyUser, Subscription, Invoice, RevenueDelta
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.utils import timezone
 from uuid import UUID
@@ -23,6 +32,60 @@ class PlanListViewTest(APITestCase):
         self.assertEqual(len(response.json()), 3)
 
 
+class PlanCatalogCacheTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.plan = Plan.objects.create(name="Plan A", description="Desc A", price=10.0, duration=1, is_active=True)
+        Plan.objects.create(name="Plan B", description="Desc B", price=20.0, duration=2, is_active=True)
+        self.url = reverse('plan-list')
+
+    def test_cached_catalog_needs_no_queries(self):
+        first = self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertIn('Last-Modified', second)
+
+    def test_not_modified_with_etag_or_last_modified(self):
+        response = self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+
+        not_modified = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        modified = self.client.get(self.url, HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(modified.status_code, status.HTTP_200_OK)
+
+    def test_saving_or_deleting_a_plan_invalidates_the_catalog(self):
+        etag = self.client.get(self.url)['ETag']
+
+        self.plan.price = 15
+        self.plan.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('15.00', [plan['price'] for plan in response.json()])
+
+        self.plan.delete()
+        self.assertEqual(len(self.client.get(self.url).json()), 1)
+
+    def test_add_plans_invalidates_the_catalog(self):
+        call_command('add_plans', stdout=StringIO())
+        self.client.get(self.url)
+        # update() sends no signals and add_plans saves nothing when the plans exist
+        Plan.objects.filter(name='Plan A').update(is_active=False)
+
+        call_command('add_plans', stdout=StringIO())
+        names = [plan['name'] for plan in self.client.get(self.url).json()]
+        self.assertEqual(sorted(names), ['Basic', 'Enterprise', 'Plan B', 'Pro'])
+
+
 class SubscribeViewTestCase(APITestCase):
 
     def setUp(self):
@@ -67,6 +130,9 @@ class SubscribeViewTestCase(APITestCase):
         self.assertEqual(invoice.amount, self.plan.price)
         self.assertEqual(invoice.status, 'unpaid')
 
+        # the next invoice is due when the first billing cycle ends
+        self.assertEqual(subscription.next_billing_date, invoice.billing_period_end)
+
     def test_user_cannot_subscribe_if_already_active(self):
         # Create active subscription
         Subscription.objects.create(
@@ -84,6 +150,54 @@ class SubscribeViewTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn('You already have an active subscription', response.json().get('error', ''))
 
+    def test_subscribe_query_count(self):
+        # the user, the plan, then the subscription, its invoice and their two rollup updates in one
+        # transaction (a savepoint in tests)
+        with self.assertNumQueries(8):
+            response = self.client.post(reverse('subscribe'), {'plan_id': self.plan.id}, **self.auth_headers)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_subscription_is_rolled_back_without_its_invoice(self):
+        with patch('api.views.subscription_views.Invoice.objects.create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.client.post(reverse('subscribe'), {'plan_id': self.plan.id}, **self.auth_headers)
+        self.assertFalse(Subscription.objects.exists())
+
+    def test_database_refuses_a_second_active_subscription(self):
+        Subscription.objects.create(user=self.user, plan=self.plan, start_date=timezone.now(),
+                                    end_date=timezone.now() + timezone.timedelta(days=90), status='active')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Subscription.objects.create(user=self.user, plan=self.plan, start_date=timezone.now(),
+                                        end_date=timezone.now() + timezone.timedelta(days=90), status='active')
+        # inactive ones are not limited
+        Subscription.objects.create(user=self.user, plan=self.plan, start_date=timezone.now(),
+                                    end_date=timezone.now() + timezone.timedelta(days=90), status='cancelled')
+
+
+class ConcurrentSubscribeTest(TransactionTestCase):
+
+    def test_double_click_creates_one_subscription(self):
+        user = MyUser.objects.create_user(username='doubleclick', email='doubleclick@example.com', password='pass')
+        plan = Plan.objects.create(name='Basic Plan', description='Test plan', price=99.0, duration=3)
+        token = str(RefreshToken.for_user(user).access_token)
+        barrier = threading.Barrier(4)
+
+        def subscribe():
+            try:
+                client = APIClient()
+                client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+                barrier.wait()
+                return client.post(reverse('subscribe'), {'plan_id': plan.id}).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            codes = sorted(executor.map(lambda _: subscribe(), range(4)))
+
+        self.assertEqual(codes, [201, 400, 400, 400])
+        self.assertEqual(Subscription.objects.filter(user=user, status='active').count(), 1)
+        self.assertEqual(Invoice.objects.filter(user=user).count(), 1)
+
 
 class UnSubscribeViewTestCase(APITestCase):
 
@@ -124,6 +238,23 @@ class UnSubscribeViewTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.subscription.refresh_from_db()
         self.assertEqual(self.subscription.status, 'cancelled')
+        self.assertEqual(list(RevenueDelta.objects.values_list('active_subscribers', flat=True)), [-1])
+
+    def test_unsubscribe_racing_an_overdue_cancellation_is_counted_once(self):
+        get = Subscription.objects.get
+
+        def cancelled_meanwhile(**kwargs):
+            subscription = get(**kwargs)
+            # mark_overdue_invoices cancels it and records its -1 after the view read it
+            Subscription.objects.filter(id=subscription.id).update(status='cancelled')
+            return subscription
+
+        with patch.object(Subscription.objects, 'get', side_effect=cancelled_meanwhile):
+            response = self.client.post(reverse('unsubscribe'), {'subscription_id': self.subscription.id},
+                                        **self.auth_headers)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(RevenueDelta.objects.exists())
 
 
 class SubscriptionListViewTestCase(APITestCase):
@@ -184,3 +315,21 @@ class SubscriptionListViewTestCase(APITestCase):
         returned_ids = [sub['id'] for sub in response.json()]
         self.assertIn(str(self.sub1.id), returned_ids)
         self.assertIn(str(self.sub2.id), returned_ids)
+
+    def test_list_subscriptions_query_count(self):
+        # the user and one query for the subscriptions with their plans
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('subscription-list'), **self.auth_headers)
+        self.assertEqual(len(response.json()), 2)
+
+    def test_list_subscriptions_pages_with_cursor(self):
+        url = reverse('subscription-list')
+        response = self.client.get(url, {'page_size': 1}, **self.auth_headers)
+
+        self.assertEqual(len(response.json()), 1)
+        first = response.json()[0]['id']
+
+        response = self.client.get(url, {'page_size': 1, 'cursor': response['X-Next-Cursor']}, **self.auth_headers)
+        self.assertEqual(len(response.json()), 1)
+        self.assertNotIn('X-Next-Cursor', response)
+        self.assertEqual({first, response.json()[0]['id']}, {str(self.sub1.id), str(self.sub2.id)})
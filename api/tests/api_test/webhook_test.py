@@ -0,0 +1,65 @@
+import hashlib
+import hmac
+import json
+
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from api.models import WebhookEvent
+
+
+@override_settings(RAZORPAY_WEBHOOK_SECRET='webhook-secret')
+class RazorpayWebhookViewTestCase(APITestCase):
+
+    def setUp(self):
+        self.url = reverse('razorpay-webhook')
+        self.payload = {
+            'event': 'payment.captured',
+            'payload': {'payment': {'entity': {'id': 'pay_1', 'order_id': 'order_1', 'status': 'captured'}}},
+            'created_at': 1750000000,
+        }
+
+    def post_event(self, payload, event_id='evt_1', signature=None):
+        body = json.dumps(payload).encode()
+        if signature is None:
+            signature = hmac.new(b'webhook-secret', body, hashlib.sha256).hexdigest()
+        return self.client.generic('POST', self.url, body, content_type='application/json',
+                                   HTTP_X_RAZORPAY_SIGNATURE=signature, HTTP_X_RAZORPAY_EVENT_ID=event_id)
+
+    def test_event_is_stored_with_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.post_event(self.payload)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.event_id, event.event), ('evt_1', 'payment.captured'))
+        self.assertEqual(event.payload, self.payload)
+        self.assertIsNone(event.processed_at)
+
+    def test_redelivered_event_is_stored_once(self):
+        self.post_event(self.payload)
+        response = self.post_event(self.payload)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+
+    def test_invalid_signature_is_rejected(self):
+        response = self.post_event(self.payload, signature='forged')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    @override_settings(RAZORPAY_WEBHOOK_SECRET=None)
+    def test_webhooks_are_rejected_without_secret(self):
+        response = self.post_event(self.payload)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_event_without_id_is_rejected(self):
+        response = self.post_event(self.payload, event_id='')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(WebhookEvent.objects.exists())
@@ -1,13 +1,37 @@
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
-from api.models import Plan, MyUser, Subscription, Invoice
+from api.models import (Plan, MyUser, Subscription, Invoice, InvoiceReminder, WebhookEvent, ReconciliationCheckpoint,
+                        ArchivedInvoice, DailyRevenue, ReadOnlyError)
+from api.archive import (archive_cutoff, archive_partitions, create_archive_partitions, find_archived_invoice,
+                         partition_name)
+from api.reconciliation import reconcile_orders
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.utils import timezone
 from uuid import UUID
-from api.tasks import generate_daily_invoice, send_invoice_reminders, mark_overdue_invoices
-from unittest.mock import patch
+from api.tasks import (generate_daily_invoice, send_invoice_reminders, mark_overdue_invoices,
+                       generate_daily_invoice_sharded, generate_invoice_shard, summarize_invoice_shards,
+                       process_webhook_events, reconcile_payments, archive_old_invoices, fold_revenue_rollups)
+from billing_service.celery import app as celery_app
+import api.reminders
+from unittest.mock import Mock, patch
+from uuid import uuid4
+import os
+import smtplib
+import tempfile
+import threading
+import time
+from datetime import timezone as dt_timezone
+import razorpay
+from celery.exceptions import Retry
+from django.core import mail
+from django.core.mail import get_connection
+from django.test import override_settings
+from api.mails.send_subsciption_overdue_email import send_subscription_overdue_emails
 from dateutil.relativedelta import relativedelta
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from api.billing import as_datetime
 
 
 class CeleryTasksTest(APITestCase):
@@ -41,6 +65,123 @@ class CeleryTasksTest(APITestCase):
             invoices = Invoice.objects.filter(user=self.user, status='unpaid')
             self.assertEqual(invoices.count(), 1)
 
+    def create_monthly_subscriptions(self, count, start, prefix='monthlyuser'):
+        plan, _ = Plan.objects.get_or_create(name='Basic', defaults={'price': 499, 'duration': 1})
+        subscriptions = []
+        for i in range(count):
+            user = MyUser.objects.create_user(
+                username=f'{prefix}{i}',
+                email=f'{prefix}{i}@example.com',
+                password='testpassword'
+            )
+            subscriptions.append(Subscription.objects.create(
+                user=user,
+                plan=plan,
+                start_date=start,
+                end_date=start + relativedelta(months=1),
+                status='active'
+            ))
+        return subscriptions
+
+    def test_generate_daily_invoice_in_batches(self):
+        start = timezone.now()
+        monthly_subs = self.create_monthly_subscriptions(3, start)
+
+        # a month later only the monthly subscriptions start a new billing cycle
+        future_date = start + relativedelta(months=1)
+        with patch('django.utils.timezone.now', return_value=future_date):
+            result = generate_daily_invoice(batch_size=2)
+            self.assertEqual(result, {'scanned': 3, 'created': 3})
+            # running it again must not create duplicate invoices
+            self.assertEqual(generate_daily_invoice(batch_size=2)['created'], 0)
+
+        self.assertFalse(Invoice.objects.filter(subscription=self.subscription).exists())
+        cycle_start = start.date() + relativedelta(months=1)
+        cycle_end = start.date() + relativedelta(months=2)
+        for sub in monthly_subs:
+            invoice = Invoice.objects.get(subscription=sub)
+            self.assertEqual(invoice.user, sub.user)
+            self.assertEqual(invoice.amount, sub.plan.price)
+            self.assertEqual(invoice.status, 'unpaid')
+            self.assertEqual(invoice.billing_period_start, cycle_start)
+            self.assertEqual(invoice.billing_period_end, cycle_end)
+            self.assertEqual(invoice.due_date, invoice.issue_date + timezone.timedelta(days=5))
+            sub.refresh_from_db()
+            self.assertEqual(sub.end_date, as_datetime(cycle_end))
+            self.assertEqual(sub.next_billing_date, cycle_end)
+
+    def test_generate_daily_invoice_bills_missed_days(self):
+        # the workers were down on the day the billing cycle started
+        future_date = self.subscription.start_date + relativedelta(months=3, days=2)
+        with patch('django.utils.timezone.now', return_value=future_date):
+            self.assertEqual(generate_daily_invoice()['created'], 1)
+
+        invoice = Invoice.objects.get(subscription=self.subscription)
+        self.assertEqual(invoice.billing_period_start, self.subscription.start_date.date() + relativedelta(months=3))
+        self.subscription.refresh_from_db()
+        self.assertEqual(self.subscription.next_billing_date, invoice.billing_period_end)
+
+    def test_generate_daily_invoice_skips_invoiced_cycle(self):
+        cycle_start = self.subscription.next_billing_date
+        Invoice.objects.create(
+            user=self.user,
+            subscription=self.subscription,
+            plan=self.plan,
+            amount=999,
+            issue_date=timezone.now(),
+            due_date=timezone.now() + timezone.timedelta(days=5),
+            billing_period_start=cycle_start,
+            billing_period_end=cycle_start + relativedelta(months=3),
+            status='paid'
+        )
+
+        future_date = self.subscription.start_date + relativedelta(months=3)
+        with patch('django.utils.timezone.now', return_value=future_date):
+            self.assertEqual(generate_daily_invoice(), {'scanned': 1, 'created': 0})
+
+        self.assertEqual(Invoice.objects.filter(subscription=self.subscription).count(), 1)
+        self.subscription.refresh_from_db()
+        self.assertEqual(self.subscription.next_billing_date, self.subscription.start_date.date() + relativedelta(months=6))
+
+    def test_generate_daily_invoice_query_count_is_per_batch(self):
+        start = timezone.now()
+        self.create_monthly_subscriptions(2, start)
+        future_date = start + relativedelta(months=1)
+        with patch('django.utils.timezone.now', return_value=future_date):
+            with CaptureQueriesContext(connection) as small_run:
+                self.assertEqual(generate_daily_invoice()['created'], 2)
+
+        self.create_monthly_subscriptions(8, start, prefix='otheruser')
+        with patch('django.utils.timezone.now', return_value=future_date):
+            with CaptureQueriesContext(connection) as large_run:
+                self.assertEqual(generate_daily_invoice()['created'], 8)
+
+        self.assertEqual(len(small_run), len(large_run))
+
+    def test_generate_invoice_shards_cover_every_subscription_once(self):
+        start = timezone.now()
+        self.create_monthly_subscriptions(12, start)
+        future_date = start + relativedelta(months=1)
+        with patch('django.utils.timezone.now', return_value=future_date):
+            results = [generate_invoice_shard(shard, 4) for shard in range(4)]
+
+        self.assertEqual(sum(result['scanned'] for result in results), 12)
+        self.assertEqual(summarize_invoice_shards(results), {'shards': 4, 'scanned': 12, 'created': 12})
+        self.assertEqual(Invoice.objects.count(), 12)
+
+    def test_generate_daily_invoice_sharded(self):
+        start = timezone.now()
+        self.create_monthly_subscriptions(5, start)
+        future_date = start + relativedelta(months=1)
+        # run the chord in process, the header tasks first and then the callback
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, 'task_always_eager', False)
+        with patch('django.utils.timezone.now', return_value=future_date), patch('builtins.print') as mock_print:
+            generate_daily_invoice_sharded(shards=3)
+
+        self.assertEqual(Invoice.objects.count(), 5)
+        mock_print.assert_any_call("Invoices created: 5 (5 subscriptions scanned in 3 shards)")
+
     def test_mark_overdue_invoices(self):
         # Create an overdue invoice
         overdue_invoice = Invoice.objects.create(
@@ -82,6 +223,41 @@ class CeleryTasksTest(APITestCase):
             # Check if subscription is cancelled
             self.assertEqual(self.subscription.status, 'cancelled')
 
+    def test_mark_overdue_invoices_cancels_subscription_after_grace_period(self):
+        # marked overdue by an earlier run, the grace period ends later
+        Invoice.objects.create(
+            user=self.user,
+            subscription=self.subscription,
+            plan=self.plan,
+            amount=999,
+            issue_date=timezone.now() - timezone.timedelta(days=13),
+            due_date=timezone.now() - timezone.timedelta(days=8),
+            billing_period_start=timezone.now().date(),
+            billing_period_end=(timezone.now() + timezone.timedelta(days=30)).date(),
+            status='overdue'
+        )
+
+        self.assertEqual(mark_overdue_invoices(), {'overdue': 0, 'cancelled': 1})
+        self.subscription.refresh_from_db()
+        self.assertEqual(self.subscription.status, 'cancelled')
+
+    def test_mark_overdue_invoices_without_changes_does_not_write(self):
+        Invoice.objects.create(
+            user=self.user,
+            subscription=self.subscription,
+            plan=self.plan,
+            amount=999,
+            issue_date=timezone.now(),
+            due_date=timezone.now() + timezone.timedelta(days=5),
+            billing_period_start=timezone.now().date(),
+            billing_period_end=(timezone.now() + timezone.timedelta(days=30)).date(),
+            status='unpaid'
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(mark_overdue_invoices(), {'overdue': 0, 'cancelled': 0})
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE')])
+
     def test_send_invoice_reminders(self):
         # Create an overdue invoice
         overdue_invoice = Invoice.objects.create(
@@ -96,6 +272,361 @@ class CeleryTasksTest(APITestCase):
             status='overdue'
         )
 
-        with patch('api.tasks.send_subscription_overdue_email.delay') as mock_send_email:
+        with patch('api.tasks.send_subscription_overdue_emails.delay') as mock_send_emails:
             send_invoice_reminders()
-            mock_send_email.assert_called_once_with(user_email=self.user.email, subscription_id=overdue_invoice.subscription.id)
+            mock_send_emails.assert_called_once_with([{
+                'user_email': self.user.email,
+                'subscription_ids': [str(overdue_invoice.subscription.id)],
+                'invoice_ids': [str(overdue_invoice.id)],
+            }])
+
+            # the reminder is recorded and not sent again on the next run
+            self.assertEqual(send_invoice_reminders()['emails'], 0)
+        self.assertEqual(mock_send_emails.call_count, 1)
+        reminder = InvoiceReminder.objects.get(invoice=overdue_invoice)
+        self.assertEqual(reminder.step, 2)
+
+    def create_overdue_invoice(self, sub, days_overdue):
+        return Invoice.objects.create(
+            user=sub.user,
+            subscription=sub,
+            plan=sub.plan,
+            amount=sub.plan.price,
+            issue_date=timezone.now() - timezone.timedelta(days=days_overdue + 5),
+            due_date=timezone.now() - timezone.timedelta(days=days_overdue),
+            status='overdue'
+        )
+
+    @override_settings(REMINDER_SCHEDULE_DAYS=[0, 2, 5])
+    def test_send_invoice_reminders_follows_the_schedule(self):
+        invoice = self.create_overdue_invoice(self.subscription, days_overdue=1)
+
+        with patch('api.tasks.send_subscription_overdue_emails.delay') as mock_send_emails:
+            self.assertEqual(send_invoice_reminders()['reminders'], 1)
+            self.assertEqual(send_invoice_reminders()['reminders'], 0)
+
+            # next escalation step two days after the due date
+            with patch('django.utils.timezone.now', return_value=timezone.now() + timezone.timedelta(days=1)):
+                self.assertEqual(send_invoice_reminders()['reminders'], 1)
+                self.assertEqual(send_invoice_reminders()['reminders'], 0)
+
+        self.assertEqual(mock_send_emails.call_count, 2)
+        self.assertEqual(list(invoice.reminders.order_by('step').values_list('step', flat=True)), [0, 1])
+
+    def test_send_invoice_reminders_sends_one_digest_per_user(self):
+        invoices = [self.create_overdue_invoice(self.subscription, days_overdue=days) for days in (1, 3)]
+
+        with patch('api.tasks.send_subscription_overdue_emails.delay') as mock_send_emails:
+            self.assertEqual(send_invoice_reminders(), {'reminders': 2, 'emails': 1, 'chunks': 1})
+
+        digest, = mock_send_emails.call_args.args[0]
+        self.assertEqual(digest['subscription_ids'], [str(self.subscription.id)])
+        self.assertCountEqual(digest['invoice_ids'], [str(invoice.id) for invoice in invoices])
+
+    def test_send_invoice_reminders_skips_the_steps_a_concurrent_run_recorded(self):
+        invoices = [self.create_overdue_invoice(self.subscription, days_overdue=days) for days in (1, 3)]
+        reminder_step = api.reminders.reminder_step
+
+        def recorded_concurrently(due_date, now, schedule):
+            step = reminder_step(due_date, now, schedule)
+            # another run records the first invoice after this run has read the ledger
+            if due_date == invoices[0].due_date:
+                InvoiceReminder.objects.create(invoice=invoices[0], step=step, sent_at=now)
+            return step
+
+        with patch('api.reminders.reminder_step', side_effect=recorded_concurrently), \
+                patch('api.tasks.send_subscription_overdue_emails.delay') as mock_send_emails:
+            self.assertEqual(send_invoice_reminders(), {'reminders': 1, 'emails': 1, 'chunks': 1})
+
+        digest, = mock_send_emails.call_args.args[0]
+        self.assertEqual(digest['invoice_ids'], [str(invoices[1].id)])
+        self.assertEqual(InvoiceReminder.objects.count(), 2)
+
+    @override_settings(MAIL_BATCH_SIZE=2)
+    def test_send_invoice_reminders_in_chunks(self):
+        subscriptions = self.create_monthly_subscriptions(4, timezone.now())
+        for sub in subscriptions + [self.subscription]:
+            self.create_overdue_invoice(sub, days_overdue=5)
+
+        with patch('api.tasks.send_subscription_overdue_emails.delay') as mock_send_emails:
+            self.assertEqual(send_invoice_reminders(), {'reminders': 5, 'emails': 5, 'chunks': 3})
+        self.assertEqual([len(call.args[0]) for call in mock_send_emails.call_args_list], [2, 2, 1])
+
+
+class OverdueEmailTest(APITestCase):
+
+    def setUp(self):
+        self.recipients = [
+            {'user_email': f'user{i}@example.com', 'subscription_ids': [str(uuid4())], 'invoice_ids': [str(uuid4())]}
+            for i in range(3)
+        ]
+
+    def test_send_overdue_emails_over_one_connection(self):
+        with patch('api.mails.send_subsciption_overdue_email.get_connection', wraps=get_connection) as connection:
+            result = send_subscription_overdue_emails(self.recipients)
+
+        connection.assert_called_once_with()
+        self.assertEqual(result['sent'], 3)
+        self.assertEqual([email.to for email in mail.outbox], [[r['user_email']] for r in self.recipients])
+        self.assertIn(self.recipients[0]['subscription_ids'][0], mail.outbox[0].body)
+
+    def test_overdue_digest_lists_every_invoice(self):
+        recipient = {'user_email': 'user@example.com', 'subscription_ids': [str(uuid4())],
+                     'invoice_ids': [str(uuid4()), str(uuid4())]}
+        send_subscription_overdue_emails([recipient])
+
+        self.assertEqual(len(mail.outbox), 1)
+        for invoice_id in recipient['invoice_ids']:
+            self.assertIn(invoice_id, mail.outbox[0].body)
+
+    def test_send_overdue_emails_retries_unsent_emails(self):
+        backend = get_connection()
+        backend.send_messages = Mock(side_effect=[1, smtplib.SMTPServerDisconnected()])
+        with patch('api.mails.send_subsciption_overdue_email.get_connection', return_value=backend), \
+                patch.object(send_subscription_overdue_emails, 'retry', side_effect=Retry()) as retry:
+            with self.assertRaises(Retry):
+                send_subscription_overdue_emails(self.recipients)
+
+        self.assertEqual(retry.call_args.kwargs['args'], [self.recipients[1:]])
+
+
+class WebhookEventProcessingTest(APITestCase):
+
+    def setUp(self):
+        self.user = MyUser.objects.create_user(username='webhookuser', email='webhook@example.com', password='pass')
+        self.plan = Plan.objects.create(name='Basic', description='Basic', price=100, duration=1)
+        self.subscription = Subscription.objects.create(user=self.user, plan=self.plan, start_date=timezone.now(),
+                                                        end_date=timezone.now() + timezone.timedelta(days=30))
+
+    def create_invoice(self, order_id, invoice_status='unpaid'):
+        return Invoice.objects.create(user=self.user, subscription=self.subscription, plan=self.plan, amount=100,
+                                      issue_date=timezone.now(), due_date=timezone.now(), status=invoice_status,
+                                      razorpay_order_id=order_id)
+
+    def create_event(self, event_id, event, order_id, created_at=1750000000):
+        return WebhookEvent.objects.create(event_id=event_id, event=event, payload={
+            'event': event,
+            'payload': {'payment': {'entity': {'id': f'pay_{event_id}', 'order_id': order_id}}},
+            'created_at': created_at,
+        })
+
+    def test_paid_events_mark_invoices_paid(self):
+        captured = self.create_invoice('order_1')
+        order_paid = self.create_invoice('order_2', invoice_status='overdue')
+        failed = self.create_invoice('order_3')
+        self.create_event('evt_1', 'payment.captured', 'order_1')
+        self.create_event('evt_2', 'order.paid', 'order_2')
+        self.create_event('evt_3', 'payment.failed', 'order_3')
+
+        result = process_webhook_events()
+
+        self.assertEqual(result, {'processed': 3, 'paid': 2})
+        for invoice in [captured, order_paid]:
+            invoice.refresh_from_db()
+            self.assertEqual(invoice.status, 'paid')
+            self.assertEqual(invoice.paid_at.timestamp(), 1750000000)
+        failed.refresh_from_db()
+        self.assertEqual(failed.status, 'unpaid')
+        self.assertFalse(WebhookEvent.objects.filter(processed_at__isnull=True).exists())
+        # collected on the day of the payment
+        fold_revenue_rollups()
+        rollup = DailyRevenue.objects.get(day=timezone.localdate(captured.paid_at), plan=self.plan)
+        self.assertEqual(rollup.collected, 200)
+
+    def test_events_are_processed_once(self):
+        invoice = self.create_invoice('order_1', invoice_status='paid')
+        self.create_event('evt_1', 'payment.captured', 'order_1')
+
+        self.assertEqual(process_webhook_events(), {'processed': 1, 'paid': 0})
+        self.assertEqual(process_webhook_events(), {'processed': 0, 'paid': 0})
+        invoice.refresh_from_db()
+        self.assertIsNone(invoice.paid_at)
+
+    def test_queries_per_batch_do_not_grow_with_events(self):
+        for i in range(6):
+            self.create_invoice(f'order_{i}')
+            self.create_event(f'evt_{i}', 'payment.captured', f'order_{i}')
+
+        # per batch: savepoint, events, invoices, bulk update, rollup update, events update and
+        # release, then the savepoint, query and release that find the inbox empty
+        with self.assertNumQueries(2 * 7 + 3):
+            result = process_webhook_events(batch_size=3)
+        self.assertEqual(result, {'processed': 6, 'paid': 6})
+
+
+class FakeGateway:
+    """Razorpay client stand-in answering order payment lookups, records the calls and the concurrency."""
+
+    def __init__(self, paid=None, failing=(), delay=0):
+        self.order = self
+        self.paid = paid or {}
+        self.failing = set(failing)
+        self.delay = delay
+        self.calls = []
+        self.in_flight = self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def payments(self, order_id):
+        with self.lock:
+            self.calls.append(order_id)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        if order_id in self.failing:
+            raise razorpay.errors.ServerError('Unavailable')
+        items = [{'id': f'pay_failed_{order_id}', 'status': 'failed', 'created_at': 1700000000}]
+        if order_id in self.paid:
+            items.append({'id': f'pay_{order_id}', 'status': 'captured', 'created_at': self.paid[order_id]})
+        return {'entity': 'collection', 'count': len(items), 'items': items}
+
+
+class ReconcilePaymentsTest(APITestCase):
+
+    def setUp(self):
+        self.user = MyUser.objects.create_user(username='reconcileuser', email='reconcile@example.com', password='pass')
+        self.plan = Plan.objects.create(name='Basic', description='Basic', price=100, duration=1)
+        self.subscription = Subscription.objects.create(user=self.user, plan=self.plan, start_date=timezone.now(),
+                                                        end_date=timezone.now() + timezone.timedelta(days=30))
+
+    def create_invoice(self, order_id, invoice_status='unpaid'):
+        return Invoice.objects.create(user=self.user, subscription=self.subscription, plan=self.plan, amount=100,
+                                      issue_date=timezone.now(), due_date=timezone.now(), status=invoice_status,
+                                      razorpay_order_id=order_id)
+
+    def test_paid_orders_are_applied(self):
+        unpaid = self.create_invoice('order_1')
+        overdue = self.create_invoice('order_2', invoice_status='overdue')
+        not_paid = self.create_invoice('order_3')
+        self.create_invoice('order_4', invoice_status='paid')
+        self.create_invoice(None)
+        gateway = FakeGateway(paid={'order_1': 1750000000, 'order_2': 1750000100, 'order_4': 1750000200})
+
+        result = reconcile_orders(page_size=2, client=gateway)
+
+        self.assertEqual(result, {'checked': 3, 'paid': 2, 'errors': 0, 'complete': True})
+        self.assertEqual(sorted(gateway.calls), ['order_1', 'order_2', 'order_3'])
+        for invoice, paid_at in [(unpaid, 1750000000), (overdue, 1750000100)]:
+            invoice.refresh_from_db()
+            self.assertEqual(invoice.status, 'paid')
+            self.assertEqual(invoice.paid_at.timestamp(), paid_at)
+        not_paid.refresh_from_db()
+        self.assertEqual(not_paid.status, 'unpaid')
+        # a complete pass starts from the beginning next time
+        self.assertIsNone(ReconciliationCheckpoint.objects.get().last_id)
+
+    def test_gateway_requests_are_bounded(self):
+        for i in range(9):
+            self.create_invoice(f'order_{i}')
+        gateway = FakeGateway(delay=0.05)
+
+        reconcile_orders(page_size=9, concurrency=3, client=gateway)
+
+        self.assertEqual(len(gateway.calls), 9)
+        self.assertEqual(gateway.max_in_flight, 3)
+
+    def test_interrupted_run_resumes_from_checkpoint(self):
+        for i in range(6):
+            self.create_invoice(f'order_{i}')
+        gateway = FakeGateway(paid={f'order_{i}': 1750000000 for i in range(6)}, delay=0.02)
+
+        first = reconcile_orders(page_size=2, concurrency=1, time_limit=0.01, client=gateway)
+        self.assertEqual(first, {'checked': 2, 'paid': 2, 'errors': 0, 'complete': False})
+        self.assertIsNotNone(ReconciliationCheckpoint.objects.get().last_id)
+
+        second = reconcile_orders(page_size=2, client=gateway)
+        self.assertEqual(second, {'checked': 4, 'paid': 4, 'errors': 0, 'complete': True})
+        # every order was checked once
+        self.assertEqual(sorted(gateway.calls), [f'order_{i}' for i in range(6)])
+
+    def test_gateway_errors_leave_invoices_unpaid(self):
+        invoice = self.create_invoice('order_1')
+        gateway = FakeGateway(paid={'order_1': 1750000000}, failing=['order_1'])
+
+        with patch('api.reconciliation.get_razorpay_client', return_value=gateway):
+            result = reconcile_payments()
+
+        self.assertEqual(result, {'checked': 1, 'paid': 0, 'errors': 1, 'complete': True})
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.status, 'unpaid')
+
+
+class ArchiveOldInvoicesTest(APITestCase):
+
+    def setUp(self):
+        self.user = MyUser.objects.create_user(username='archiveuser', email='archive@example.com', password='pass')
+        self.plan = Plan.objects.create(name='Basic', description='Basic', price=100, duration=1)
+        self.subscription = Subscription.objects.create(user=self.user, plan=self.plan, start_date=timezone.now(),
+                                                        end_date=timezone.now() + timezone.timedelta(days=30))
+        self.old_paid = self.create_invoice(months_ago=30, invoice_status='paid')
+        self.older_paid = self.create_invoice(months_ago=40, invoice_status='paid')
+        self.old_unpaid = self.create_invoice(months_ago=30, invoice_status='overdue')
+        self.recent_paid = self.create_invoice(months_ago=1, invoice_status='paid')
+        InvoiceReminder.objects.create(invoice=self.old_paid, step=0, sent_at=self.old_paid.due_date)
+        self.directory = tempfile.mkdtemp()
+
+    def create_invoice(self, months_ago, invoice_status):
+        issue_date = timezone.now() - relativedelta(months=months_ago)
+        return Invoice.objects.create(user=self.user, subscription=self.subscription, plan=self.plan, amount=100,
+                                      issue_date=issue_date, due_date=issue_date + timezone.timedelta(days=5),
+                                      status=invoice_status, paid_at=issue_date if invoice_status == 'paid' else None,
+                                      razorpay_order_id=f'order_{months_ago}_{invoice_status}')
+
+    def archive(self, retention_months=84):
+        with override_settings(INVOICE_ARCHIVE_DIR=self.directory, INVOICE_ARCHIVE_RETENTION_MONTHS=retention_months), \
+                self.captureOnCommitCallbacks(execute=True):
+            return archive_old_invoices()
+
+    def test_old_paid_invoices_are_archived(self):
+        result = self.archive()
+
+        self.assertEqual(result['archived'], 2)
+        self.assertEqual(result['exported'], [])
+        self.assertEqual(set(Invoice.objects.values_list('id', flat=True)), {self.old_unpaid.id, self.recent_paid.id})
+        self.assertFalse(InvoiceReminder.objects.exists())
+        archived = ArchivedInvoice.objects.get(id=self.old_paid.id)
+        self.assertEqual(archived.amount, self.old_paid.amount)
+        self.assertEqual(archived.paid_at, self.old_paid.paid_at)
+        self.assertEqual(archived.razorpay_order_id, self.old_paid.razorpay_order_id)
+        self.assertEqual(archived.user_id, self.user.id)
+        with self.assertRaises(ReadOnlyError):
+            archived.save()
+        with self.assertRaises(ReadOnlyError):
+            archived.delete()
+
+        # nothing left to move
+        self.assertEqual(self.archive()['archived'], 0)
+
+    def test_partitions_are_created_ahead(self):
+        cutoff = archive_cutoff()
+        with override_settings(INVOICE_ARCHIVE_AFTER_MONTHS=24):
+            created = create_archive_partitions(months_ahead=2)
+
+        months = sorted(archive_partitions())
+        self.assertEqual(len(created), len(months))
+        self.assertEqual(months[0], self.older_paid.issue_date.astimezone(dt_timezone.utc).date().replace(day=1))
+        self.assertEqual(months[-1], cutoff + relativedelta(months=2))
+        self.assertEqual(create_archive_partitions(months_ahead=2), [])
+
+    def test_old_partitions_are_exported_and_stay_readable(self):
+        self.archive()
+        result = self.archive(retention_months=36)
+
+        # every month older than 36 months, also the empty ones
+        month = self.older_paid.issue_date.astimezone(dt_timezone.utc).date().replace(day=1)
+        self.assertIn(partition_name(month), [os.path.basename(path).split('.')[0] for path in result['exported']])
+        self.assertTrue(all(os.path.exists(path) for path in result['exported']))
+        self.assertNotIn(month, archive_partitions())
+        self.assertIn(self.old_paid.issue_date.astimezone(dt_timezone.utc).date().replace(day=1), archive_partitions())
+        self.assertFalse(ArchivedInvoice.objects.filter(id=self.older_paid.id).exists())
+
+        with override_settings(INVOICE_ARCHIVE_DIR=self.directory):
+            exported = find_archived_invoice(self.older_paid.id)
+            attached = find_archived_invoice(self.old_paid.id)
+            missing = find_archived_invoice(self.recent_paid.id)
+        self.assertEqual(exported.amount, self.older_paid.amount)
+        self.assertEqual(exported.paid_at, self.older_paid.paid_at)
+        self.assertEqual(exported.subscription_id, self.subscription.id)
+        self.assertEqual(attached.id, self.old_paid.id)
+        self.assertIsNone(missing)
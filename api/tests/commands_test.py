@@ -0,0 +1,247 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from dateutil.relativedelta import relativedelta
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import Sum
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from api.archive import archive_invoices, archive_partitions
+from api.models import ArchivedInvoice, DailyRevenue, Invoice, MyUser, Plan, Subscription
+
+
+class BackfillInvoicesCommandTest(APITestCase):
+
+    def setUp(self):
+        self.user = MyUser.objects.create_user(
+            username='testuser',
+            email='testuser@example.com',
+            password='testpassword'
+        )
+        self.plan = Plan.objects.create(name='Basic', price=499, duration=1, is_active=True)
+        self.start = timezone.now() - relativedelta(months=3, days=2)
+        self.subscription = Subscription.objects.create(
+            user=self.user,
+            plan=self.plan,
+            start_date=self.start,
+            end_date=self.start + relativedelta(months=1),
+            status='active'
+        )
+        # first cycle invoiced at sign up, the following ones were missed
+        Invoice.objects.create(
+            user=self.user,
+            subscription=self.subscription,
+            plan=self.plan,
+            amount=499,
+            issue_date=self.start,
+            due_date=self.start + timezone.timedelta(days=5),
+            billing_period_start=self.start.date(),
+            billing_period_end=self.start.date() + relativedelta(months=1),
+            status='paid'
+        )
+
+    def test_backfill_creates_missed_cycles_once(self):
+        out = StringIO()
+        with patch('builtins.print'):
+            call_command('backfill_invoices', since=self.start.date().isoformat(), stdout=out)
+            call_command('backfill_invoices', since=self.start.date().isoformat(), stdout=StringIO())
+
+        self.assertIn('Created 3 invoices', out.getvalue())
+        starts = list(Invoice.objects.filter(subscription=self.subscription)
+                      .order_by('billing_period_start').values_list('billing_period_start', flat=True))
+        self.assertEqual(starts, [self.start.date() + relativedelta(months=i) for i in range(4)])
+
+        self.subscription.refresh_from_db()
+        self.assertEqual(self.subscription.next_billing_date, self.start.date() + relativedelta(months=4))
+
+    def test_backfill_only_bills_the_given_range(self):
+        since = self.start.date() + relativedelta(months=2)
+        with patch('builtins.print'):
+            call_command('backfill_invoices', since=since.isoformat(), until=since.isoformat(), stdout=StringIO())
+
+        self.assertEqual(Invoice.objects.filter(billing_period_start=since).count(), 1)
+        self.assertEqual(Invoice.objects.count(), 2)
+
+    def test_backfill_skips_archived_cycles(self):
+        with override_settings(INVOICE_ARCHIVE_AFTER_MONTHS=0):
+            archive_invoices()
+        self.assertFalse(Invoice.objects.exists())
+
+        with patch('builtins.print'):
+            call_command('backfill_invoices', since=self.start.date().isoformat(), stdout=StringIO())
+
+        # the paid first cycle is not billed again
+        starts = set(Invoice.objects.values_list('billing_period_start', flat=True))
+        self.assertEqual(starts, {self.start.date() + relativedelta(months=i) for i in range(1, 4)})
+
+    @override_settings(INVOICE_ARCHIVE_RETENTION_MONTHS=2)
+    def test_backfill_starts_at_the_archive_retention(self):
+        with patch('builtins.print'):
+            call_command('backfill_invoices', since=self.start.date().isoformat(), stdout=StringIO())
+
+        # the months of exported partitions are not billed
+        oldest = timezone.now().date().replace(day=1) - relativedelta(months=2)
+        self.assertFalse(Invoice.objects.filter(billing_period_start__lt=oldest, status='unpaid').exists())
+        self.assertTrue(Invoice.objects.filter(billing_period_start__gte=oldest, status='unpaid').exists())
+
+    def test_backfill_rejects_invalid_range(self):
+        with self.assertRaises(CommandError):
+            call_command('backfill_invoices', since='2025-02-01', until='2025-01-01')
+
+
+class SeedBillingDataCommandTest(APITestCase):
+
+    def test_seed_creates_synthetic_data(self):
+        call_command('seed_billing_data', users=30, batch_size=7, stdout=StringIO())
+
+        users = MyUser.objects.filter(username__startswith='synthetic')
+        self.assertEqual(users.count(), 30)
+        self.assertEqual(Subscription.objects.filter(user__in=users).count(), 30)
+        self.assertEqual(Plan.objects.count(), 3)
+        # every subscription has its first cycle invoiced and is due in the future or today
+        for sub in Subscription.objects.filter(user__in=users):
+            self.assertTrue(sub.invoices.filter(billing_period_start=sub.start_date.date()).exists())
+            self.assertGreaterEqual(sub.next_billing_date, timezone.now().date())
+
+    def test_seed_flush_replaces_synthetic_data(self):
+        call_command('seed_billing_data', users=5, stdout=StringIO())
+        call_command('seed_billing_data', users=3, flush=True, stdout=StringIO())
+
+        self.assertEqual(MyUser.objects.filter(username__startswith='synthetic').count(), 3)
+        self.assertEqual(Subscription.objects.count(), 3)
+
+
+class BenchmarkBillingCommandTest(APITestCase):
+
+    def test_benchmark_stores_results(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            call_command('benchmark_billing', scales='10', only='generate_daily_invoice,GET invoices',
+                         label='test', output=output, stdout=StringIO())
+            with open(output) as f:
+                results = json.load(f)
+
+        self.assertEqual(results['label'], 'test')
+        self.assertEqual(set(results['results']['10']), {'generate_daily_invoice', 'GET invoices'})
+        self.assertEqual(set(results['results']['10']['GET invoices']), {'seconds', 'queries', 'peak_memory_kb'})
+
+
+class BenchmarkSerializersCommandTest(APITestCase):
+
+    def test_reports_rows_per_second(self):
+        call_command('seed_billing_data', users=5, stdout=StringIO())
+        out = StringIO()
+        call_command('benchmark_serializers', rows=50, repeat=1, stdout=out)
+
+        self.assertIn('invoices', out.getvalue())
+        self.assertIn('subscriptions', out.getvalue())
+        self.assertIn('rows/s', out.getvalue())
+
+    def test_fails_without_data(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark_serializers', stdout=StringIO())
+
+
+class ExportInvoicesCommandTest(APITestCase):
+
+    def setUp(self):
+        call_command('seed_billing_data', users=10, stdout=StringIO())
+
+    def test_exports_to_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'invoices.csv')
+            with self.settings(EXPORT_CHUNK_SIZE=7):
+                call_command('export_invoices', export_format='csv', output=output, stdout=StringIO())
+            with open(output) as f:
+                lines = f.read().splitlines()
+
+        self.assertEqual(lines[0].split(',')[0], 'id')
+        self.assertEqual(len(lines) - 1, Invoice.objects.count())
+
+    def test_exports_filtered_ndjson_to_stdout(self):
+        out = StringIO()
+        call_command('export_invoices', status='paid', stdout=out)
+
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(rows), Invoice.objects.filter(status='paid').count())
+        self.assertEqual({row['status'] for row in rows}, {'paid'})
+
+    def test_rejects_invalid_filters(self):
+        with self.assertRaises(CommandError):
+            call_command('export_invoices', since='2025-02-01', until='2025-01-01', stdout=StringIO())
+
+
+class BenchmarkSignaturesCommandTest(APITestCase):
+
+    def test_reports_signatures_per_second(self):
+        out = StringIO()
+        with self.settings(RAZORPAY_KEY_ID='rzp_test', RAZORPAY_KEY_SECRET='secret'):
+            call_command('benchmark_signatures', count=20, stdout=out)
+
+        for name in ['sdk client', 'local', 'local batch']:
+            self.assertIn(name, out.getvalue())
+
+
+class RebuildRevenueRollupsCommandTest(APITestCase):
+
+    def test_rebuild_aggregates_live_and_archived_invoices(self):
+        call_command('seed_billing_data', users=20, months=48, stdout=StringIO())
+        archive_invoices()
+        DailyRevenue.objects.all().delete()
+
+        out = StringIO()
+        call_command('rebuild_revenue_rollups', stdout=out)
+
+        self.assertIn('daily revenue rows rebuilt', out.getvalue())
+        totals = DailyRevenue.objects.aggregate(invoiced=Sum('invoiced'), collected=Sum('collected'),
+                                                outstanding=Sum('outstanding'))
+        live, archived = Invoice.objects.all(), ArchivedInvoice.objects.all()
+        self.assertTrue(archived.exists())
+        amount = lambda invoices: invoices.aggregate(amount=Sum('amount'))['amount'] or 0
+        self.assertEqual(totals['invoiced'], amount(live) + amount(archived))
+        self.assertEqual(totals['collected'], amount(live.filter(status='paid')) + amount(archived))
+        self.assertEqual(totals['outstanding'], amount(live.exclude(status='paid')))
+        self.assertEqual(DailyRevenue.objects.filter(day=timezone.localdate()).aggregate(
+            active=Sum('active_subscribers'))['active'], Subscription.objects.filter(status='active').count())
+
+        # running it again changes nothing
+        rows = list(DailyRevenue.objects.order_by('day', 'plan_id').values_list('day', 'plan_id', 'invoiced',
+                                                                                'collected', 'outstanding'))
+        call_command('rebuild_revenue_rollups', stdout=StringIO())
+        self.assertEqual(list(DailyRevenue.objects.order_by('day', 'plan_id').values_list(
+            'day', 'plan_id', 'invoiced', 'collected', 'outstanding')), rows)
+
+
+class InvoiceArchiveCommandsTest(APITestCase):
+
+    def setUp(self):
+        call_command('seed_billing_data', users=20, months=48, stdout=StringIO())
+
+    def test_create_partitions_is_idempotent(self):
+        out = StringIO()
+        call_command('create_invoice_partitions', months_ahead=1, stdout=out)
+
+        self.assertIn('partitions created', out.getvalue())
+        self.assertGreater(len(archive_partitions()), 1)
+        out = StringIO()
+        call_command('create_invoice_partitions', months_ahead=1, stdout=out)
+        self.assertIn('0 partitions created', out.getvalue())
+
+    def test_find_archived_invoice(self):
+        invoice = Invoice.objects.filter(status='paid').order_by('issue_date').first()
+        archive_invoices()
+
+        out = StringIO()
+        call_command('find_archived_invoice', str(invoice.id), stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['id'], str(invoice.id))
+
+        with self.assertRaises(CommandError):
+            call_command('find_archived_invoice', str(Invoice.objects.first().id), stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('find_archived_invoice', 'not-a-uuid', stdout=StringIO())
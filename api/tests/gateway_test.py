@@ -0,0 +1,119 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import razorpay
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.gateway import get_razorpay_client
+from api.models import Invoice, MyUser, Plan, Subscription
+
+
+class StubGatewayHandler(BaseHTTPRequestHandler):
+    """Answers every request with the next queued (status, delay) of the server, 200 when the queue is empty."""
+    protocol_version = 'HTTP/1.1'
+
+    def handle_request(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        self.server.requests.append((self.command, self.path, self.client_address))
+        status_code, delay = self.server.responses.pop(0) if self.server.responses else (200, 0)
+        time.sleep(delay)
+        if status_code == 200:
+            body = {'id': f'order_stub{len(self.server.requests)}', 'status': 'created'}
+        else:
+            body = {'error': {'code': 'SERVER_ERROR', 'description': 'Unavailable'}}
+        content = json.dumps(body).encode()
+        try:
+            self.send_response(status_code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client timed out
+            pass
+
+    do_GET = do_POST = handle_request
+
+    def log_message(self, *args):
+        pass
+
+
+class StubGateway(ThreadingHTTPServer):
+    daemon_threads = True
+    block_on_close = False
+
+
+class RazorpayGatewayTest(APITestCase):
+
+    def setUp(self):
+        self.server = StubGateway(('127.0.0.1', 0), StubGatewayHandler)
+        self.server.requests = []
+        self.server.responses = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        settings = override_settings(RAZORPAY_BASE_URL=f'http://127.0.0.1:{self.server.server_port}',
+                                     RAZORPAY_READ_TIMEOUT=0.5, RAZORPAY_MAX_RETRIES=2)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.user = MyUser.objects.create_user(username='gatewayuser', email='gateway@example.com',
+                                               password='password123')
+        self.auth_headers = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+        plan = Plan.objects.create(name='Basic', description='Basic', price=100, duration=1)
+        subscription = Subscription.objects.create(user=self.user, plan=plan, start_date=timezone.now(),
+                                                   end_date=timezone.now() + timezone.timedelta(days=30))
+        self.invoices = [
+            Invoice.objects.create(user=self.user, subscription=subscription, plan=plan, amount=100,
+                                   issue_date=timezone.now(), due_date=timezone.now(), status='unpaid')
+            for _ in range(2)
+        ]
+
+    def create_order(self, invoice):
+        return self.client.post(reverse('create-razorpay-order'), {'invoice_id': str(invoice.id)},
+                                **self.auth_headers)
+
+    def test_orders_reuse_one_client_and_connection(self):
+        for invoice in self.invoices:
+            response = self.create_order(invoice)
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.assertIs(get_razorpay_client(), get_razorpay_client())
+        self.assertEqual([request[:2] for request in self.server.requests], [('POST', '/v1/orders')] * 2)
+        # same client port, the keep-alive connection was reused
+        self.assertEqual(len({request[2] for request in self.server.requests}), 1)
+
+    def test_slow_gateway_times_out(self):
+        self.server.responses = [(200, 2)]
+
+        started = time.monotonic()
+        response = self.create_order(self.invoices[0])
+
+        self.assertEqual(response.status_code, status.HTTP_502_BAD_GATEWAY)
+        self.assertLess(time.monotonic() - started, 1.5)
+        # creating an order is not idempotent, it is not retried
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_idempotent_requests_are_retried(self):
+        self.server.responses = [(503, 0), (503, 0)]
+
+        order = get_razorpay_client().order.fetch('order_stub')
+
+        self.assertEqual(order['status'], 'created')
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_order_creation_is_not_retried_on_errors(self):
+        self.server.responses = [(503, 0)]
+
+        with self.assertRaises(razorpay.errors.ServerError):
+            get_razorpay_client().order.create(data={'amount': 100, 'currency': 'INR', 'receipt': 'r'})
+        self.assertEqual(len(self.server.requests), 1)
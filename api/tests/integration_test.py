@@ -4,6 +4,7 @@ from django.utils import timezone
 from datetime import datetime, timedelta
 from api.models import Invoice, MyUser, Plan, Subscription
 from dateutil.relativedelta import relativedelta
+from django.db import IntegrityError
 
 
 class MyUserTestCase(APITestCase):
@@ -117,3 +118,16 @@ class InvoiceTestCase(APITestCase):
         self.assertEqual(self.invoice.billing_period_start, self.invoice.issue_date.date())
         self.assertEqual(self.invoice.billing_period_end, self.invoice.issue_date +
                          relativedelta(months=self.plan.duration))
+
+    def test_invoice_billing_cycle_is_unique(self):
+        with self.assertRaises(IntegrityError):
+            Invoice.objects.create(
+                user=self.user,
+                subscription=self.subscription,
+                plan=self.plan,
+                amount=self.plan.price,
+                issue_date=timezone.now(),
+                due_date=timezone.now() + timedelta(days=5),
+                billing_period_start=self.invoice.billing_period_start,
+                status='unpaid',
+            )
@@ -0,0 +1,94 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.models import Invoice, Subscription
+from api.views import InvoiceListView, SubscriptionListView
+
+
+class HotQueryPlanTest(APITestCase):
+    """
+    EXPLAIN the hot queries of the views and tasks on synthetic data. Sequential scans are
+    disabled, a query that still scans a whole table has no index it can use.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_billing_data', users=300, stdout=StringIO())
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE api_invoice, api_subscription')
+        cls.subscription = Subscription.objects.filter(status='active').select_related('user').first()
+        cls.user = cls.subscription.user
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            # reset with the test transaction
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        self.assertNoSeqScan(plan, queryset.query)
+
+    def assertNoSeqScan(self, plan, query):
+        for table in ['api_invoice', 'api_subscription']:
+            self.assertNotIn(f'Seq Scan on {table}', plan, f"{query}\n{plan}")
+
+    def assertViewUsesIndex(self, name, params=None):
+        """EXPLAIN the queries the view actually sends for the billing tables."""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(reverse(name), params).status_code, 200)
+        explained = 0
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if sql.startswith('SELECT') and ('"api_invoice"' in sql or '"api_subscription"' in sql):
+                with connection.cursor() as cursor:
+                    cursor.execute(f'EXPLAIN {sql}')
+                    plan = '\n'.join(row for row, in cursor.fetchall())
+                    self.assertNoSeqScan(plan, sql)
+                explained += 1
+        self.assertGreater(explained, 0)
+
+    def test_invoice_views(self):
+        # latest invoice and the first and following pages of the list
+        self.assertViewUsesIndex('latest-invoice')
+        self.assertViewUsesIndex('invoice-list')
+        last = Invoice.objects.filter(user=self.user).order_by('-issue_date', '-id').first()
+        self.assertViewUsesIndex('invoice-list', {'cursor': InvoiceListView.paginator.encode_cursor(last)})
+
+    def test_subscription_views(self):
+        self.assertUsesIndex(Subscription.objects.filter(user=self.user, status='active'))
+        self.assertViewUsesIndex('subscription-list')
+        self.assertViewUsesIndex('subscription-list', {
+            'cursor': SubscriptionListView.paginator.encode_cursor(self.subscription)})
+
+    def test_billing_run(self):
+        today = timezone.now().date()
+        self.assertUsesIndex(Subscription.objects.filter(status='active', next_billing_date__lte=today))
+
+    def test_mark_overdue_invoices(self):
+        now = timezone.now()
+        self.assertUsesIndex(Invoice.objects.filter(status='unpaid', due_date__lt=now))
+        past_grace = Invoice.objects.filter(status='overdue', due_date__lt=now - timedelta(days=7))
+        self.assertUsesIndex(Subscription.objects.filter(status='active', id__in=past_grace.values('subscription_id')))
+
+    def test_invoice_reminders(self):
+        self.assertUsesIndex(Invoice.objects.filter(status='overdue', subscription__status='active',
+                                                    due_date__lte=timezone.now()))
+
+    def test_payment_lookups(self):
+        order_id = Invoice.objects.filter(razorpay_order_id__isnull=False).values_list('razorpay_order_id',
+                                                                                      flat=True).first()
+        # verify-payment and the webhooks
+        self.assertUsesIndex(Invoice.objects.filter(user=self.user, razorpay_order_id=order_id))
+        self.assertUsesIndex(Invoice.objects.filter(razorpay_order_id__in=[order_id]).exclude(status='paid'))
+        # a reconciliation page
+        self.assertUsesIndex(Invoice.objects.filter(status__in=['unpaid', 'overdue'], razorpay_order_id__isnull=False)
+                             .exclude(razorpay_order_id='').order_by('id')[:500])
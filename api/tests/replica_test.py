@@ -0,0 +1,90 @@
+from unittest.mock import patch
+
+from django.db import connections
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.authentication import user_cache
+from api.models import Invoice, MyUser, Plan, Subscription
+from api.replica import ReplicaRouter, read_database, read_from_replica
+
+
+@override_settings(READ_REPLICA_ALIAS='replica')
+class ReplicaRouterTest(SimpleTestCase):
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def test_reads_go_to_the_replica_only_inside_the_block(self):
+        self.assertIsNone(self.router.db_for_read(Invoice))
+        with read_from_replica():
+            self.assertEqual(self.router.db_for_read(Invoice), 'replica')
+        self.assertIsNone(self.router.db_for_read(Invoice))
+
+    def test_reads_are_pinned_to_the_primary_after_a_write(self):
+        with read_from_replica():
+            self.assertIsNone(self.router.db_for_write(Invoice))
+            self.assertIsNone(self.router.db_for_read(Invoice))
+        # the next block starts on the replica again
+        with read_from_replica():
+            self.assertEqual(self.router.db_for_read(Invoice), 'replica')
+
+    def test_reads_in_a_transaction_use_the_primary(self):
+        with read_from_replica(), patch.object(connections['default'], 'in_atomic_block', True):
+            self.assertIsNone(self.router.db_for_read(Invoice))
+
+    @override_settings(READ_REPLICA_ALIAS=None)
+    def test_without_replica_everything_uses_the_primary(self):
+        with read_from_replica():
+            self.assertIsNone(self.router.db_for_read(Invoice))
+
+    def test_reports_read_from_the_replica(self):
+        self.assertEqual(read_database(), 'replica')
+        with self.settings(READ_REPLICA_ALIAS=None):
+            self.assertEqual(read_database(), 'default')
+
+    def test_replica_is_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'api'))
+        self.assertIsNone(self.router.allow_migrate('default', 'api'))
+
+
+@override_settings(READ_REPLICA_ALIAS='replica')
+class ReplicaViewRoutingTest(TransactionTestCase):
+    """Records where the router sends the reads, the queries themselves still run on the test database."""
+
+    def setUp(self):
+        self.user = MyUser.objects.create_user(username='replicauser', email='replica@example.com', password='pass')
+        self.plan = Plan.objects.create(name='Basic', description='Basic', price=100, duration=1)
+        subscription = Subscription.objects.create(user=self.user, plan=self.plan, start_date=timezone.now(),
+                                                   end_date=timezone.now() + timezone.timedelta(days=30))
+        Invoice.objects.create(user=self.user, subscription=subscription, plan=self.plan, amount=100,
+                               issue_date=timezone.now(), due_date=timezone.now(), status='unpaid')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        user_cache.clear()
+        self.reads = []
+
+    def route(self, name, method='get', data=None):
+        route = ReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            self.reads.append((model, route(router, model, **hints)))
+
+        with patch.object(ReplicaRouter, 'db_for_read', record):
+            return getattr(self.client, method)(reverse(name), data)
+
+    def test_read_only_views_use_the_replica_after_authentication(self):
+        for name in ['invoice-list', 'latest-invoice', 'subscription-list']:
+            self.reads.clear()
+            user_cache.clear()
+            self.assertEqual(self.route(name).status_code, 200)
+            self.assertEqual(self.reads[0], (MyUser, None))
+            self.assertEqual({alias for model, alias in self.reads[1:]}, {'replica'})
+
+    def test_other_views_use_the_primary(self):
+        Subscription.objects.update(status='cancelled')
+        self.assertEqual(self.route('subscribe', 'post', {'plan_id': self.plan.id}).status_code, 201)
+        self.assertEqual({alias for _, alias in self.reads}, {None})
@@ -0,0 +1,62 @@
+from decimal import Decimal
+
+from django.http import JsonResponse
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from api.models import Invoice, MyUser, Plan, Subscription
+from api.serializers import (InvoiceSerializer, PlanSerializer, SubscriptionSerializer, invoice_fast_serializer,
+                             plan_fast_serializer, subscription_fast_serializer)
+
+
+class FastReadSerializerTest(APITestCase):
+
+    def setUp(self):
+        self.user = MyUser.objects.create_user(username='fastuser', email='fast@example.com', password='password123')
+        self.plans = [
+            Plan.objects.create(name='Basic', description=None, price=Decimal('99.5'), duration=1),
+            Plan.objects.create(name='Premium', description='All features', price=Decimal('1299'), duration=12,
+                                is_active=False),
+        ]
+        now = timezone.now()
+        for index, plan in enumerate(self.plans):
+            sub = Subscription.objects.create(
+                user=self.user,
+                plan=plan,
+                start_date=now - timezone.timedelta(days=40 * index, microseconds=index),
+                end_date=now + timezone.timedelta(days=30),
+                status=['active', 'cancelled'][index],
+            )
+            for days_ago, status, order_id in [(0, 'unpaid', None), (31, 'paid', 'order_1'), (62, 'overdue', '')]:
+                Invoice.objects.create(
+                    user=self.user,
+                    subscription=sub,
+                    plan=plan,
+                    amount=plan.price,
+                    issue_date=now - timezone.timedelta(days=days_ago, hours=index),
+                    due_date=now - timezone.timedelta(days=days_ago - 5),
+                    status=status,
+                    razorpay_order_id=order_id,
+                )
+
+    def assertSameJson(self, serializer_class, fast_serializer, queryset):
+        expected = JsonResponse(serializer_class(queryset, many=True).data, safe=False).content
+        actual = JsonResponse(fast_serializer.serialize(fast_serializer.get_queryset(queryset)), safe=False).content
+        self.assertEqual(actual, expected)
+
+    def test_output_is_identical_to_drf_serializers(self):
+        self.assertSameJson(PlanSerializer, plan_fast_serializer, Plan.objects.all())
+        self.assertSameJson(SubscriptionSerializer, subscription_fast_serializer, Subscription.objects.all())
+        self.assertSameJson(InvoiceSerializer, invoice_fast_serializer, Invoice.objects.all())
+
+    @override_settings(TIME_ZONE='UTC')
+    def test_output_is_identical_in_utc(self):
+        self.assertSameJson(InvoiceSerializer, invoice_fast_serializer, Invoice.objects.all())
+
+    def test_reads_nested_relations_in_one_query(self):
+        with self.assertNumQueries(1):
+            data = invoice_fast_serializer.serialize(invoice_fast_serializer.get_queryset(Invoice.objects.all()))
+        self.assertEqual(len(data), 6)
+        self.assertEqual(set(data[0]['subscription']['plan']), {'id', 'name', 'description', 'price',
+                                                               'duration_in_months', 'is_active'})
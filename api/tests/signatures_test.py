@@ -0,0 +1,55 @@
+import hashlib
+import hmac
+
+import razorpay
+from django.test import SimpleTestCase, override_settings
+
+from api.signatures import (payment_signature, verify_payment_signature, verify_payment_signatures,
+                            verify_webhook_signature)
+
+
+@override_settings(RAZORPAY_KEY_SECRET='key-secret', RAZORPAY_WEBHOOK_SECRET='webhook-secret')
+class SignatureTest(SimpleTestCase):
+
+    def test_payment_signature_matches_razorpay_sdk(self):
+        signature = payment_signature('order_1', 'pay_1')
+
+        client = razorpay.Client(auth=('rzp_test', 'key-secret'))
+        self.assertTrue(client.utility.verify_payment_signature({
+            'razorpay_order_id': 'order_1', 'razorpay_payment_id': 'pay_1', 'razorpay_signature': signature,
+        }))
+        self.assertTrue(verify_payment_signature('order_1', 'pay_1', signature))
+
+    def test_rejects_wrong_signatures(self):
+        signature = payment_signature('order_1', 'pay_1')
+
+        self.assertFalse(verify_payment_signature('order_1', 'pay_2', signature))
+        self.assertFalse(verify_payment_signature('order_1', 'pay_1', signature, secret='other-secret'))
+        self.assertFalse(verify_payment_signature('order_1', 'pay_1', 'dummy_signature'))
+
+    def test_secret_change_is_picked_up(self):
+        signature = payment_signature('order_1', 'pay_1')
+
+        with self.settings(RAZORPAY_KEY_SECRET='rotated-secret'):
+            self.assertFalse(verify_payment_signature('order_1', 'pay_1', signature))
+
+    def test_batch_verification(self):
+        payments = [(f'order_{i}', f'pay_{i}', payment_signature(f'order_{i}', f'pay_{i}')) for i in range(5)]
+        payments[2] = ('order_2', 'pay_2', 'forged')
+
+        self.assertEqual(verify_payment_signatures(payments), [True, True, False, True, True])
+
+    def test_webhook_signature(self):
+        body = b'{"event": "payment.captured"}'
+        signature = hmac.new(b'webhook-secret', body, hashlib.sha256).hexdigest()
+
+        self.assertTrue(verify_webhook_signature(body, signature))
+        self.assertFalse(verify_webhook_signature(body + b' ', signature))
+        self.assertFalse(verify_webhook_signature(body, None))
+
+    @override_settings(RAZORPAY_WEBHOOK_SECRET=None)
+    def test_webhook_signature_without_secret(self):
+        body = b'{"event": "payment.captured"}'
+        signature = hmac.new(b'webhook-secret', body, hashlib.sha256).hexdigest()
+
+        self.assertFalse(verify_webhook_signature(body, signature))
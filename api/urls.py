@@ -1,6 +1,7 @@
 from django.urls import path
 from .views import (SubscriptionView, UnSubscriptionView, SubscriptionListView, PlanListView, PayInvoiceView,
-                    InvoiceListView, GetLatestInvoiceView, SignupView, CreateRazorPayInvoiceOrderView, VerifyRazorPayPaymentView)
+                    InvoiceListView, GetLatestInvoiceView, SignupView, CreateRazorPayInvoiceOrderView, VerifyRazorPayPaymentView,
+                    InvoiceExportView, RazorpayWebhookView, RevenueMetricsView)
 urlpatterns = [
     path("signup/", SignupView.as_view(), name="signup"),
     path("plans/", PlanListView.as_view(), name="plan-list"),
@@ -10,8 +11,11 @@ urlpatterns = [
     path("invoice/pay/", PayInvoiceView.as_view(), name="pay-invoice"),
     path("invoices/", InvoiceListView.as_view(), name="invoice-list"),
     path("invoice/latest/", GetLatestInvoiceView.as_view(), name="latest-invoice"),
+    path("invoices/export/", InvoiceExportView.as_view(), name="invoice-export"),
+    path("metrics/revenue/", RevenueMetricsView.as_view(), name="revenue-metrics"),
 
     # payments
     path("invoice/create-order/", CreateRazorPayInvoiceOrderView.as_view(), name="create-razorpay-order"),
     path("invoice/verify-payment/", VerifyRazorPayPaymentView.as_view(), name="verify-razorpay-payment"),
+    path("webhooks/razorpay/", RazorpayWebhookView.as_view(), name="razorpay-webhook"),
 ]
@@ -2,3 +2,6 @@ from .user_views import SignupView
 from .subscription_views import PlanListView, SubscriptionView, UnSubscriptionView, SubscriptionListView
 from .invoice_views import InvoiceListView, GetLatestInvoiceView
 from .payment_views import PayInvoiceView, CreateRazorPayInvoiceOrderView, VerifyRazorPayPaymentView
+from .export_views import InvoiceExportView
+from .webhook_views import RazorpayWebhookView
+from .metrics_views import RevenueMetricsView
@@ -0,0 +1,33 @@
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework import permissions, status
+from rest_framework.views import APIView
+
+from api.authentication import CachedJWTAuthentication
+from api.exports import EXPORT_FORMATS, export_invoices, iter_export, parse_export_filters
+
+
+class InvoiceExportView(APIView):
+    """
+    Staff only export of every invoice, streamed as NDJSON (default) or CSV.
+    Query: `?output=ndjson|csv&since=YYYY-MM-DD&until=YYYY-MM-DD&status=&plan=<plan id>`,
+    `format` is taken by DRF's renderer selection.
+    """
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        export_format = request.query_params.get('output', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return JsonResponse({'error': f"output must be one of {', '.join(EXPORT_FORMATS)}"},
+                                status=status.HTTP_400_BAD_REQUEST)
+        try:
+            filters = parse_export_filters(**{
+                key: request.query_params.get(key) for key in ['since', 'until', 'status', 'plan']
+            })
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(iter_export(export_format, export_invoices(**filters)),
+                                         content_type=EXPORT_FORMATS[export_format])
+        response['Content-Disposition'] = f'attachment; filename="invoices.{export_format}"'
+        return response
@@ -1,37 +1,46 @@
 from rest_framework import permissions, status
-from rest_framework_simplejwt import authentication
+from api.authentication import CachedJWTAuthentication
 from api.models import Invoice
 from rest_framework.views import APIView
 from django.http import JsonResponse
-from api.serializers import InvoiceSerializer
+from api.pagination import InvalidCursor, KeysetPaginator
+from api.replica import ReplicaReadMixin
+from api.serializers import InvoiceSerializer, invoice_fast_serializer
 
 
-class GetLatestInvoiceView(APIView):
+class GetLatestInvoiceView(ReplicaReadMixin, APIView):
     """
     View to get the latest invoice for the authenticated user.
     """
-    authentication_classes = [authentication.JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
         user = request.user
         try:
-            latest_invoice = Invoice.objects.filter(user=user).latest('issue_date')
+            latest_invoice = Invoice.objects.filter(user=user).select_related('subscription__plan').latest('issue_date')
             serializer = InvoiceSerializer(latest_invoice)
             return JsonResponse(serializer.data, status=status.HTTP_200_OK)
         except Invoice.DoesNotExist:
             return JsonResponse({'error': 'No invoices found'}, status=status.HTTP_404_NOT_FOUND)
 
 
-class InvoiceListView(APIView):
+class InvoiceListView(ReplicaReadMixin, APIView):
     """
-    View to list all invoices for the authenticated user.
+    View to list the invoices of the authenticated user, newest first.
+    Pages with `?page_size=` and `?cursor=`, the next page is linked in the `Link` header.
     """
-    authentication_classes = [authentication.JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
+    paginator = KeysetPaginator('issue_date')
 
     def get(self, request):
         user = request.user
-        invoices = Invoice.objects.filter(user=user)
-        serializer = InvoiceSerializer(invoices, many=True)
-        return JsonResponse(serializer.data, safe=False)
+        # values() rows with the nested subscription and plan, serialized without model instances
+        invoices = invoice_fast_serializer.get_queryset(Invoice.objects.filter(user=user))
+        try:
+            invoices, next_cursor = self.paginator.paginate(invoices, request)
+        except InvalidCursor as e:
+            return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        data = invoice_fast_serializer.serialize(invoices)
+        return JsonResponse(data, safe=False, headers=self.paginator.get_headers(request, next_cursor))
@@ -0,0 +1,36 @@
+from datetime import timedelta
+
+from django.http import JsonResponse
+from django.utils import timezone
+from rest_framework import permissions, status
+from rest_framework.views import APIView
+
+from api.authentication import CachedJWTAuthentication
+from api.exports import parse_export_filters
+from api.replica import ReplicaReadMixin
+from api.rollups import METRICS_MAX_DAYS, revenue_metrics
+
+
+class RevenueMetricsView(ReplicaReadMixin, APIView):
+    """
+    Staff only revenue of every plan per day, with the current MRR/ARR, read from the
+    daily rollups. Query: `?since=YYYY-MM-DD&until=YYYY-MM-DD&plan=<plan id>`, the last
+    30 days by default.
+    """
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        try:
+            filters = parse_export_filters(**{key: request.query_params.get(key) for key in ['since', 'until', 'plan']})
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        until = filters.get('until', timezone.localdate())
+        since = filters.get('since', until - timedelta(days=29))
+        if since > until:
+            return JsonResponse({'error': "since must not be after until"}, status=status.HTTP_400_BAD_REQUEST)
+        if (until - since).days >= METRICS_MAX_DAYS:
+            return JsonResponse({'error': f"The range can not be longer than {METRICS_MAX_DAYS} days"},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+        return JsonResponse(revenue_metrics(since, until, plan=filters.get('plan')))
@@ -1,18 +1,22 @@
-import hashlib
-import hmac
 import os
+import time
 
-import razorpay
+import requests
 from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
 from django.http import JsonResponse
 from django.shortcuts import render
 from django.utils import timezone
 from dotenv import load_dotenv
 from rest_framework import permissions, status
 from rest_framework.views import APIView
-from rest_framework_simplejwt.authentication import JWTAuthentication
 
+from api.authentication import CachedJWTAuthentication
+from api.gateway import gateway_timeout, get_razorpay_client
 from api.models import Invoice
+from api.rollups import record_invoices_paid
+from api.signatures import payment_signature, verify_payment_signature
 
 load_dotenv()
 
@@ -21,7 +25,7 @@ class PayInvoiceView(APIView):
     """
     View to handle invoice payment.
     """
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
@@ -42,56 +46,85 @@ class PayInvoiceView(APIView):
         # mark the invoice as paid
         invoice.status = 'paid'
         invoice.paid_at = timezone.now()
-        invoice.save()
+        with transaction.atomic():
+            # a concurrent payment of the same invoice updates nothing and is not counted twice
+            if Invoice.objects.filter(id=invoice.id).exclude(status='paid').update(status='paid', paid_at=invoice.paid_at):
+                record_invoices_paid([invoice])
 
         return JsonResponse({'message': 'Invoice paid successfully'}, status=status.HTTP_200_OK)
 
 
 class CreateRazorPayInvoiceOrderView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
         user = request.user
-        print(type(request.user))
+        invoice_id = request.POST.get('invoice_id')
+        # one checkout of an invoice creates its order, the others wait for it in the cache
+        # instead of a row lock, nothing is locked in the database during the gateway call
+        lock_key = f'api:order-lock:{invoice_id}'
+        deadline = time.monotonic() + settings.CHECKOUT_LOCK_WAIT
+        while True:
+            try:
+                invoice = Invoice.objects.get(id=invoice_id, user=user, status='unpaid')
+            except Invoice.DoesNotExist:
+                return JsonResponse({"error": "Invoice not found or already paid"}, status=400)
+
+            amount = int(invoice.amount * 100)  # amount in paise
+            if invoice.razorpay_order_id and invoice.razorpay_order_amount == amount:
+                return JsonResponse({'order_id': invoice.razorpay_order_id}, status=status.HTTP_200_OK)
+            if cache.add(lock_key, True, gateway_timeout()):
+                break
+            if time.monotonic() > deadline:
+                # the other checkout is still waiting for the gateway, do not hold a worker as long
+                response = JsonResponse({'error': 'Order is being created, try again'}, status=status.HTTP_409_CONFLICT)
+                response['Retry-After'] = '1'
+                return response
+            time.sleep(0.1)
         try:
-            invoice_id = request.POST.get('invoice_id')
-            invoice = Invoice.objects.get(id=invoice_id, user=user, status='unpaid')
-        except Invoice.DoesNotExist:
-            return JsonResponse({"error": "Invoice not found or already paid"}, status=400)
-
+            # the checkout that held the lock may have saved its order since the invoice was read
+            invoice.refresh_from_db(fields=['razorpay_order_id', 'razorpay_order_amount'])
+            if invoice.razorpay_order_id and invoice.razorpay_order_amount == amount:
+                return JsonResponse({'order_id': invoice.razorpay_order_id}, status=status.HTTP_200_OK)
+            return self.create_order(invoice, amount)
+        finally:
+            cache.delete(lock_key)
+
+    def create_order(self, invoice, amount):
         # create razorpay order
-        client = razorpay.client.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
+        client = get_razorpay_client()
 
         try:
             order_data = {
-                'amount': int(invoice.amount * 100),  # amount in paise
+                'amount': amount,
                 'currency': 'INR',
                 'receipt': str(invoice.id),
                 'payment_capture': 1  # auto capture
             }
             razorpay_order = client.order.create(data=order_data)
-            invoice.razorpay_order_id = razorpay_order['id']
-            invoice.save()
-            return JsonResponse({'order_id': razorpay_order['id']}, status=status.HTTP_201_CREATED)
-
+        except requests.exceptions.RequestException:
+            # timed out or unreachable after the retries
+            return JsonResponse({'error': 'Payment gateway unavailable'}, status=status.HTTP_502_BAD_GATEWAY)
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        # only saved when no other checkout stored an order since the invoice was read
+        saved = (Invoice.objects.filter(id=invoice.id, razorpay_order_id=invoice.razorpay_order_id)
+                 .update(razorpay_order_id=razorpay_order['id'], razorpay_order_amount=amount))
+        if not saved:
+            invoice.refresh_from_db(fields=['razorpay_order_id'])
+            return JsonResponse({'order_id': invoice.razorpay_order_id}, status=status.HTTP_200_OK)
+        return JsonResponse({'order_id': razorpay_order['id']}, status=status.HTTP_201_CREATED)
+
 
 class VerifyRazorPayPaymentView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def generate_razorpay_signature(self, order_id, payment_id):
         """Generates a Razorpay signature for payment verification."""
-
-        message = f"{order_id}|{payment_id}"
-        key = settings.RAZORPAY_KEY_SECRET.encode('utf-8')
-        message_encoded = message.encode('utf-8')
-
-        generated_signature = hmac.new(key, message_encoded, hashlib.sha256).hexdigest()
-        return generated_signature
+        return payment_signature(order_id, payment_id)
 
     # mocking razorpay payment ID for testing purposes
 
@@ -100,16 +133,7 @@ class VerifyRazorPayPaymentView(APIView):
         """
         Verify the Razorpay payment signature.
         """
-        client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
-        try:
-            client.utility.verify_payment_signature({
-                'razorpay_order_id': order_id,
-                'razorpay_payment_id': payment_id,
-                'razorpay_signature': signature,
-            })
-            return True
-        except razorpay.errors.SignatureVerificationError:
-            return False
+        return verify_payment_signature(order_id, payment_id, signature)
 
     def post(self, request):
         user = request.user
@@ -139,6 +163,8 @@ class VerifyRazorPayPaymentView(APIView):
 
         invoice.status = 'paid'
         invoice.paid_at = timezone.now()
-        invoice.save()
+        with transaction.atomic():
+            if Invoice.objects.filter(id=invoice.id).exclude(status='paid').update(status='paid', paid_at=invoice.paid_at):
+                record_invoices_paid([invoice])
 
         return JsonResponse({'message': 'Payment verified and invoice marked as paid'}, status=status.HTTP_200_OK)
@@ -1,29 +1,46 @@
 from dateutil.relativedelta import relativedelta
-from django.http import JsonResponse
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from rest_framework import permissions, status
 from rest_framework.views import APIView
-from rest_framework_simplejwt import authentication
 
+from api.authentication import CachedJWTAuthentication
+from api.catalog import get_plan_catalog
 from api.models import Invoice, Plan, Subscription
-from api.serializers import (InvoiceSerializer, PlanSerializer,
-                             SubscriptionSerializer)
+from api.pagination import InvalidCursor, KeysetPaginator
+from api.replica import ReplicaReadMixin
+from api.rollups import record_invoices_created, record_subscription_changes
+from api.serializers import (InvoiceSerializer, SubscriptionSerializer,
+                             subscription_fast_serializer)
 
 
 class PlanListView(APIView):
+    """
+    Public list of the active plans, served from the cache.
+    Sends ETag and Last-Modified, unchanged plans are answered with 304 without any database access.
+    """
+    authentication_classes = []
     permission_classes = [permissions.AllowAny]
 
     def get(self, request):
-        plans = Plan.objects.filter(is_active=True)
-        serializer = PlanSerializer(plans, many=True)
-        return JsonResponse(serializer.data, safe=False)
+        catalog = get_plan_catalog()
+        response = get_conditional_response(request, etag=catalog['etag'], last_modified=catalog['last_modified'])
+        if response is None:
+            response = HttpResponse(catalog['content'], content_type='application/json')
+        response['ETag'] = catalog['etag']
+        if catalog['last_modified']:
+            response['Last-Modified'] = http_date(catalog['last_modified'])
+        return response
 
 
 class SubscriptionView(APIView):
     """
     View to handle subscription creation.
     """
-    authentication_classes = [authentication.JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
@@ -33,34 +50,41 @@ class SubscriptionView(APIView):
             plan = Plan.objects.get(id=plan_id, is_active=True)
         except Plan.DoesNotExist:
             return JsonResponse({'error': 'Plan not found or inactive'}, status=status.HTTP_400_BAD_REQUEST)
-        # handle existing subscription
-        existing_subscription = Subscription.objects.filter(user=user, status='active').first()
-        if existing_subscription:
-            return JsonResponse({'error': f'You already have an active subscription for {existing_subscription.plan.name}.'}, status=400)
-
-        # create new subscription
+        # create new subscription and its first invoice, a second active subscription is refused by
+        # the unique_active_subscription constraint
         start_date = timezone.now()
         end_date = start_date + relativedelta(months=plan.duration)
-        subscription = Subscription.objects.create(
-            user=user,
-            plan=plan,
-            start_date=start_date,
-            end_date=end_date,
-            status='active'
-        )
-
-        # generate first invoice
-        Invoice.objects.create(
-            user=user,
-            subscription=subscription,
-            plan=plan,
-            amount=plan.price,
-            issue_date=start_date,
-            due_date=start_date + timezone.timedelta(days=5),  # due date is 5 days after issue date
-            billing_period_start=start_date.date(),
-            billing_period_end=end_date.date(),
-            status='unpaid'
-        )
+        try:
+            with transaction.atomic():
+                subscription = Subscription.objects.create(
+                    user=user,
+                    plan=plan,
+                    start_date=start_date,
+                    end_date=end_date,
+                    next_billing_date=end_date.date(),  # the first cycle is invoiced below
+                    status='active'
+                )
+
+                # generate first invoice
+                invoice = Invoice.objects.create(
+                    user=user,
+                    subscription=subscription,
+                    plan=plan,
+                    amount=plan.price,
+                    issue_date=start_date,
+                    due_date=start_date + timezone.timedelta(days=5),  # due date is 5 days after issue date
+                    billing_period_start=start_date.date(),
+                    billing_period_end=end_date.date(),
+                    status='unpaid'
+                )
+                record_invoices_created([invoice])
+                record_subscription_changes([plan.id], 1)
+        except IntegrityError:
+            # handle existing subscription
+            existing_subscription = Subscription.objects.filter(user=user, status='active').select_related('plan').first()
+            if existing_subscription is None:
+                raise
+            return JsonResponse({'error': f'You already have an active subscription for {existing_subscription.plan.name}.'}, status=400)
 
         serializer = SubscriptionSerializer(subscription)
         return JsonResponse(serializer.data, status=201)
@@ -70,7 +94,7 @@ class UnSubscriptionView(APIView):
     """
     View to handle subscription cancellation.
     """
-    authentication_classes = [authentication.JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
@@ -83,22 +107,34 @@ class UnSubscriptionView(APIView):
         except Subscription.DoesNotExist:
             return JsonResponse({'error': 'Subscription not found or inactive'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # cancel the subscription
-        subscription.status = 'cancelled'  # not expired because it can be reactivated
-        subscription.save()
+        # cancel the subscription, not expired because it can be reactivated
+        with transaction.atomic():
+            # only while still active, mark_overdue_invoices may have cancelled it meanwhile
+            cancelled = (Subscription.objects.filter(id=subscription.id, user=user, status='active')
+                         .update(status='cancelled'))
+            if cancelled == 1:
+                record_subscription_changes([subscription.plan_id], -1)
+        if not cancelled:
+            return JsonResponse({'error': 'Subscription not found or inactive'}, status=status.HTTP_400_BAD_REQUEST)
 
         return JsonResponse({'message': 'Subscription cancelled successfully'}, status=status.HTTP_200_OK)
 
 
-class SubscriptionListView(APIView):
+class SubscriptionListView(ReplicaReadMixin, APIView):
     """
-    View to list all subscriptions for the authenticated user.
+    View to list the subscriptions of the authenticated user, newest first.
+    Pages with `?page_size=` and `?cursor=`, the next page is linked in the `Link` header.
     """
-    authentication_classes = [authentication.JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
+    paginator = KeysetPaginator('start_date')
 
     def get(self, request):
         user = request.user
-        subscriptions = Subscription.objects.filter(user=user)
-        serializer = SubscriptionSerializer(subscriptions, many=True)
-        return JsonResponse(serializer.data, safe=False)
+        subscriptions = subscription_fast_serializer.get_queryset(Subscription.objects.filter(user=user))
+        try:
+            subscriptions, next_cursor = self.paginator.paginate(subscriptions, request)
+        except InvalidCursor as e:
+            return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        data = subscription_fast_serializer.serialize(subscriptions)
+        return JsonResponse(data, safe=False, headers=self.paginator.get_headers(request, next_cursor))
@@ -0,0 +1,33 @@
+import json
+
+from django.http import JsonResponse
+from rest_framework import permissions, status
+from rest_framework.views import APIView
+
+from api.signatures import verify_webhook_signature
+from api.webhooks import record_webhook_event
+
+
+class RazorpayWebhookView(APIView):
+    """
+    Receives the Razorpay webhooks. The event is only verified and stored in the inbox,
+    the `process_webhook_events` task applies it, so the response does not wait for invoice processing.
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request):
+        body = request.body
+        if not verify_webhook_signature(body, request.headers.get('X-Razorpay-Signature')):
+            return JsonResponse({'error': 'Invalid signature'}, status=status.HTTP_400_BAD_REQUEST)
+
+        event_id = request.headers.get('X-Razorpay-Event-Id')
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            payload = None
+        if not event_id or not isinstance(payload, dict):
+            return JsonResponse({'error': 'Invalid event'}, status=status.HTTP_400_BAD_REQUEST)
+
+        record_webhook_event(event_id, payload)
+        return JsonResponse({'status': 'ok'}, status=status.HTTP_200_OK)
@@ -0,0 +1,74 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Invoice, WebhookEvent
+from .rollups import record_invoices_paid
+
+# events that confirm the payment of an order
+PAID_EVENTS = {'payment.captured', 'order.paid'}
+
+
+def record_webhook_event(event_id, payload):
+    """Store a webhook in the inbox with a single insert, a retried delivery of the same event is ignored."""
+    WebhookEvent.objects.bulk_create(
+        [WebhookEvent(event_id=event_id, event=payload.get('event', ''), payload=payload)],
+        ignore_conflicts=True,
+    )
+
+
+def paid_order(payload):
+    """Return (order id, payment time) of a payment event, None when it does not carry an order."""
+    payment = payload.get('payload', {}).get('payment', {}).get('entity', {})
+    if not payment.get('order_id'):
+        return None
+    created_at = payload.get('created_at')
+    paid_at = datetime.fromtimestamp(created_at, tz=dt_timezone.utc) if created_at else timezone.now()
+    return payment['order_id'], paid_at
+
+
+def apply_webhook_events(batch_size=None):
+    """
+    Drain the webhook inbox in batches of `batch_size` events, oldest first, and mark
+    the invoices of paid orders as paid with one bulk update per batch. Events are
+    locked with SKIP LOCKED so several workers can drain the inbox together.
+    """
+    batch_size = batch_size or settings.INVOICE_BATCH_SIZE
+    processed = paid = 0
+    while True:
+        with transaction.atomic():
+            events = list(
+                WebhookEvent.objects.filter(processed_at__isnull=True)
+                .order_by('received_at')
+                .select_for_update(skip_locked=True)
+                .values_list('id', 'event', 'payload')[:batch_size]
+            )
+            if not events:
+                break
+
+            paid_orders = {}
+            for _, event, payload in events:
+                if event in PAID_EVENTS and (order := paid_order(payload)):
+                    order_id, paid_at = order
+                    paid_orders[order_id] = min(paid_at, paid_orders.get(order_id, paid_at))
+
+            invoices = list(
+                Invoice.objects.filter(razorpay_order_id__in=paid_orders).exclude(status='paid')
+                .select_for_update().only('id', 'razorpay_order_id', 'plan_id', 'amount', 'issue_date')
+            )
+            for invoice in invoices:
+                invoice.status = 'paid'
+                invoice.paid_at = paid_orders[invoice.razorpay_order_id]
+            Invoice.objects.bulk_update(invoices, ['status', 'paid_at'], batch_size=batch_size)
+            record_invoices_paid(invoices)
+
+            WebhookEvent.objects.filter(id__in=[event_id for event_id, _, _ in events]).update(
+                processed_at=timezone.now())
+
+        processed += len(events)
+        paid += len(invoices)
+        if len(events) < batch_size:
+            break
+    return {'processed': processed, 'paid': paid}
@@ -30,4 +30,20 @@ app.conf.beat_schedule = {
         "schedule": crontab(hour=9, minute=0),  # Run daily at 09:00
         "schedule": crontab(minute='*/1'),
     },
+    "process-webhook-events": {
+        "task": "api.tasks.process_webhook_events",
+        "schedule": crontab(minute='*/1'),
+    },
+    "reconcile-payments": {
+        "task": "api.tasks.reconcile_payments",
+        "schedule": crontab(minute='*/5'),
+    },
+    "fold-revenue-rollups": {
+        "task": "api.tasks.fold_revenue_rollups",
+        "schedule": crontab(minute='*/1'),
+    },
+    "archive-old-invoices": {
+        "task": "api.tasks.archive_old_invoices",
+        "schedule": crontab(hour=2, minute=30),
+    },
 }
@@ -12,7 +12,9 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 from datetime import timedelta
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
+import importlib.util
 import os
 
 load_dotenv()
@@ -65,9 +67,17 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
     ),
 }
+# seconds an authenticated user is cached instead of loaded on every request, 0 disables the cache.
+# Without the shared cache, other processes keep a deactivated user for up to this long
+AUTH_USER_CACHE_TIMEOUT = int(os.getenv("AUTH_USER_CACHE_TIMEOUT", 5))
+# also cache the users in CACHES, so every process skips the query and sees invalidations at once
+AUTH_USER_SHARED_CACHE = os.getenv("AUTH_USER_SHARED_CACHE", "False") == "True"
+# rows per page of the invoice and subscription lists, clients can ask for up to API_MAX_PAGE_SIZE
+API_PAGE_SIZE = int(os.getenv("API_PAGE_SIZE", 50))
+API_MAX_PAGE_SIZE = int(os.getenv("API_MAX_PAGE_SIZE", 500))
 
 ROOT_URLCONF = 'billing_service.urls'
 
@@ -107,8 +117,33 @@ DATABASES = {
         'PASSWORD': os.getenv("POSTGRES_PASSWORD"),
         'HOST': os.getenv("POSTGRES_HOST"),
         'PORT': os.getenv("POSTGRES_PORT"),
+        # seconds a connection is kept open and reused by the following requests and tasks, 0 closes it every time
+        'CONN_MAX_AGE': int(os.getenv("DB_CONN_MAX_AGE", 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
+# a pool of DB_POOL_MAX_SIZE connections per process instead of persistent connections, needs psycopg 3 with
+# psycopg-pool (pip install "psycopg[binary,pool]"), requirements.txt installs psycopg2
+if os.getenv("DB_POOL_MAX_SIZE"):
+    if not (importlib.util.find_spec("psycopg") and importlib.util.find_spec("psycopg_pool")):
+        raise ImproperlyConfigured('DB_POOL_MAX_SIZE needs psycopg 3 with the pool, pip install "psycopg[binary,pool]"')
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {'pool': {
+        'min_size': int(os.getenv("DB_POOL_MIN_SIZE", 2)),
+        'max_size': int(os.getenv("DB_POOL_MAX_SIZE")),
+        'timeout': float(os.getenv("DB_POOL_TIMEOUT", 10)),
+    }}
+# optional streaming replica serving the read only views and reports, same database and credentials
+if os.getenv("POSTGRES_REPLICA_HOST"):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.getenv("POSTGRES_REPLICA_HOST"),
+        'PORT': os.getenv("POSTGRES_REPLICA_PORT", DATABASES['default']['PORT']),
+        # tests run against the primary only
+        'TEST': {'MIRROR': 'default'},
+    }
+READ_REPLICA_ALIAS = 'replica' if 'replica' in DATABASES else None
+DATABASE_ROUTERS = ['api.replica.ReplicaRouter']
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -167,9 +202,37 @@ ACCOUNT_UNIQUE_EMAIL = True  # while creating user, email should be unique
 ACCOUNT_EMAIL_REQUIRED = True  # email is required for user creation
 AUTH_USER_MODEL = 'api.MyUser'  # using custom user model inside api app
 
+# local memory by default, every process has its own copy and only sees its own invalidations,
+# use e.g. CACHE_BACKEND=django.core.cache.backends.redis.RedisCache and CACHE_LOCATION=redis://... to share it
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        'LOCATION': os.getenv("CACHE_LOCATION", ""),
+    }
+}
+# seconds the plan catalog is cached, it is also invalidated whenever a plan changes.
+# Invalidations only reach the other processes through a shared CACHE_BACKEND, raise it only with one
+PLAN_CATALOG_CACHE_TIMEOUT = int(os.getenv("PLAN_CATALOG_CACHE_TIMEOUT", 5))
+
 
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
+# needed to gather the results of the sharded billing run
+CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND")
+
+# number of subscriptions read and invoices written per batch by the billing tasks
+INVOICE_BATCH_SIZE = int(os.getenv("INVOICE_BATCH_SIZE", 1000))
+# number of tasks generate_daily_invoice_sharded splits the subscriptions into
+INVOICE_SHARDS = int(os.getenv("INVOICE_SHARDS", 8))
+# number of invoices read from the database cursor and encoded at once by the invoice export
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 2000))
+# paid invoices issued more than INVOICE_ARCHIVE_AFTER_MONTHS months ago are moved to the partitioned archive,
+# archive partitions older than INVOICE_ARCHIVE_RETENTION_MONTHS are exported to INVOICE_ARCHIVE_DIR and dropped
+INVOICE_ARCHIVE_AFTER_MONTHS = int(os.getenv("INVOICE_ARCHIVE_AFTER_MONTHS", 24))
+INVOICE_ARCHIVE_RETENTION_MONTHS = int(os.getenv("INVOICE_ARCHIVE_RETENTION_MONTHS", 84))
+INVOICE_ARCHIVE_DIR = os.getenv("INVOICE_ARCHIVE_DIR", str(BASE_DIR / 'archive'))
+# monthly archive partitions created ahead of the archival
+INVOICE_ARCHIVE_PARTITIONS_AHEAD = int(os.getenv("INVOICE_ARCHIVE_PARTITIONS_AHEAD", 3))
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
@@ -178,7 +241,30 @@ EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
 EMAIL_PORT = os.getenv("EMAIL_PORT", 587)
 EMAIL_USE_TLS = True
 DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL")
+# number of reminder emails sent over one SMTP connection
+MAIL_BATCH_SIZE = int(os.getenv("MAIL_BATCH_SIZE", 100))
+# days after the due date at which overdue reminders are sent, one escalation step per entry
+REMINDER_SCHEDULE_DAYS = [int(days) for days in os.getenv("REMINDER_SCHEDULE_DAYS", "0,2,5").split(",")]
 
 
 RAZORPAY_KEY_ID = os.getenv('RAZORPAY_KEY_ID')
 RAZORPAY_KEY_SECRET = os.getenv('RAZORPAY_KEY_SECRET')
+# secret of the Razorpay webhooks, set in the Razorpay dashboard
+RAZORPAY_WEBHOOK_SECRET = os.getenv('RAZORPAY_WEBHOOK_SECRET')
+# set to a local stub gateway, e.g. http://localhost:8001, to test without Razorpay
+RAZORPAY_BASE_URL = os.getenv('RAZORPAY_BASE_URL', 'https://api.razorpay.com')
+# seconds to connect to and to wait for a response from the gateway
+RAZORPAY_CONNECT_TIMEOUT = float(os.getenv('RAZORPAY_CONNECT_TIMEOUT', 3.05))
+RAZORPAY_READ_TIMEOUT = float(os.getenv('RAZORPAY_READ_TIMEOUT', 10))
+# retries on connection errors and, for idempotent requests, on 502/503/504 responses
+RAZORPAY_MAX_RETRIES = int(os.getenv('RAZORPAY_MAX_RETRIES', 2))
+# seconds a checkout waits for a concurrent checkout of the same invoice to create its order,
+# after that it answers 409 and the client retries
+CHECKOUT_LOCK_WAIT = float(os.getenv('CHECKOUT_LOCK_WAIT', 2))
+# keep-alive connections kept open to the gateway per process
+RAZORPAY_POOL_SIZE = int(os.getenv('RAZORPAY_POOL_SIZE', 10))
+# invoices read per page, orders checked on the gateway at once and seconds per run of reconcile_payments,
+# keep RECONCILE_CONCURRENCY at most RAZORPAY_POOL_SIZE and RECONCILE_TIME_LIMIT below the beat interval
+RECONCILE_PAGE_SIZE = int(os.getenv('RECONCILE_PAGE_SIZE', 500))
+RECONCILE_CONCURRENCY = int(os.getenv('RECONCILE_CONCURRENCY', 10))
+RECONCILE_TIME_LIMIT = int(os.getenv('RECONCILE_TIME_LIMIT', 240))